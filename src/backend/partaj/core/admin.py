@@ -14,14 +14,15 @@ class TopicAdmin(admin.ModelAdmin):
     """
 
     # Display fields automatically created and updated by Django (as readonly)
-    readonly_fields = ["id", "created_at"]
+    readonly_fields = ["id", "created_at", "referral_count", "open_referral_count"]
 
     # Organize data on the admin page
     fieldsets = (
         (_("Topic information"), {"fields": ["id", "created_at", "name", "unit"]}),
+        (_("Counters"), {"fields": ["referral_count", "open_referral_count"]}),
     )
     # Help users navigate topics more easily in the list view
-    list_display = ("name", "get_unit_name")
+    list_display = ("name", "get_unit_name", "open_referral_count", "referral_count")
 
     # Add easy filters on our most relevant fields for filtering
     list_filter = ("unit",)
@@ -83,16 +84,26 @@ class ReferralAttachmentAdmin(admin.ModelAdmin):
     """
 
     # Display fields automatically created and updated by Django (as readonly)
-    readonly_fields = ["id", "created_at", "size"]
+    readonly_fields = [
+        "id",
+        "created_at",
+        "size",
+        "blob",
+        "preview_state",
+        "preview",
+        "page_count",
+        "text",
+    ]
 
     # Organize data on the admin page
     fieldsets = (
         (_("Metadata"), {"fields": ["id", "created_at", "referral"]}),
-        (_("Document"), {"fields": ["name", "file", "size"]}),
+        (_("Document"), {"fields": ["name", "file", "size", "blob"]}),
+        (_("Preview"), {"fields": ["preview_state", "preview", "page_count", "text"]},),
     )
 
     # Help users navigate referral attachments more easily in the list view
-    list_display = ("name", "get_referral_id", "created_at")
+    list_display = ("name", "get_referral_id", "created_at", "preview_state")
 
     # By default, show newest referrals first
     ordering = ("-created_at",)
@@ -113,16 +124,26 @@ class ReferralAnswerAttachmentAdmin(admin.ModelAdmin):
     """
 
     # Display fields automatically created and updated by Django (as readonly)
-    readonly_fields = ["id", "created_at", "size"]
+    readonly_fields = [
+        "id",
+        "created_at",
+        "size",
+        "blob",
+        "preview_state",
+        "preview",
+        "page_count",
+        "text",
+    ]
 
     # Organize data on the admin page
     fieldsets = (
         (_("Metadata"), {"fields": ["id", "created_at", "referral_answer"]}),
-        (_("Document"), {"fields": ["name", "file", "size"]}),
+        (_("Document"), {"fields": ["name", "file", "size", "blob"]}),
+        (_("Preview"), {"fields": ["preview_state", "preview", "page_count", "text"]},),
     )
 
     # Help users navigate referral answer attachments more easily in the list view
-    list_display = ("name", "get_referral_answer_id", "created_at")
+    list_display = ("name", "get_referral_answer_id", "created_at", "preview_state")
 
     # By default, show newest referrals first
     ordering = ("-created_at",)
@@ -144,6 +165,8 @@ class ReferralAttachmentInline(admin.TabularInline):
 
     model = models.ReferralAttachment
 
+    # Leave out the information extracted in the background
+    fields = ["name", "file", "size"]
     readonly_fields = ["size"]
 
 
@@ -154,6 +177,8 @@ class ReferralAnswerAttachmentInline(admin.TabularInline):
 
     model = models.ReferralAnswerAttachment
 
+    # Leave out the information extracted in the background
+    fields = ["name", "file", "size"]
     readonly_fields = ["size"]
 
 
@@ -327,3 +352,55 @@ class ReferralAnswerAdmin(admin.ModelAdmin):
         return referral_answer_attachment.referral.id
 
     get_referral_id.short_description = _("referral")
+
+
+@admin.register(models.AttachmentBlob)
+class AttachmentBlobAdmin(admin.ModelAdmin):
+    """
+    Admin setup for attachment blobs.
+    """
+
+    # Blobs are managed along with the attachments that use them
+    readonly_fields = [
+        "sha256",
+        "created_at",
+        "updated_at",
+        "file",
+        "size",
+        "reference_count",
+    ]
+
+    # Help admins see how contents are shared in the list view
+    list_display = ("sha256", "size", "reference_count", "updated_at")
+
+    # By default, show the most shared contents first
+    ordering = ("-reference_count",)
+
+
+@admin.register(models.OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    """
+    Admin setup for outgoing emails.
+    """
+
+    # Display fields automatically created and updated by Django (as readonly)
+    readonly_fields = ["id", "created_at", "updated_at", "sent_at"]
+
+    # Organize data on the admin page
+    fieldsets = (
+        (_("Identification"), {"fields": ["id", "created_at", "updated_at"]}),
+        (
+            _("Delivery"),
+            {"fields": ["state", "attempts", "send_after", "sent_at", "last_error"]},
+        ),
+        (_("Outgoing email"), {"fields": ["payload"]}),
+    )
+
+    # Help admins monitor the outbox in the list view
+    list_display = ("id", "state", "attempts", "send_after", "sent_at")
+
+    # Add easy filters on our most relevant fields for filtering
+    list_filter = ("state",)
+
+    # By default, show the oldest emails first, as they are the next ones to be sent
+    ordering = ("send_after",)
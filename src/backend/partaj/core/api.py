@@ -1,11 +1,28 @@
+from collections import defaultdict
+import hashlib
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Prefetch, Q, prefetch_related_objects
+from django.utils.cache import get_conditional_response, patch_cache_control
 
 from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
 from rest_framework.permissions import BasePermission, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
+from .cursors import decode_cursor, encode_cursor, get_cursor_filter
 from .forms import ReferralForm
+from .memberships import get_user_unit_roles
+from .reference_data import TOPICS, URGENCIES, get_reference_data_version
+from .search import is_search_enabled, search_referrals
+from .uploads import direct_uploads_enabled, get_upload_target, get_uploaded_attachments
 from . import models, serializers
 
 
@@ -30,7 +47,7 @@ class UserIsReferralUnitMember(BasePermission):
 
     def has_permission(self, request, view):
         referral = view.get_object()
-        return request.user in referral.topic.unit.members.all()
+        return str(referral.topic.unit_id) in get_user_unit_roles(request.user)
 
 
 class UserIsReferralUnitOrganizer(BasePermission):
@@ -41,7 +58,10 @@ class UserIsReferralUnitOrganizer(BasePermission):
 
     def has_permission(self, request, view):
         referral = view.get_object()
-        return request.user in referral.topic.unit.get_organizers()
+        return get_user_unit_roles(request.user).get(str(referral.topic.unit_id)) in [
+            models.UnitMembershipRole.ADMIN,
+            models.UnitMembershipRole.OWNER,
+        ]
 
 
 class UserIsReferralRequester(BasePermission):
@@ -52,7 +72,177 @@ class UserIsReferralRequester(BasePermission):
 
     def has_permission(self, request, view):
         referral = view.get_object()
-        return request.user == referral.user
+        return request.user.id == referral.user_id
+
+
+def get_referral_prefetch_lookups(request=None):
+    """
+    Build the list of lookups necessary to serialize referrals with the `ReferralSerializer`
+    without issuing any query per nested object. When the request asks for sparse fieldsets,
+    relations that are not rendered are skipped and collapsed ones are only loaded as ids.
+    Returns fresh Prefetch instances on each call as they carry their own querysets.
+    """
+
+    def is_rendered(name):
+        return serializers.is_field_rendered(request, name)
+
+    def is_expanded(name):
+        return serializers.is_field_expanded(request, name)
+
+    User = get_user_model()
+    lookups = []
+    if is_expanded("activity"):
+        lookups.append(
+            Prefetch(
+                "activity",
+                queryset=models.ReferralActivity.objects.select_related(
+                    "actor", "item_content_type"
+                ),
+            )
+        )
+    elif is_rendered("activity"):
+        lookups.append("activity")
+    if is_expanded("answers"):
+        lookups.append("answers__attachments")
+    elif is_rendered("answers"):
+        lookups.append("answers")
+    if is_rendered("assignees"):
+        lookups.append("assignees")
+    if is_rendered("attachments"):
+        lookups.append("attachments")
+    if is_expanded("topic"):
+        lookups.append(
+            Prefetch(
+                "topic__unit__members",
+                queryset=User.objects.prefetch_related("unitmembership_set"),
+            )
+        )
+
+    return lookups
+
+
+def prefetch_activity_items(activities):
+    """
+    Resolve the generic `item_content_object` of a list of referral activities in bulk.
+    Django's generic foreign key issues one query per activity when it is accessed: instead, we
+    group activities by item content type, fetch all items of each type in one query (along
+    with the attachments of answers, which are serialized with them) and put each item in the
+    generic foreign key cache of its activity.
+    """
+    item_ids = defaultdict(set)
+    for activity in activities:
+        if activity.item_content_type_id is not None:
+            item_ids[activity.item_content_type_id].add(activity.item_object_id)
+
+    items = {}
+    for content_type_id, object_ids in item_ids.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        queryset = model.objects.filter(pk__in=object_ids)
+        if model is models.ReferralAnswer:
+            queryset = queryset.prefetch_related("attachments")
+        for item in queryset:
+            items[(content_type_id, str(item.pk))] = item
+
+    for activity in activities:
+        item = items.get((activity.item_content_type_id, activity.item_object_id))
+        if item is not None:
+            models.ReferralActivity.item_content_object.set_cached_value(activity, item)
+
+    return activities
+
+
+class ReferralCursorPagination(CursorPagination):
+    """
+    Keyset pagination for referrals on (created_at, id). The position of a page in its cursor
+    is the creation date and id of the referral it starts after, and pages are fetched by
+    filtering on the pair instead of using an offset, so fetching any page costs the same as
+    fetching the first one and no referral is skipped or repeated when several share the same
+    creation date. As positions are unique, cursors never need DRF's offsets.
+    """
+
+    max_page_size = 100
+    ordering = ("-created_at", "-id")
+    page_size_query_param = "limit"
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Let clients list referrals from the oldest to the most recent. We only support sorting
+        on the creation date as it is the key our pagination relies upon.
+        """
+        if request.query_params.get("ordering") == "created_at":
+            return ("created_at", "id")
+        return self.ordering
+
+    def decode_cursor(self, request):
+        """
+        Check the position in the cursor is a referral creation date and id, and ignore offsets.
+        """
+        cursor = super().decode_cursor(request)
+        if cursor is None:
+            return None
+        if cursor.position is not None and decode_cursor(cursor.position) is None:
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(offset=0, reverse=cursor.reverse, position=cursor.position)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Fetch the page of referrals after the position of the cursor, or before it for cursors
+        pointing to previous pages, and remember the positions around it to build the links.
+        """
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        current_position = self.cursor.position if self.cursor else None
+
+        # Cursors pointing to previous pages read the list backwards from their position
+        descending = self.ordering[0].startswith("-") != reverse
+        queryset = queryset.order_by(
+            *(f"-{field}" if descending else field for field in ("created_at", "id"))
+        )
+        if current_position is not None:
+            queryset = queryset.filter(
+                get_cursor_filter(decode_cursor(current_position), descending)
+            )
+
+        # Fetch one more referral to know whether there is a page following this one
+        results = list(queryset[: self.page_size + 1])
+        self.page = results[: self.page_size]
+        has_following_position = len(results) > self.page_size
+        following_position = (
+            self._get_position_from_instance(results[-1], self.ordering)
+            if has_following_position
+            else None
+        )
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None
+            self.has_previous = has_following_position
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = current_position is not None
+            self.next_position = following_position
+            self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def _get_position_from_instance(self, instance, ordering):
+        """
+        Use the creation date and id of referrals as their position.
+        """
+        if isinstance(instance, dict):
+            return encode_cursor(instance["created_at"], instance["id"])
+        return encode_cursor(instance.created_at, instance.id)
 
 
 class ReferralViewSet(viewsets.ModelViewSet):
@@ -60,17 +250,97 @@ class ReferralViewSet(viewsets.ModelViewSet):
     API endpoints for referrals and their nested related objects.
     """
 
+    pagination_class = ReferralCursorPagination
     permission_classes = [NotAllowed]
     queryset = models.Referral.objects.all().order_by("-created_at")
     serializer_class = serializers.ReferralSerializer
 
+    def get_queryset(self):
+        """
+        Join in the single-valued relations every action needs. Multi-valued relations are
+        left out here: they are only needed for serialization and are prefetched on demand
+        with `prefetch_for_serialization`, so permission checks do not pay for them.
+        """
+        queryset = self.queryset.select_related("topic__unit", "urgency_level", "user")
+
+        if self.action in ["list", "search"]:
+            queryset = self.filter_list_queryset(queryset)
+
+        return queryset
+
+    def filter_list_queryset(self, queryset):
+        """
+        Scope the list of referrals to those the current user created and those linked to the
+        units they are a member of, then apply the filters passed as query parameters.
+        All filters are expressed as subqueries on indexed foreign keys so we never need joins
+        that could duplicate rows.
+        """
+        user = self.request.user
+        queryset = queryset.filter(
+            Q(user=user)
+            | Q(topic__in=models.Topic.objects.filter(unit__members=user).values("id"))
+        )
+
+        params = serializers.ReferralListQuerySerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        filters = params.validated_data
+
+        if filters.get("assignee"):
+            queryset = queryset.filter(
+                id__in=models.ReferralAssignment.objects.filter(
+                    assignee__in=filters["assignee"]
+                ).values("referral")
+            )
+        if filters.get("state"):
+            queryset = queryset.filter(state__in=filters["state"])
+        if filters.get("topic"):
+            queryset = queryset.filter(topic__in=filters["topic"])
+        if filters.get("unit"):
+            queryset = queryset.filter(
+                topic__in=models.Topic.objects.filter(unit__in=filters["unit"]).values(
+                    "id"
+                )
+            )
+        if filters.get("urgency"):
+            queryset = queryset.filter(urgency_level__in=filters["urgency"])
+
+        return queryset
+
+    def get_object(self):
+        """
+        Memoize the referral for the duration of the request: permission classes, which are
+        composed on most actions, and the actions themselves all need it.
+        """
+        if not hasattr(self, "_referral"):
+            self._referral = super().get_object()
+        return self._referral
+
+    @staticmethod
+    def prefetch_for_serialization(referrals, request=None):
+        """
+        Load all the nested objects rendered by the `ReferralSerializer` in a constant number
+        of queries. This runs on already fetched referrals so it is also safe to use after a
+        transition has modified their related objects.
+        Pass the request to only load what its sparse fieldsets require.
+        """
+        prefetch_related_objects(referrals, *get_referral_prefetch_lookups(request))
+        if serializers.is_field_expanded(request, "activity"):
+            prefetch_activity_items(
+                [
+                    activity
+                    for referral in referrals
+                    for activity in referral.activity.all()
+                ]
+            )
+        return referrals
+
     def get_permissions(self):
         """
-        Manage permissions for "list" and "retrieve" separately without overriding and duplicating
-        too much logic from ModelViewSet.
+        Manage permissions for "create", "list" and "retrieve" separately without overriding and
+        duplicating too much logic from ModelViewSet.
         For all other actions, delegate to the permissions as defined on the @action decorator.
         """
-        if self.action == "create":
+        if self.action in ["create", "list", "search", "upload_targets"]:
             permission_classes = [IsAuthenticated]
         elif self.action == "retrieve":
             permission_classes = [
@@ -116,25 +386,42 @@ class ReferralViewSet(viewsets.ModelViewSet):
                     },
                 )
 
-            # Create the referral from existing data
-            referral = form.save()
-
-            # Add in the urgency level we found
-            referral.urgency_level = referral_urgency
-            referral.save()
-
-            # Create Attachment instances for the related files
-            files = request.FILES.getlist("files")
-            for file in files:
-                referral_attachment = models.ReferralAttachment(
-                    file=file, referral=referral
+            # Files uploaded directly to the object storage are sent as upload tokens
+            try:
+                uploaded_attachments = get_uploaded_attachments(
+                    models.ReferralAttachment,
+                    request.POST.getlist("uploads"),
+                    request.user,
+                )
+            except ValidationError as error:
+                return Response(status=400, data={"uploads": error.messages})
+
+            # Save the referral and queue its emails together: emails are only sent once the
+            # changes they notify about are committed
+            with transaction.atomic():
+                # Create the referral from existing data
+                referral = form.save()
+
+                # Add in the urgency level we found
+                referral.urgency_level = referral_urgency
+                referral.save()
+
+                # Create Attachment instances for the related files
+                for attachment in uploaded_attachments:
+                    attachment.referral = referral
+                models.save_attachments(
+                    [
+                        models.ReferralAttachment(file=file, referral=referral)
+                        for file in request.FILES.getlist("files")
+                    ]
+                    + uploaded_attachments
                 )
-                referral_attachment.save()
 
-            referral.refresh_from_db()
-            referral.send()
+                referral.refresh_from_db()
+                referral.send()
 
             # Redirect the user to the "single referral" view
+            self.prefetch_for_serialization([referral])
             return Response(
                 status=201, data=serializers.ReferralSerializer(referral).data
             )
@@ -142,6 +429,84 @@ class ReferralViewSet(viewsets.ModelViewSet):
         else:
             return Response(status=400, data=form.errors)
 
+    def list(self, request, *args, **kwargs):
+        """
+        List referrals the current user has access to, one page at a time, with the compact
+        `ReferralSummarySerializer`.
+        Users only get the referrals they created and those linked to their units. Lists can
+        be filtered by assignee, state, topic, unit and urgency.
+        """
+        page = self.paginate_queryset(self.get_queryset())
+        prefetch_related_objects(page, "assignees")
+        return self.get_paginated_response(
+            serializers.ReferralSummarySerializer(
+                page, many=True, context={"request": request}
+            ).data
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Get one referral along with all its nested objects, or only the ones requested with
+        sparse fieldsets.
+        """
+        referral = self.get_object()
+        self.prefetch_for_serialization([referral], request)
+        return Response(
+            data=serializers.ReferralSerializer(
+                referral, context={"request": request}
+            ).data
+        )
+
+    @action(detail=False)
+    def search(self, request):
+        """
+        Search the referrals the current user has access to for the text in the `q` query
+        parameter, with the same filters as the list. Return the `limit` most relevant
+        referrals with the compact serializer, their rank and a headline of their matching
+        texts. Results are not paginated: clients refine the search instead.
+        """
+        if not is_search_enabled():
+            return Response(status=404)
+
+        params = serializers.ReferralSearchQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        referrals = list(
+            search_referrals(self.get_queryset(), params.validated_data["q"])[
+                : params.validated_data["limit"]
+            ]
+        )
+        prefetch_related_objects(referrals, "assignees")
+        return Response(
+            data={
+                "results": serializers.ReferralSearchResultSerializer(
+                    referrals, many=True, context={"request": request}
+                ).data
+            }
+        )
+
+    @action(detail=False, methods=["post"], url_path="upload-targets")
+    def upload_targets(self, request):
+        """
+        Get targets to upload files directly to the object storage, for a list of file names.
+        The upload tokens they include can then be sent instead of the files when creating or
+        answering a referral.
+        """
+        if not direct_uploads_enabled():
+            return Response(status=404)
+
+        names = request.data.get("names")
+        if not isinstance(names, list) or not all(
+            isinstance(name, str) and name for name in names
+        ):
+            return Response(
+                status=400, data={"names": ["A list of file names is required."]}
+            )
+
+        return Response(
+            status=201, data=[get_upload_target(name, request.user) for name in names],
+        )
+
     @action(
         detail=True,
         methods=["post"],
@@ -153,13 +518,25 @@ class ReferralViewSet(viewsets.ModelViewSet):
         """
         # Get the referral and call the answer transition
         referral = self.get_object()
-        referral.answer(
-            attachments=request.data.getlist("files"),
-            content=request.data["content"],
-            created_by=request.user,
-        )
-        referral.save()
+        try:
+            uploaded_attachments = get_uploaded_attachments(
+                models.ReferralAnswerAttachment,
+                request.data.getlist("uploads"),
+                request.user,
+            )
+        except ValidationError as error:
+            return Response(status=400, data={"uploads": error.messages})
+
+        with transaction.atomic():
+            referral.answer(
+                attachments=request.data.getlist("files"),
+                content=request.data["content"],
+                created_by=request.user,
+                uploaded_attachments=uploaded_attachments,
+            )
+            referral.save()
 
+        self.prefetch_for_serialization([referral])
         return Response(data=serializers.ReferralSerializer(referral).data)
 
     @action(
@@ -176,9 +553,11 @@ class ReferralViewSet(viewsets.ModelViewSet):
         assignee = User.objects.get(id=request.data["assignee_id"])
         # Get the referral itself and call the assign transition
         referral = self.get_object()
-        referral.assign(assignee=assignee, created_by=request.user)
-        referral.save()
+        with transaction.atomic():
+            referral.assign(assignee=assignee, created_by=request.user)
+            referral.save()
 
+        self.prefetch_for_serialization([referral])
         return Response(data=serializers.ReferralSerializer(referral).data)
 
     @action(
@@ -195,26 +574,74 @@ class ReferralViewSet(viewsets.ModelViewSet):
         assignee = User.objects.get(id=request.data["assignee_id"])
         # Get the referral itself and call the unassign transition
         referral = self.get_object()
-        referral.unassign(assignee=assignee, created_by=request.user)
-        referral.save()
+        with transaction.atomic():
+            referral.unassign(assignee=assignee, created_by=request.user)
+            referral.save()
 
+        self.prefetch_for_serialization([referral])
         return Response(data=serializers.ReferralSerializer(referral).data)
 
 
-class TopicViewSet(viewsets.ModelViewSet):
+class ReferenceDataListMixin:
+    """
+    Serve the list action of reference data endpoints from the cache, with a strong ETag built
+    from the version of the data and the request. Clients must revalidate their copy on each
+    use, and get a 304 when it is still current.
+    """
+
+    reference_data_name = None
+
+    def list(self, request, *args, **kwargs):
+        """
+        Get the list from the cache, or from the database on cache misses.
+        """
+        version = get_reference_data_version(self.reference_data_name)
+        variant = hashlib.md5(
+            f"{request.accepted_renderer.format}:{request.get_full_path()}".encode()
+        ).hexdigest()
+        etag = f'"{self.reference_data_name}-{version}-{variant}"'
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            key = (
+                f"partaj:reference-data:{self.reference_data_name}:{version}:{variant}"
+            )
+            data = cache.get(key)
+            if data is None:
+                data = super().list(request, *args, **kwargs).data
+                cache.set(key, data, settings.REFERENCE_DATA_CACHE_TIMEOUT)
+            response = Response(data)
+
+        response["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class TopicViewSet(ReferenceDataListMixin, viewsets.ModelViewSet):
     """
     API endpoints for topics.
     """
 
     permission_classes = [NotAllowed]
     queryset = models.Topic.objects.all().order_by("name")
+    reference_data_name = TOPICS
     serializer_class = serializers.TopicSerializer
 
+    def get_serializer_class(self):
+        """
+        List topics with a compact representation, enough for users to pick one.
+        """
+        if self.action == "list":
+            return serializers.TopicSummarySerializer
+        return self.serializer_class
+
     def get_queryset(self):
         """
         Enable filtering of topics by their linked unit.
         """
         queryset = self.queryset
+        if self.action == "list":
+            queryset = queryset.select_related("unit")
 
         unit_id = self.request.query_params.get("unit", None)
         if unit_id is not None:
@@ -239,13 +666,14 @@ class TopicViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
 
 
-class UrgencyViewSet(viewsets.ModelViewSet):
+class UrgencyViewSet(ReferenceDataListMixin, viewsets.ModelViewSet):
     """
     API endpoints for urgencies.
     """
 
     permission_classes = [NotAllowed]
     queryset = models.ReferralUrgency.objects.all().order_by("duration")
+    reference_data_name = URGENCIES
     serializer_class = serializers.ReferralUrgencySerializer
 
     def get_permissions(self):
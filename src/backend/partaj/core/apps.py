@@ -11,3 +11,11 @@ class CoreConfig(AppConfig):
 
     name = "partaj.core"
     verbose_name = _("Partaj")
+
+    def ready(self):
+        """
+        Register signal receivers that keep cached unit memberships, page fragments, reference
+        data, counters and search vectors up to date.
+        """
+        # pylint: disable=import-outside-toplevel,unused-import
+        from . import counters, fragments, memberships, reference_data, search  # noqa
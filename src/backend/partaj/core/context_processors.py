@@ -1,15 +1,21 @@
 """
 Template context processors for Partaj.
 """
+from functools import partial
 import json
 
+from django.conf import settings
 from django.middleware.csrf import get_token
 from django.templatetags.static import static
 
 from rest_framework.authtoken.models import Token
 
+from .fragments import get_user_version
+from .memberships import get_user_units
+from .uploads import direct_uploads_enabled
 
-def partaj_context(request):
+
+def get_frontend_context(request):
     """
     Build a context object for use in the frontend app. Prevents excessive duplication of
     code for trivial stuff such as release versions, asset paths or csrf tokens.
@@ -17,9 +23,26 @@ def partaj_context(request):
     frontend_context = {
         "assets": {"icons": static("core/icons.svg")},
         "csrftoken": get_token(request),
+        "directUploads": direct_uploads_enabled(),
     }
 
     if request.user.is_authenticated:
-        frontend_context["token"] = str(Token.objects.get_or_create(user=request.user)[0])
+        frontend_context["token"] = str(
+            Token.objects.get_or_create(user=request.user)[0]
+        )
+
+    return json.dumps(frontend_context)
+
 
-    return {"FRONTEND_CONTEXT": json.dumps(frontend_context)}
+def partaj_context(request):
+    """
+    Add Partaj values to the context of templates. Templates call the functions when they use
+    them: the frontend context is only built for pages that mount the frontend app, and the
+    navigation is skipped when it is cached.
+    """
+    return {
+        "FRAGMENT_CACHE_TIMEOUT": settings.FRAGMENT_CACHE_TIMEOUT,
+        "FRONTEND_CONTEXT": partial(get_frontend_context, request),
+        "user_fragments_version": partial(get_user_version, request.user.id),
+        "user_units": partial(get_user_units, request.user),
+    }
@@ -0,0 +1,189 @@
+"""
+Maintain the counters displayed on unit pages: the number of referrals and open referrals on
+each topic, and the number of active assignments of each member in their unit. They are updated
+with relative increments from the referral and assignment write paths, in the same transaction
+as the changes they count, so pages can display them without counting rows.
+"""
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import (
+    OPEN_REFERRAL_STATES,
+    Referral,
+    ReferralAssignment,
+    Topic,
+    Unit,
+    UnitMembership,
+)
+
+
+def update_topic_counters(topic_id, is_open, delta):
+    """
+    Count a referral in, or out of, the counters of its topic.
+    """
+    counters = {"referral_count": F("referral_count") + delta}
+    if is_open:
+        counters["open_referral_count"] = F("open_referral_count") + delta
+    Topic.objects.filter(id=topic_id).update(**counters)
+
+
+def update_assignment_counters(assignments, delta):
+    """
+    Count assignments on open referrals in, or out of, the counters of their assignee in
+    their unit.
+    """
+    for assignment in assignments:
+        UnitMembership.objects.filter(
+            user_id=assignment.assignee_id, unit_id=assignment.unit_id
+        ).update(active_assignment_count=F("active_assignment_count") + delta)
+
+
+@receiver(pre_save, sender=Referral)
+def remember_referral_counted_state(sender, instance, using, **kwargs):
+    """
+    Remember the topic and state the referral is currently counted with, to update counters
+    if they change. In transactions, the referral is locked until they end, so concurrent
+    saves count their change from the topic and state saved by the other one.
+    """
+    if instance._state.adding:
+        instance._counted_state = None
+        return
+
+    queryset = Referral.objects.using(using).filter(id=instance.id)
+    if transaction.get_connection(using).in_atomic_block:
+        queryset = queryset.select_for_update()
+    instance._counted_state = queryset.values_list("topic_id", "state").first()
+
+
+@receiver(post_save, sender=Referral)
+def count_referral(sender, instance, created, **kwargs):
+    """
+    Move the referral between topic counters when it is created or changes topic or state, and
+    count the assignments of referrals that are opened or closed.
+    """
+    previous = instance._counted_state
+    current = (instance.topic_id, instance.state)
+    if previous == current:
+        return
+
+    was_open = previous is not None and previous[1] in OPEN_REFERRAL_STATES
+    is_open = instance.state in OPEN_REFERRAL_STATES
+    if previous is not None:
+        update_topic_counters(previous[0], was_open, -1)
+    update_topic_counters(instance.topic_id, is_open, 1)
+
+    if previous is not None and was_open != is_open:
+        update_assignment_counters(
+            ReferralAssignment.objects.filter(referral=instance), 1 if is_open else -1
+        )
+
+
+@receiver(post_delete, sender=Referral)
+def uncount_referral(sender, instance, **kwargs):
+    """
+    Count a deleted referral out of its topic. Its assignments are deleted first, and counted
+    out on their own.
+    """
+    update_topic_counters(instance.topic_id, instance.state in OPEN_REFERRAL_STATES, -1)
+
+
+@receiver(post_save, sender=ReferralAssignment)
+def count_assignment(sender, instance, created, **kwargs):
+    """
+    Count a new assignment on an open referral for its assignee.
+    """
+    if created and instance.referral.state in OPEN_REFERRAL_STATES:
+        update_assignment_counters([instance], 1)
+
+
+@receiver(post_delete, sender=ReferralAssignment)
+def uncount_assignment(sender, instance, **kwargs):
+    """
+    Count a deleted assignment on an open referral out for its assignee.
+    """
+    if Referral.objects.filter(
+        id=instance.referral_id, state__in=OPEN_REFERRAL_STATES
+    ).exists():
+        update_assignment_counters([instance], -1)
+
+
+@receiver(pre_save, sender=UnitMembership)
+def count_membership_assignments(sender, instance, **kwargs):
+    """
+    Users can be assigned referrals of units they are not a member of yet: count them when
+    they join the unit.
+    """
+    if instance._state.adding:
+        instance.active_assignment_count = ReferralAssignment.objects.filter(
+            assignee_id=instance.user_id,
+            unit_id=instance.unit_id,
+            referral__state__in=OPEN_REFERRAL_STATES,
+        ).count()
+
+
+@receiver(m2m_changed, sender=Unit.members.through)
+def count_added_members_assignments(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    """
+    Members added through the many to many relation are created in bulk, without save
+    signals: count their assignments once they are added.
+    """
+    if action != "post_add" or not pk_set:
+        return
+    recount_membership_assignments(
+        UnitMembership.objects.filter(user=instance.id, unit__in=pk_set)
+        if reverse
+        else UnitMembership.objects.filter(unit=instance.id, user__in=pk_set)
+    )
+
+
+def count(queryset, group_by):
+    """
+    Build a subquery counting the rows of a queryset correlated to the updated rows, 0 if
+    there are none.
+    """
+    return Coalesce(
+        Subquery(
+            queryset.order_by()
+            .values(group_by)
+            .annotate(count=Count("id"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def recount_membership_assignments(memberships):
+    """
+    Recompute the counters of active assignments of a queryset of memberships, in a single
+    query.
+    """
+    memberships.update(
+        active_assignment_count=count(
+            ReferralAssignment.objects.filter(
+                assignee=OuterRef("user"),
+                referral__state__in=OPEN_REFERRAL_STATES,
+                unit=OuterRef("unit"),
+            ),
+            "assignee",
+        )
+    )
+
+
+def rebuild_counters():
+    """
+    Recompute all counters from the referrals and assignments they count, fixing any drift
+    caused by changes that bypass the write paths, like bulk updates.
+    """
+    referrals = Referral.objects.filter(topic=OuterRef("pk"))
+    Topic.objects.update(
+        referral_count=count(referrals, "topic"),
+        open_referral_count=count(
+            referrals.filter(state__in=OPEN_REFERRAL_STATES), "topic"
+        ),
+    )
+    recount_membership_assignments(UnitMembership.objects.all())
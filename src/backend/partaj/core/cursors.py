@@ -0,0 +1,54 @@
+"""
+Keyset pagination cursors for lists of referrals sorted on their creation date and id, used
+by the unit inboxes and the referrals API. A cursor points after a referral in a list, from
+its creation date, in microseconds since the epoch, and its id: as the pair is unique, a page
+is fetched by filtering on it, without an offset, and no referral is skipped or repeated when
+several share the same creation date.
+"""
+from datetime import datetime, timedelta, timezone
+
+from django.db.models import Q
+
+CURSOR_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# Cursors out of the range of dates and integer primary keys are not valid
+CURSOR_MAX_MICROSECONDS = (
+    datetime.max.replace(tzinfo=timezone.utc) - CURSOR_EPOCH
+) // timedelta(microseconds=1)
+CURSOR_MAX_ID = 2 ** 31 - 1
+
+
+def encode_cursor(created_at, referral_id):
+    """
+    Build the cursor pointing after a referral in a list, from its creation date and id.
+    """
+    delta = created_at - CURSOR_EPOCH
+    return f"{delta // timedelta(microseconds=1)}-{referral_id}"
+
+
+def decode_cursor(cursor):
+    """
+    Get the creation date and id from a cursor, or None if it is not valid.
+    """
+    try:
+        microseconds, referral_id = (int(part) for part in cursor.split("-"))
+        if not (
+            0 <= microseconds <= CURSOR_MAX_MICROSECONDS
+            and 0 < referral_id <= CURSOR_MAX_ID
+        ):
+            return None
+        return CURSOR_EPOCH + timedelta(microseconds=microseconds), referral_id
+    except (OverflowError, ValueError):
+        return None
+
+
+def get_cursor_filter(position, descending=True):
+    """
+    Get the filter selecting the referrals after a position in a list sorted on creation date
+    and id, most recent first or, if not `descending`, oldest first.
+    """
+    created_at, referral_id = position
+    if descending:
+        return Q(created_at__lt=created_at) | Q(
+            created_at=created_at, id__lt=referral_id
+        )
+    return Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=referral_id)
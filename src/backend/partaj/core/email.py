@@ -3,11 +3,19 @@ Function helpers to decouple email sending from the code handling the views them
 for views that need to trigger emails.
 """
 import json
+import logging
+import os
+import time
 
+from django.apps import apps
 from django.conf import settings
 from django.urls import reverse
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger("partaj")
 
 
 class Mailer:
@@ -31,17 +39,112 @@ class Mailer:
     # URL to send a single transactional email
     send_email_url = settings.SENDINBLUE["SEND_HTTP_ENDPOINT"]
 
+    # HTTP session to the email provider, shared by all calls in the current process
+    _session = None
+    _session_pid = None
+
+    # Maximum number of message versions the email provider accepts in a single call
+    max_message_versions = 1000
+
     @classmethod
     def send(cls, data):
         """
-        Factorize the actual call to the email provider's endpoint.
+        Queue an email in the outbox. It is written in the current transaction, along with the
+        changes that triggered it, and actually sent later by the `send_emails` command.
         """
         if settings.SENDINBLUE["API_KEY"]:
-            requests.request(
-                "POST",
+            OutgoingEmail = apps.get_model("core", "OutgoingEmail")
+            OutgoingEmail.objects.create(payload=json.dumps(data))
+
+    @classmethod
+    def send_batch(cls, data, versions):
+        """
+        Send the same email to several recipients, with as few calls as possible. Each version
+        holds the recipients and the params specific to one copy of the email; recipients of
+        different versions do not see each other's addresses.
+        """
+        if len(versions) == 1:
+            version = versions[0]
+            cls.send(
+                {
+                    **data,
+                    **version,
+                    "params": {**data["params"], **version.get("params", {})},
+                }
+            )
+            return
+
+        for start in range(0, len(versions), cls.max_message_versions):
+            cls.send(
+                {
+                    **data,
+                    "messageVersions": versions[
+                        start : start + cls.max_message_versions
+                    ],
+                }
+            )
+
+    @classmethod
+    def get_session(cls):
+        """
+        Get the HTTP session to the email provider, which keeps a pool of connections alive
+        between calls and retries them according to our settings.
+        Connection pools cannot be shared between processes: a new session is created after
+        a fork, eg. in each gunicorn worker.
+        """
+        if cls._session is None or cls._session_pid != os.getpid():
+            retries = Retry(
+                total=settings.EMAIL_PROVIDER_MAX_RETRIES,
+                # Sending an email is not idempotent: do not retry calls that may have been
+                # processed by the provider
+                read=0,
+                backoff_factor=settings.EMAIL_PROVIDER_RETRY_BACKOFF_FACTOR,
+                status_forcelist=[429, 503],
+                method_whitelist=["POST"],
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_maxsize=settings.EMAIL_PROVIDER_POOL_SIZE, max_retries=retries
+            )
+            session = requests.Session()
+            session.headers.update(cls.default_headers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            cls._session, cls._session_pid = session, os.getpid()
+
+        return cls._session
+
+    @classmethod
+    def deliver(cls, payload, timeout=None):
+        """
+        Factorize the actual call to the email provider's endpoint. Raise a `RequestException`
+        if the provider cannot be reached or does not accept the email.
+        Log the duration and outcome of each call to monitor the provider's latency.
+        """
+        status = None
+        start = time.perf_counter()
+        try:
+            response = cls.get_session().post(
                 cls.send_email_url,
-                data=json.dumps(data),
-                headers=cls.default_headers,
+                data=payload,
+                timeout=timeout
+                or (
+                    settings.EMAIL_PROVIDER_CONNECT_TIMEOUT,
+                    settings.EMAIL_PROVIDER_READ_TIMEOUT,
+                ),
+            )
+            status = response.status_code
+            response.raise_for_status()
+        finally:
+            duration = (time.perf_counter() - start) * 1000
+            logger.info(
+                "Email provider call returned %s in %.1fms",
+                status or "no response",
+                duration,
+                extra={
+                    "email_provider_duration": duration,
+                    "email_provider_status": status,
+                },
             )
 
     @classmethod
@@ -122,22 +225,23 @@ class Mailer:
             kwargs={"unit_id": referral.topic.unit.id, "pk": referral.id},
         )
 
-        for contact in contacts:
-            data = {
-                "params": {
-                    "case_number": referral.id,
-                    "link_to_referral": f"{cls.location}{link_path}",
-                    "requester": referral.requester,
-                    "topic": referral.topic.name,
-                    "unit_name": referral.topic.unit.name,
-                    "urgency": referral.urgency_level.name,
-                },
-                "replyTo": cls.replyTo,
-                "templateId": templateId,
-                "to": [{"email": contact.email}],
-            }
+        data = {
+            "params": {
+                "case_number": referral.id,
+                "link_to_referral": f"{cls.location}{link_path}",
+                "requester": referral.requester,
+                "topic": referral.topic.name,
+                "unit_name": referral.topic.unit.name,
+                "urgency": referral.urgency_level.name,
+            },
+            "replyTo": cls.replyTo,
+            "templateId": templateId,
+        }
 
-            cls.send(data)
+        # Send a separate copy to each contact, in a single call
+        cls.send_batch(
+            data, [{"to": [{"email": contact.email}]} for contact in contacts]
+        )
 
     @classmethod
     def send_referral_saved(cls, referral):
@@ -121,3 +121,37 @@ class ReferralAssignmentFactory(factory.django.DjangoModelFactory):
             unit=self.unit, role=models.UnitMembershipRole.OWNER
         )
         return membership.user
+
+
+class ReferralAttachmentFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = models.ReferralAttachment
+
+    file = factory.django.FileField(data=b"attachment content")
+    referral = factory.SubFactory(ReferralFactory)
+
+
+class ReferralAnswerFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = models.ReferralAnswer
+
+    content = factory.Faker("text", max_nb_chars=500)
+    created_by = factory.SubFactory(UserFactory)
+    referral = factory.SubFactory(ReferralFactory)
+
+
+class ReferralAnswerAttachmentFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = models.ReferralAnswerAttachment
+
+    file = factory.django.FileField(data=b"attachment content")
+    referral_answer = factory.SubFactory(ReferralAnswerFactory)
+
+
+class ReferralActivityFactory(factory.django.DjangoModelFactory):
+    class Meta:
+        model = models.ReferralActivity
+
+    actor = factory.SubFactory(UserFactory)
+    referral = factory.SubFactory(ReferralFactory)
+    verb = models.ReferralActivityVerb.CREATED
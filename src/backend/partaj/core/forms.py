@@ -1,6 +1,8 @@
 from django import forms
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
 
-from .models import Referral
+from .models import Referral, ReferralAssignment, ReferralUrgency, Topic
 
 
 class ReferralForm(forms.ModelForm):
@@ -21,3 +23,62 @@ class ReferralForm(forms.ModelForm):
         required=False,
         widget=forms.ClearableFileInput(attrs={"multiple": True})
     )
+
+
+class UnitReferralFilterForm(forms.Form):
+    """
+    Filter the referrals listed for a unit, among states of the current list and the topics
+    and members of the unit. Submitted as query parameters: invalid values are ignored.
+    """
+
+    state = forms.ChoiceField(required=False)
+    topic = forms.ModelChoiceField(
+        label=_("Topic"),
+        queryset=Topic.objects.none(),
+        required=False,
+        empty_label=_("All topics"),
+    )
+    assignee = forms.ModelChoiceField(
+        label=_("Assignee"),
+        queryset=get_user_model().objects.none(),
+        required=False,
+        empty_label=_("All assignees"),
+    )
+    urgency = forms.ModelChoiceField(
+        label=_("Expected response time"),
+        queryset=ReferralUrgency.objects.none(),
+        required=False,
+        empty_label=_("All response times"),
+    )
+
+    def __init__(self, *args, unit, states, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["state"].choices = [("", _("All"))] + [
+            (state.value, state.label) for state in states
+        ]
+        self.fields["topic"].queryset = Topic.objects.filter(unit=unit).order_by("name")
+        self.fields["assignee"].queryset = unit.members.order_by(
+            "first_name", "last_name"
+        )
+        self.fields["assignee"].label_from_instance = lambda user: user.get_full_name()
+        self.fields["urgency"].queryset = ReferralUrgency.objects.order_by("duration")
+
+    def get_filters(self):
+        """
+        Get the lookups to filter the queryset of referrals with, from valid values only.
+        Assignees are matched with a subquery so the join does not alter other annotations.
+        """
+        self.is_valid()
+        data = self.cleaned_data
+        filters = {}
+        if data.get("state"):
+            filters["state"] = data["state"]
+        if data.get("topic"):
+            filters["topic"] = data["topic"]
+        if data.get("assignee"):
+            filters["id__in"] = ReferralAssignment.objects.filter(
+                assignee=data["assignee"]
+            ).values("referral")
+        if data.get("urgency"):
+            filters["urgency_level"] = data["urgency"]
+        return filters
@@ -0,0 +1,149 @@
+"""
+Cache fragments of server-rendered pages: unit inboxes, members and topics tables, requester
+referral lists and the units in the navigation. Each fragment is cached under the version of
+the unit or user whose data it shows. Writes to referrals, assignments, memberships, topics and
+units drop the versions of the units and users they concern, so fragments rendered before are
+never read again and expire on their own.
+
+Changes to other objects displayed in fragments, like the names of users or urgency levels,
+show up when fragments expire after `FRAGMENT_CACHE_TIMEOUT` seconds.
+"""
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Referral, ReferralAssignment, Topic, Unit, UnitMembership
+
+UNIT = "unit"
+USER = "user"
+
+
+def get_version_key(scope, object_id):
+    """
+    Build the cache key for the version of the cached data of an object, like the fragments
+    of a unit or user.
+    """
+    return f"partaj:fragments-version:{scope}:{object_id}"
+
+
+def get_version(scope, object_id):
+    """
+    Get the current version of the cached data of an object, to include in cache keys.
+    Missing versions start from a random value rather than a constant, so data cached under
+    a version that was evicted or dropped is not read again.
+    """
+    key = get_version_key(scope, object_id)
+    version = uuid4().hex
+    if not cache.add(key, version, None):
+        version = cache.get(key, version)
+    return version
+
+
+def get_unit_version(unit_id):
+    """
+    Get the version of the fragments displaying data of a unit.
+    """
+    return get_version(UNIT, unit_id)
+
+
+def get_user_version(user_id):
+    """
+    Get the version of the fragments displaying data of a user, as a requester or member.
+    """
+    return get_version(USER, user_id)
+
+
+def invalidate(scope, object_ids):
+    """
+    Drop the versions of the cached data of some objects. They are dropped right away
+    for the rest of the current request, and again when the transaction is committed, as other
+    requests may have cached fragments rendered from the previous data in between.
+    """
+    keys = [get_version_key(scope, object_id) for object_id in set(object_ids)]
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@receiver(post_save, sender=Referral)
+@receiver(post_delete, sender=Referral)
+def invalidate_on_referral_change(sender, instance, **kwargs):
+    """
+    Referrals are displayed in the inbox of the unit of their topic and in the list of their
+    requester. Referrals moved from the topic of another unit are also dropped from there, with
+    the topic remembered by `partaj.core.counters` before the save.
+    """
+    counted_state = getattr(instance, "_counted_state", None)
+    previous_topic_id = counted_state[0] if counted_state else instance.topic_id
+    if previous_topic_id == instance.topic_id:
+        unit_ids = [instance.topic.unit_id]
+    else:
+        unit_ids = Topic.objects.filter(
+            id__in=[previous_topic_id, instance.topic_id]
+        ).values_list("unit_id", flat=True)
+    invalidate(UNIT, unit_ids)
+    invalidate(USER, [instance.user_id])
+
+
+@receiver(post_save, sender=ReferralAssignment)
+@receiver(post_delete, sender=ReferralAssignment)
+def invalidate_on_assignment_change(sender, instance, **kwargs):
+    """
+    Assignees are displayed with referrals in the unit inbox and requester list, and counted on
+    the members table of their unit.
+    """
+    invalidate(UNIT, [instance.unit_id])
+    if ReferralAssignment.referral.is_cached(instance):
+        requester_ids = [instance.referral.user_id]
+    else:
+        requester_ids = Referral.objects.filter(id=instance.referral_id).values_list(
+            "user_id", flat=True
+        )
+    invalidate(USER, requester_ids)
+
+
+@receiver(post_save, sender=UnitMembership)
+@receiver(post_delete, sender=UnitMembership)
+def invalidate_on_membership_change(sender, instance, **kwargs):
+    """
+    Memberships are displayed on the members table of the unit and in the navigation of
+    the user.
+    """
+    invalidate(UNIT, [instance.unit_id])
+    invalidate(USER, [instance.user_id])
+
+
+@receiver(m2m_changed, sender=Unit.members.through)
+def invalidate_on_members_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Adding or removing members through the many to many relation does not send save or
+    delete signals on memberships: invalidate the units and users involved.
+    """
+    if action not in ["post_add", "post_remove", "pre_clear"]:
+        return
+    if action == "pre_clear":
+        related = instance.unit_set if reverse else instance.members
+        pk_set = related.values_list("id", flat=True)
+    invalidate(UNIT, pk_set if reverse else [instance.id])
+    invalidate(USER, [instance.id] if reverse else pk_set)
+
+
+@receiver(post_save, sender=Topic)
+@receiver(post_delete, sender=Topic)
+def invalidate_on_topic_change(sender, instance, **kwargs):
+    """
+    Topics are displayed on the topics table of their unit and with referrals in its inbox.
+    """
+    invalidate(UNIT, [instance.unit_id])
+
+
+@receiver(post_save, sender=Unit)
+def invalidate_on_unit_change(sender, instance, **kwargs):
+    """
+    Unit names are displayed in the navigation of their members.
+    """
+    invalidate(UNIT, [instance.id])
+    invalidate(USER, instance.members.values_list("id", flat=True))
@@ -0,0 +1,101 @@
+"""
+Delete the attachment blobs that are no longer used by any attachment, and the blob files that
+were left without a blob.
+"""
+from datetime import timedelta
+import logging
+import os
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from ...models import BLOBS_PATH, AttachmentBlob
+
+logger = logging.getLogger("partaj")
+
+
+def collect_attachment_blobs(grace_period):
+    """
+    Delete blobs that have not been referenced by any attachment for the grace period, along
+    with their files. The grace period leaves time to requests that found a blob to reference it.
+    Return the number of blobs deleted.
+    """
+    with transaction.atomic():
+        blobs = list(
+            AttachmentBlob.objects.select_for_update(skip_locked=True).filter(
+                reference_count=0, updated_at__lt=timezone.now() - grace_period
+            )
+        )
+        AttachmentBlob.objects.filter(
+            sha256__in=[blob.sha256 for blob in blobs]
+        ).delete()
+
+        # Only delete files once we know their blobs are gone for good
+        def delete_files():
+            for blob in blobs:
+                blob.file.delete(save=False)
+
+        transaction.on_commit(delete_files)
+
+    for blob in blobs:
+        logger.info("Collected attachment blob %s", blob.sha256)
+    return len(blobs)
+
+
+def list_files(path):
+    """
+    List the names of all the files under a path of the storage, in all its subdirectories.
+    """
+    try:
+        directories, files = default_storage.listdir(path)
+    except FileNotFoundError:
+        return
+    for name in files:
+        yield os.path.join(path, name)
+    for name in directories:
+        yield from list_files(os.path.join(path, name))
+
+
+def collect_orphan_blob_files(grace_period):
+    """
+    Delete blob files that no blob references and that were stored before the grace period.
+    They were uploaded in transactions that were rolled back after the files were stored,
+    while the grace period protects files whose transaction is still running.
+    Return the number of files deleted.
+    """
+    stored_names = set(AttachmentBlob.objects.values_list("file", flat=True))
+    count = 0
+    for name in list_files(BLOBS_PATH):
+        if name in stored_names:
+            continue
+        if default_storage.get_modified_time(name) >= timezone.now() - grace_period:
+            continue
+        default_storage.delete(name)
+        logger.info("Collected orphan attachment blob file %s", name)
+        count += 1
+    return count
+
+
+class Command(BaseCommand):
+    """
+    Garbage collect unreferenced attachment blobs.
+    """
+
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-period",
+            type=int,
+            default=24,
+            help="Hours a blob or file must have been unreferenced to be collected",
+        )
+
+    def handle(self, *args, **options):
+        grace_period = timedelta(hours=options["grace_period"])
+        count = collect_attachment_blobs(grace_period)
+        self.stdout.write(f"Collected {count} attachment blobs.")
+        count = collect_orphan_blob_files(grace_period)
+        self.stdout.write(f"Collected {count} orphan blob files.")
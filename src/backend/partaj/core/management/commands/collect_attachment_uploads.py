@@ -0,0 +1,66 @@
+"""
+Delete the files uploaded directly to the object storage that were never registered as
+attachments.
+"""
+from datetime import timedelta
+import logging
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from ...models import AttachmentUpload
+from ...uploads import get_upload_token_max_age
+
+logger = logging.getLogger("partaj")
+
+
+def collect_attachment_uploads(grace_period):
+    """
+    Delete uploads whose token expired for the grace period without being registered, along
+    with their files if they were uploaded. Return the number of uploads deleted.
+    """
+    expired_before = (
+        timezone.now() - timedelta(seconds=get_upload_token_max_age()) - grace_period
+    )
+    with transaction.atomic():
+        uploads = list(
+            AttachmentUpload.objects.select_for_update(skip_locked=True).filter(
+                created_at__lt=expired_before
+            )
+        )
+        AttachmentUpload.objects.filter(
+            id__in=[upload.id for upload in uploads]
+        ).delete()
+
+        # Only delete files once we know their uploads cannot be registered anymore
+        def delete_files():
+            for upload in uploads:
+                default_storage.delete(upload.key)
+
+        transaction.on_commit(delete_files)
+
+    for upload in uploads:
+        logger.info("Collected attachment upload %s", upload.id)
+    return len(uploads)
+
+
+class Command(BaseCommand):
+    """
+    Garbage collect expired direct uploads.
+    """
+
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-period",
+            type=int,
+            default=24,
+            help="Number of hours after their token expired to collect uploads",
+        )
+
+    def handle(self, *args, **options):
+        count = collect_attachment_uploads(timedelta(hours=options["grace_period"]))
+        self.stdout.write(f"Collected {count} attachment uploads.")
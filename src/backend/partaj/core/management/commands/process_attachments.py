@@ -0,0 +1,104 @@
+"""
+Extract the previews, page counts and text of new attachments.
+"""
+from datetime import timedelta
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ...models import (
+    AttachmentPreviewState,
+    ReferralAnswerAttachment,
+    ReferralAttachment,
+)
+from ...previews import process_attachment
+
+
+# Delay after which attachments claimed by a worker that did not record their result, for
+# instance because it crashed, can be claimed again. It must exceed the time needed to process
+# a batch.
+CLAIM_TIMEOUT = timedelta(minutes=30)
+
+
+def claim_pending_attachments(attachment_class, batch_size):
+    """
+    Claim a batch of pending attachments of a kind, oldest first, and attachments whose claim
+    expired. They are marked as processing in a short transaction, skipping rows locked by
+    other workers, so several workers can process attachments concurrently without holding
+    locks while tools run.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        attachments = list(
+            attachment_class.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(preview_state=AttachmentPreviewState.PENDING)
+                | Q(
+                    preview_state=AttachmentPreviewState.PROCESSING,
+                    preview_claimed_at__lt=now - CLAIM_TIMEOUT,
+                )
+            )
+            .order_by("created_at")[:batch_size]
+        )
+        attachment_class.objects.filter(
+            id__in=[attachment.id for attachment in attachments]
+        ).update(
+            preview_state=AttachmentPreviewState.PROCESSING, preview_claimed_at=now
+        )
+    return attachments
+
+
+def process_pending_attachments(batch_size):
+    """
+    Process one batch of pending attachments of each kind. Each attachment is processed and
+    saved on its own, outside of the transaction that claimed it. Return the size of the
+    largest batch.
+    """
+    processed = 0
+    for attachment_class in [ReferralAttachment, ReferralAnswerAttachment]:
+        attachments = claim_pending_attachments(attachment_class, batch_size)
+        for attachment in attachments:
+            process_attachment(attachment)
+        processed = max(processed, len(attachments))
+
+    return processed
+
+
+class Command(BaseCommand):
+    """
+    Process new attachments, once or continuously as a worker process.
+    """
+
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10,
+            help="Number of attachments of each kind to process in each batch",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running and poll for new attachments",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Time to wait when there is no attachment to process in loop mode, "
+            "in seconds",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_pending_attachments(options["batch_size"])
+            # Keep processing full batches right away, wait for new attachments otherwise
+            if processed < options["batch_size"]:
+                if not options["loop"]:
+                    break
+                time.sleep(options["interval"])
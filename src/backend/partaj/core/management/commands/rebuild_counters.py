@@ -0,0 +1,20 @@
+"""
+Recompute the referral and assignment counters displayed on unit pages.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    """
+    Rebuild all counters from the rows they count.
+    """
+
+    help = __doc__
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_counters()
+        self.stdout.write("Rebuilt topic and unit membership counters.")
@@ -0,0 +1,21 @@
+"""
+Recompute the full-text search vectors of referrals.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import Referral
+from ...search import is_search_enabled, update_search_vectors
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the search vectors of all referrals from the texts they index.
+    """
+
+    help = __doc__
+
+    def handle(self, *args, **options):
+        if not is_search_enabled():
+            raise CommandError("Full-text search requires PostgreSQL.")
+        update_search_vectors(Referral.objects.values("id"))
+        self.stdout.write("Rebuilt referral search vectors.")
@@ -0,0 +1,141 @@
+"""
+Send the emails waiting in the outbox to our email provider.
+"""
+from datetime import timedelta
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+import requests
+
+from ...email import Mailer
+from ...models import OutgoingEmail, OutgoingEmailState
+
+logger = logging.getLogger("partaj")
+
+# Delay before the first retry of a failed email, doubled on each subsequent attempt
+RETRY_BASE_DELAY = timedelta(seconds=30)
+RETRY_MAX_DELAY = timedelta(hours=1)
+
+# Delay after which emails claimed by a worker that did not record their result, for instance
+# because it crashed, can be claimed again. It must exceed the time needed to send a batch.
+CLAIM_TIMEOUT = timedelta(minutes=15)
+
+
+def claim_pending_emails(batch_size):
+    """
+    Claim a batch of pending emails whose time has come, and emails whose claim expired. They
+    are marked as sending in a short transaction, skipping rows locked by other workers, so
+    several workers can drain the outbox concurrently without holding locks while they call
+    the email provider.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(
+                state__in=[OutgoingEmailState.PENDING, OutgoingEmailState.SENDING],
+                send_after__lte=now,
+            )
+            .order_by("send_after")[:batch_size]
+        )
+        OutgoingEmail.objects.filter(id__in=[email.id for email in emails]).update(
+            state=OutgoingEmailState.SENDING, send_after=now + CLAIM_TIMEOUT
+        )
+    return emails
+
+
+def send_email(email, max_attempts, timeout=None):
+    """
+    Send a claimed email and record the result right away, in its own commit, so emails that
+    were delivered are never sent again if a later email fails or the worker stops. Failed
+    emails are retried with an exponential backoff until they reach the maximum number of
+    attempts, whatever the error.
+    """
+    try:
+        Mailer.deliver(email.payload, timeout=timeout)
+    except Exception as error:  # pylint: disable=broad-except
+        email.attempts += 1
+        email.last_error = str(error)
+        if email.attempts >= max_attempts:
+            email.state = OutgoingEmailState.FAILED
+            logger.error("Giving up on outgoing email %s: %s", email.id, error)
+        else:
+            email.state = OutgoingEmailState.PENDING
+            email.send_after = timezone.now() + min(
+                RETRY_BASE_DELAY * 2 ** (email.attempts - 1), RETRY_MAX_DELAY
+            )
+            log = (
+                logger.warning
+                if isinstance(error, requests.RequestException)
+                else logger.exception
+            )
+            log("Failed to send outgoing email %s: %s", email.id, error)
+    else:
+        email.state = OutgoingEmailState.SENT
+        email.sent_at = timezone.now()
+    email.save()
+
+
+def send_pending_emails(batch_size, max_attempts, timeout=None):
+    """
+    Claim one batch of pending emails whose time has come and send them one by one. Return the
+    number of emails processed.
+    """
+    emails = claim_pending_emails(batch_size)
+    for email in emails:
+        send_email(email, max_attempts, timeout)
+    return len(emails)
+
+
+class Command(BaseCommand):
+    """
+    Drain the email outbox, once or continuously as a worker process.
+    """
+
+    help = __doc__
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="Number of emails to send in each batch",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=5,
+            help="Number of attempts after which an email is marked as failed",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=None,
+            help="Timeout for each call to the email provider, in seconds",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running and poll the outbox for new emails",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Time to wait when the outbox is empty in loop mode, in seconds",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed = send_pending_emails(
+                options["batch_size"], options["max_attempts"], options["timeout"]
+            )
+            # Keep draining full batches right away, wait for new emails otherwise
+            if processed < options["batch_size"]:
+                if not options["loop"]:
+                    break
+                time.sleep(options["interval"])
@@ -0,0 +1,108 @@
+"""
+Keep track of the units the current user is a member of. Views, API permissions and templates
+all need this information to authorize users and build navigation: we load it once per request
+and can optionally cache it across requests.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Unit, UnitMembership
+
+# Lightweight, picklable representation of a unit as seen by one of its members
+UserUnit = namedtuple("UserUnit", ["id", "name", "role"])
+
+
+def get_cache_key(user_id):
+    """
+    Build the cache key for the units of a user.
+    """
+    return f"partaj:user-units:{user_id}"
+
+
+def get_user_units(user):
+    """
+    Get the units a user is a member of, ordered by name, with the role the user has in each
+    of them.
+    The result is memoized on the user instance, which only lives for the duration of a request,
+    so a request never issues more than one query. It is also cached across requests for
+    `UNIT_MEMBERSHIPS_CACHE_TIMEOUT` seconds if this setting is not 0. Cached values are
+    invalidated when memberships change, but only in the current process: use a shared cache
+    backend when enabling it with several processes.
+    """
+    if not user.is_authenticated:
+        return []
+
+    try:
+        return user._partaj_units
+    except AttributeError:
+        pass
+
+    timeout = settings.UNIT_MEMBERSHIPS_CACHE_TIMEOUT
+    units = cache.get(get_cache_key(user.id)) if timeout else None
+    if units is None:
+        units = [
+            UserUnit(
+                id=str(membership.unit_id),
+                name=membership.unit.name,
+                role=membership.role,
+            )
+            for membership in UnitMembership.objects.filter(user=user)
+            .select_related("unit")
+            .order_by("unit__name")
+        ]
+        if timeout:
+            cache.set(get_cache_key(user.id), units, timeout)
+
+    user._partaj_units = units
+    return units
+
+
+def get_user_unit_roles(user):
+    """
+    Get a dictionary mapping the ids of the units a user is a member of to their role there.
+    """
+    return {unit.id: unit.role for unit in get_user_units(user)}
+
+
+def invalidate_user_units(user_ids):
+    """
+    Drop the cached units for a list of users.
+    """
+    cache.delete_many([get_cache_key(user_id) for user_id in user_ids])
+
+
+@receiver(post_save, sender=UnitMembership)
+@receiver(post_delete, sender=UnitMembership)
+def invalidate_on_membership_change(sender, instance, **kwargs):
+    """
+    Invalidate the units of a user when one of their memberships is created, updated
+    or deleted.
+    """
+    invalidate_user_units([instance.user_id])
+
+
+@receiver(m2m_changed, sender=Unit.members.through)
+def invalidate_on_members_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Adding or removing members through the many to many relation does not send save or
+    delete signals on memberships: invalidate the users involved.
+    """
+    if action in ["post_add", "post_remove"]:
+        invalidate_user_units([instance.id] if reverse else pk_set)
+    elif action == "pre_clear":
+        invalidate_user_units(
+            [instance.id] if reverse else instance.members.values_list("id", flat=True)
+        )
+
+
+@receiver(post_save, sender=Unit)
+def invalidate_on_unit_change(sender, instance, **kwargs):
+    """
+    Unit names are cached along with memberships: invalidate all members of a unit
+    when it is updated.
+    """
+    invalidate_user_units(instance.members.values_list("id", flat=True))
@@ -0,0 +1,19 @@
+# Generated by Django 3.0.5 on 2026-10-18 04:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0025_migrate_referrals_to_urgency_model"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="referral",
+            index=models.Index(
+                fields=["created_at", "id"], name="referral_created_at_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 3.0.5 on 2026-10-18 04:38
+
+from django.db import migrations, models
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0026_add_referral_created_at_id_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutgoingEmail",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        help_text="Primary key for the outgoing email as UUID",
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="id",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="created at"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="updated at"),
+                ),
+                (
+                    "payload",
+                    models.TextField(
+                        help_text="JSON body of the request to the email provider",
+                        verbose_name="payload",
+                    ),
+                ),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[
+                            ("failed", "Failed"),
+                            ("pending", "Pending"),
+                            ("sent", "Sent"),
+                        ],
+                        default="pending",
+                        help_text="Delivery status for this email",
+                        max_length=20,
+                        verbose_name="state",
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveSmallIntegerField(
+                        default=0,
+                        help_text="Number of failed attempts to send this email",
+                        verbose_name="attempts",
+                    ),
+                ),
+                (
+                    "send_after",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        help_text="Date after which the next attempt to send this email can be made",
+                        verbose_name="send after",
+                    ),
+                ),
+                (
+                    "sent_at",
+                    models.DateTimeField(blank=True, null=True, verbose_name="sent at"),
+                ),
+                (
+                    "last_error",
+                    models.TextField(
+                        blank=True,
+                        help_text="Error from the last failed attempt to send this email",
+                        verbose_name="last error",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "outgoing email",
+                "db_table": "partaj_outgoing_email",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="outgoingemail",
+            index=models.Index(
+                fields=["state", "send_after"], name="outgoing_email_state_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,112 @@
+# Generated by Django 3.0.5 on 2026-10-18 04:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+import partaj.core.models.attachment
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0027_add_outgoing_email"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AttachmentBlob",
+            fields=[
+                (
+                    "sha256",
+                    models.CharField(
+                        help_text="Hash of the file content, as hexadecimal",
+                        max_length=64,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="SHA-256",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="created at"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="updated at"),
+                ),
+                (
+                    "file",
+                    models.FileField(
+                        max_length=300,
+                        upload_to=partaj.core.models.attachment.blob_upload_to,
+                        verbose_name="file",
+                    ),
+                ),
+                (
+                    "size",
+                    models.IntegerField(
+                        help_text="Blob file size in bytes", verbose_name="file size"
+                    ),
+                ),
+                (
+                    "reference_count",
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text="Number of attachments using this blob",
+                        verbose_name="reference count",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "attachment blob",
+                "db_table": "partaj_attachment_blob",
+            },
+        ),
+        migrations.AlterField(
+            model_name="referralanswerattachment",
+            name="file",
+            field=models.FileField(
+                max_length=300,
+                upload_to=partaj.core.models.attachment.attachment_upload_to,
+                verbose_name="file",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="referralattachment",
+            name="file",
+            field=models.FileField(
+                max_length=300,
+                upload_to=partaj.core.models.attachment.attachment_upload_to,
+                verbose_name="file",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="attachmentblob",
+            index=models.Index(
+                fields=["reference_count", "updated_at"], name="attachment_blob_gc_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="referralanswerattachment",
+            name="blob",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="core.AttachmentBlob",
+                verbose_name="blob",
+            ),
+        ),
+        migrations.AddField(
+            model_name="referralattachment",
+            name="blob",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="core.AttachmentBlob",
+                verbose_name="blob",
+            ),
+        ),
+    ]
@@ -0,0 +1,120 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:00
+
+from django.db import migrations, models
+import partaj.core.models.attachment
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0028_add_attachment_blobs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="referralanswerattachment",
+            name="page_count",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Number of pages in the attachment",
+                null=True,
+                verbose_name="page count",
+            ),
+        ),
+        migrations.AddField(
+            model_name="referralanswerattachment",
+            name="preview",
+            field=models.FileField(
+                blank=True,
+                help_text="Image of the first page of the attachment",
+                max_length=300,
+                upload_to=partaj.core.models.attachment.attachment_preview_upload_to,
+                verbose_name="preview",
+            ),
+        ),
+        migrations.AddField(
+            model_name="referralanswerattachment",
+            name="preview_state",
+            field=models.CharField(
+                choices=[
+                    ("failed", "Failed"),
+                    ("pending", "Pending"),
+                    ("ready", "Ready"),
+                    ("unsupported", "Unsupported"),
+                ],
+                default="pending",
+                help_text="Progress of the extraction of the preview of the attachment",
+                max_length=20,
+                verbose_name="preview state",
+            ),
+        ),
+        migrations.AddField(
+            model_name="referralanswerattachment",
+            name="text",
+            field=models.TextField(
+                blank=True,
+                help_text="Text extracted from the attachment",
+                verbose_name="text",
+            ),
+        ),
+        migrations.AddField(
+            model_name="referralattachment",
+            name="page_count",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Number of pages in the attachment",
+                null=True,
+                verbose_name="page count",
+            ),
+        ),
+        migrations.AddField(
+            model_name="referralattachment",
+            name="preview",
+            field=models.FileField(
+                blank=True,
+                help_text="Image of the first page of the attachment",
+                max_length=300,
+                upload_to=partaj.core.models.attachment.attachment_preview_upload_to,
+                verbose_name="preview",
+            ),
+        ),
+        migrations.AddField(
+            model_name="referralattachment",
+            name="preview_state",
+            field=models.CharField(
+                choices=[
+                    ("failed", "Failed"),
+                    ("pending", "Pending"),
+                    ("ready", "Ready"),
+                    ("unsupported", "Unsupported"),
+                ],
+                default="pending",
+                help_text="Progress of the extraction of the preview of the attachment",
+                max_length=20,
+                verbose_name="preview state",
+            ),
+        ),
+        migrations.AddField(
+            model_name="referralattachment",
+            name="text",
+            field=models.TextField(
+                blank=True,
+                help_text="Text extracted from the attachment",
+                verbose_name="text",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="referralanswerattachment",
+            index=models.Index(
+                fields=["preview_state", "created_at"],
+                name="answer_attachment_prev_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="referralattachment",
+            index=models.Index(
+                fields=["preview_state", "created_at"],
+                name="referral_attachment_prev_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0029_add_attachment_previews"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="referral",
+            index=models.Index(
+                fields=["topic", "state", "created_at", "id"],
+                name="referral_topic_state_idx",
+            ),
+        ),
+    ]
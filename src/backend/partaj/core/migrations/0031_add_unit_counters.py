@@ -0,0 +1,91 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:06
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+OPEN_REFERRAL_STATES = ["received", "assigned", "incomplete"]
+
+
+def count(queryset, group_by):
+    """
+    Build a subquery counting the rows of a queryset, 0 if there are none.
+    """
+    return Coalesce(
+        Subquery(
+            queryset.order_by()
+            .values(group_by)
+            .annotate(count=Count("id"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def forwards(apps, schema_editor):
+    """
+    Initialize the counters from existing referrals and assignments.
+    """
+    Referral = apps.get_model("core", "Referral")
+    ReferralAssignment = apps.get_model("core", "ReferralAssignment")
+    Topic = apps.get_model("core", "Topic")
+    UnitMembership = apps.get_model("core", "UnitMembership")
+
+    referrals = Referral.objects.filter(topic=OuterRef("pk"))
+    Topic.objects.update(
+        referral_count=count(referrals, "topic"),
+        open_referral_count=count(
+            referrals.filter(state__in=OPEN_REFERRAL_STATES), "topic"
+        ),
+    )
+    UnitMembership.objects.update(
+        active_assignment_count=count(
+            ReferralAssignment.objects.filter(
+                assignee=OuterRef("user"),
+                referral__state__in=OPEN_REFERRAL_STATES,
+                unit=OuterRef("unit"),
+            ),
+            "assignee",
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0030_add_referral_topic_state_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="topic",
+            name="open_referral_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="Number of referrals on this topic that are yet to be handled",
+                verbose_name="open referral count",
+            ),
+        ),
+        migrations.AddField(
+            model_name="topic",
+            name="referral_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="Number of referrals on this topic",
+                verbose_name="referral count",
+            ),
+        ),
+        migrations.AddField(
+            model_name="unitmembership",
+            name="active_assignment_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                help_text="Number of open referrals of the unit assigned to the user",
+                verbose_name="active assignment count",
+            ),
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
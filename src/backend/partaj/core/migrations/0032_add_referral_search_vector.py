@@ -0,0 +1,116 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:22
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.aggregates import StringAgg
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+SEARCH_CONFIG = "french"
+
+SEARCH_INDEX = django.contrib.postgres.indexes.GinIndex(
+    fields=["search_vector"], name="referral_search_vector_idx"
+)
+
+
+def aggregate_text(queryset, field, group_by):
+    """
+    Build a subquery joining the texts of a related queryset, NULL if there are none.
+    """
+    return Subquery(
+        queryset.order_by()
+        .values(group_by)
+        .annotate(text=StringAgg(field, delimiter="\n"))
+        .values("text")
+    )
+
+
+def add_search_index(apps, schema_editor):
+    """
+    GIN indexes only exist on PostgreSQL, which is also the only database where search
+    vectors are maintained.
+    """
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.add_index(apps.get_model("core", "Referral"), SEARCH_INDEX)
+
+
+def remove_search_index(apps, schema_editor):
+    """
+    Drop the GIN index where it was created.
+    """
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.remove_index(apps.get_model("core", "Referral"), SEARCH_INDEX)
+
+
+def forwards(apps, schema_editor):
+    """
+    Initialize the search vectors of existing referrals.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    Referral = apps.get_model("core", "Referral")
+    ReferralAnswer = apps.get_model("core", "ReferralAnswer")
+    ReferralAnswerAttachment = apps.get_model("core", "ReferralAnswerAttachment")
+    ReferralAttachment = apps.get_model("core", "ReferralAttachment")
+    Topic = apps.get_model("core", "Topic")
+
+    referral = OuterRef("pk")
+    Referral.objects.update(
+        search_vector=SearchVector(
+            "question",
+            Subquery(Topic.objects.filter(id=OuterRef("topic")).values("name")),
+            config=SEARCH_CONFIG,
+            weight="A",
+        )
+        + SearchVector("context", "requester", config=SEARCH_CONFIG, weight="B")
+        + SearchVector(
+            "prior_work",
+            aggregate_text(
+                ReferralAnswer.objects.filter(referral=referral), "content", "referral"
+            ),
+            config=SEARCH_CONFIG,
+            weight="C",
+        )
+        + SearchVector(
+            aggregate_text(
+                ReferralAttachment.objects.filter(referral=referral), "text", "referral"
+            ),
+            aggregate_text(
+                ReferralAnswerAttachment.objects.filter(
+                    referral_answer__referral=referral
+                ),
+                "text",
+                "referral_answer__referral",
+            ),
+            config=SEARCH_CONFIG,
+            weight="D",
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0031_add_unit_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="referral",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                blank=True, editable=False, null=True, verbose_name="search vector"
+            ),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(add_search_index, remove_search_index)
+            ],
+            state_operations=[
+                migrations.AddIndex(model_name="referral", index=SEARCH_INDEX)
+            ],
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:32
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0032_add_referral_search_vector"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="outgoingemail",
+            name="send_after",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now,
+                help_text="Date after which the next attempt to send this email can be made, or after which a worker that claimed it is considered gone",
+                verbose_name="send after",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="outgoingemail",
+            name="state",
+            field=models.CharField(
+                choices=[
+                    ("failed", "Failed"),
+                    ("pending", "Pending"),
+                    ("sending", "Sending"),
+                    ("sent", "Sent"),
+                ],
+                default="pending",
+                help_text="Delivery status for this email",
+                max_length=20,
+                verbose_name="state",
+            ),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0033_add_outgoing_email_sending_state"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AttachmentUpload",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        editable=False,
+                        help_text="Primary key reserved for the attachment as UUID",
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="id",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="created at"),
+                ),
+                (
+                    "key",
+                    models.CharField(
+                        help_text="Name of the uploaded file on the object storage",
+                        max_length=300,
+                        verbose_name="key",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "attachment upload",
+                "db_table": "partaj_attachment_upload",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="attachmentupload",
+            index=models.Index(
+                fields=["created_at"], name="attachment_upload_created_idx"
+            ),
+        ),
+    ]
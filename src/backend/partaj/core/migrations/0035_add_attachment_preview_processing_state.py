@@ -0,0 +1,69 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0034_add_attachment_uploads"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="referralanswerattachment",
+            name="preview_claimed_at",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text="Time a worker started processing the attachment",
+                null=True,
+                verbose_name="preview claimed at",
+            ),
+        ),
+        migrations.AddField(
+            model_name="referralattachment",
+            name="preview_claimed_at",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text="Time a worker started processing the attachment",
+                null=True,
+                verbose_name="preview claimed at",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="referralanswerattachment",
+            name="preview_state",
+            field=models.CharField(
+                choices=[
+                    ("failed", "Failed"),
+                    ("pending", "Pending"),
+                    ("processing", "Processing"),
+                    ("ready", "Ready"),
+                    ("unsupported", "Unsupported"),
+                ],
+                default="pending",
+                help_text="Progress of the extraction of the preview of the attachment",
+                max_length=20,
+                verbose_name="preview state",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="referralattachment",
+            name="preview_state",
+            field=models.CharField(
+                choices=[
+                    ("failed", "Failed"),
+                    ("pending", "Pending"),
+                    ("processing", "Processing"),
+                    ("ready", "Ready"),
+                    ("unsupported", "Unsupported"),
+                ],
+                default="pending",
+                help_text="Progress of the extraction of the preview of the attachment",
+                max_length=20,
+                verbose_name="preview state",
+            ),
+        ),
+    ]
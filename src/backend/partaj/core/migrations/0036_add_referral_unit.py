@@ -0,0 +1,48 @@
+# Generated by Django 3.0.5 on 2026-10-18 05:50
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def forwards(apps, schema_editor):
+    """
+    Copy the unit of their topic on existing referrals.
+    """
+    Referral = apps.get_model("core", "Referral")
+    Topic = apps.get_model("core", "Topic")
+    Referral.objects.update(
+        unit=Subquery(Topic.objects.filter(id=OuterRef("topic")).values("unit"))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0035_add_attachment_preview_processing_state"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(model_name="referral", name="referral_topic_state_idx",),
+        migrations.AddField(
+            model_name="referral",
+            name="unit",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                help_text="Unit of the topic of the referral",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="core.Unit",
+                verbose_name="unit",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="referral",
+            index=models.Index(
+                fields=["unit", "created_at", "id"], name="referral_unit_created_idx"
+            ),
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
@@ -4,5 +4,6 @@ Make models.py a module containing one file per model as it was getting too long
 # flake8: noqa
 
 from .attachment import *
+from .email import *
 from .referral import *
 from .unit import *
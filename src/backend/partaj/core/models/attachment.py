@@ -2,10 +2,18 @@
 Attachment models for various objects. Grouped in a common file as they share and abstract
 base class.
 """
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+import hashlib
 import os
 import uuid
 
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, IntegerField, Value
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
@@ -17,6 +25,117 @@ def attachment_upload_to(attachment, filename):
     return f"{attachment.id}/{attachment.name}{file_extension}"
 
 
+def attachment_preview_upload_to(attachment, filename):
+    """
+    Helper that builds an object storage filename for the preview of an attachment, next to
+    the files uploaded for it.
+    """
+    return f"{attachment.id}/preview/{filename}"
+
+
+# Location of the blob files on the object storage
+BLOBS_PATH = "blobs"
+
+
+def blob_upload_to(blob, filename):
+    """
+    Helper that builds an object storage filename for the content of an attachment.
+    """
+    return f"{BLOBS_PATH}/{blob.sha256}/{filename}"
+
+
+class AttachmentBlob(models.Model):
+    """
+    Content of attachment files, stored once and shared by all the attachments with the same
+    content. Blobs keep count of the attachments that reference them and are garbage collected
+    by the `collect_attachment_blobs` command once they are no longer referenced.
+    """
+
+    # The hash of the content identifies the blob
+    sha256 = models.CharField(
+        verbose_name=_("SHA-256"),
+        help_text=_("Hash of the file content, as hexadecimal"),
+        primary_key=True,
+        max_length=64,
+    )
+    created_at = models.DateTimeField(verbose_name=_("created at"), auto_now_add=True)
+    updated_at = models.DateTimeField(verbose_name=_("updated at"), auto_now=True)
+
+    file = models.FileField(
+        upload_to=blob_upload_to, verbose_name=_("file"), max_length=300
+    )
+    size = models.IntegerField(
+        verbose_name=_("file size"), help_text=_("Blob file size in bytes"),
+    )
+    reference_count = models.PositiveIntegerField(
+        verbose_name=_("reference count"),
+        help_text=_("Number of attachments using this blob"),
+        default=0,
+    )
+
+    class Meta:
+        db_table = "partaj_attachment_blob"
+        # Support finding unreferenced blobs to collect
+        indexes = [
+            models.Index(
+                fields=["reference_count", "updated_at"], name="attachment_blob_gc_idx",
+            )
+        ]
+        verbose_name = _("attachment blob")
+
+    def __str__(self):
+        """
+        Get the string representation of an attachment blob.
+        """
+        return f"{self._meta.verbose_name.title()} {self.sha256}"
+
+
+class AttachmentUpload(models.Model):
+    """
+    File a user was allowed to upload directly to the object storage, until it is registered as
+    an attachment. Upload tokens are only accepted while their upload exists, and uploads that
+    are never registered are deleted along with their file by the `collect_attachment_uploads`
+    command once their token expired.
+    """
+
+    # The id reserved for the attachment identifies the upload
+    id = models.UUIDField(
+        verbose_name=_("id"),
+        help_text=_("Primary key reserved for the attachment as UUID"),
+        primary_key=True,
+        editable=False,
+    )
+    created_at = models.DateTimeField(verbose_name=_("created at"), auto_now_add=True)
+
+    key = models.CharField(
+        verbose_name=_("key"),
+        help_text=_("Name of the uploaded file on the object storage"),
+        max_length=300,
+    )
+
+    class Meta:
+        db_table = "partaj_attachment_upload"
+        # Support finding expired uploads to collect
+        indexes = [
+            models.Index(fields=["created_at"], name="attachment_upload_created_idx")
+        ]
+        verbose_name = _("attachment upload")
+
+    def __str__(self):
+        """
+        Get the string representation of an attachment upload.
+        """
+        return f"{self._meta.verbose_name.title()} {self.id}"
+
+
+class AttachmentPreviewState(models.TextChoices):
+    FAILED = "failed", _("Failed")
+    PENDING = "pending", _("Pending")
+    PROCESSING = "processing", _("Processing")
+    READY = "ready", _("Ready")
+    UNSUPPORTED = "unsupported", _("Unsupported")
+
+
 class Attachment(models.Model):
     """
     Generic base attachment. We use it to build all our actual attachment classes.
@@ -33,7 +152,18 @@ class Attachment(models.Model):
     created_at = models.DateTimeField(verbose_name=_("created at"), auto_now_add=True)
 
     # Actual file field — each attachment handles one file
-    file = models.FileField(upload_to=attachment_upload_to, verbose_name=_("file"))
+    file = models.FileField(
+        upload_to=attachment_upload_to, verbose_name=_("file"), max_length=300
+    )
+    # Shared content for the file, which is then stored under the blob's name
+    blob = models.ForeignKey(
+        AttachmentBlob,
+        verbose_name=_("blob"),
+        on_delete=models.PROTECT,
+        related_name="+",
+        blank=True,
+        null=True,
+    )
     name = models.CharField(
         verbose_name=_("name"),
         help_text=_("Name for the attachment, defaults to file name"),
@@ -47,6 +177,40 @@ class Attachment(models.Model):
         null=True,
     )
 
+    # Information extracted from the file in the background to help users identify it
+    preview_state = models.CharField(
+        verbose_name=_("preview state"),
+        help_text=_("Progress of the extraction of the preview of the attachment"),
+        max_length=20,
+        choices=AttachmentPreviewState.choices,
+        default=AttachmentPreviewState.PENDING,
+    )
+    preview_claimed_at = models.DateTimeField(
+        verbose_name=_("preview claimed at"),
+        help_text=_("Time a worker started processing the attachment"),
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    preview = models.FileField(
+        upload_to=attachment_preview_upload_to,
+        verbose_name=_("preview"),
+        help_text=_("Image of the first page of the attachment"),
+        max_length=300,
+        blank=True,
+    )
+    page_count = models.PositiveIntegerField(
+        verbose_name=_("page count"),
+        help_text=_("Number of pages in the attachment"),
+        blank=True,
+        null=True,
+    )
+    text = models.TextField(
+        verbose_name=_("text"),
+        help_text=_("Text extracted from the attachment"),
+        blank=True,
+    )
+
     class Meta:
         abstract = True
 
@@ -56,15 +220,35 @@ class Attachment(models.Model):
         instance.
         """
         if self._state.adding is True:
-            # Add size information when creating the attachment
-            self.size = self.file.size
-            # We want to use the file name as a default upon creation
-            if not self.name:
-                file_name, _ = os.path.splitext(self.file.name)
-                self.name = file_name
+            self.set_defaults()
         # Always delegate to the default behavior
         super().save(*args, **kwargs)
 
+    def set_defaults(self):
+        """
+        Add automatically generated information & defaults to a new instance. They are needed
+        to build the object storage filename, before the file is uploaded.
+        """
+        # Add size information when creating the attachment, unless it is already known
+        if self.size is None:
+            self.size = self.file.size
+        # We want to use the file name as a default upon creation
+        if not self.name:
+            file_name, _ = os.path.splitext(self.file.name)
+            self.name = file_name
+
+    def get_url(self):
+        """
+        Get the URL to the view that serves the attachment file after authorizing users.
+        """
+        return f"/{settings.ATTACHMENT_FILES_PATH}{self.id}/"
+
+    def get_preview_url(self):
+        """
+        Get the URL to the view that serves the preview image after authorizing users.
+        """
+        return f"/{settings.ATTACHMENT_FILES_PATH}{self.id}/preview/"
+
     def get_name_with_extension(self):
         """
         Return the name of the attachment, concatenated with the extension.
@@ -90,6 +274,13 @@ class ReferralAttachment(Attachment):
 
     class Meta:
         db_table = "partaj_referral_attachment"
+        # Support finding attachments to process in the background
+        indexes = [
+            models.Index(
+                fields=["preview_state", "created_at"],
+                name="referral_attachment_prev_idx",
+            )
+        ]
         verbose_name = _("referral attachment")
 
     def __str__(self):
@@ -115,6 +306,13 @@ class ReferralAnswerAttachment(Attachment):
 
     class Meta:
         db_table = "partaj_referral_answer_attachment"
+        # Support finding attachments to process in the background
+        indexes = [
+            models.Index(
+                fields=["preview_state", "created_at"],
+                name="answer_attachment_prev_idx",
+            )
+        ]
         verbose_name = _("referral answer attachment")
 
     def __str__(self):
@@ -122,3 +320,213 @@ class ReferralAnswerAttachment(Attachment):
         Get the string representation of a referral answer attachment.
         """
         return f"{self._meta.verbose_name.title()} - {self.id}"
+
+
+def get_attachment(attachment_id):
+    """
+    Get an attachment of any kind from its id in a single query, or None if it does not exist.
+    The ids of the requester and unit of the referral the attachment belongs to are added to
+    the attachment as `referral_user_id` and `referral_unit_id` for authorization checks.
+    """
+    # Attachment kinds with the path to their referral, in the order of their `kind` value
+    kinds = [
+        (ReferralAttachment, "referral"),
+        (ReferralAnswerAttachment, "referral_answer__referral"),
+    ]
+    # Fields shared by all attachment kinds, in the order of the models' concrete fields. The
+    # foreign keys to the owners of attachments do not match across kinds: they are deferred
+    field_names = ["id", "created_at", "file", "name", "size", "preview"]
+
+    queries = [
+        klass.objects.filter(id=attachment_id)
+        .annotate(
+            kind=Value(kind, output_field=IntegerField()),
+            referral_user_id=F(f"{referral_path}__user_id"),
+            referral_unit_id=F(f"{referral_path}__topic__unit_id"),
+        )
+        .values_list(*field_names, "kind", "referral_user_id", "referral_unit_id")
+        for kind, (klass, referral_path) in enumerate(kinds)
+    ]
+    row = next(iter(queries[0].union(*queries[1:])), None)
+    if row is None:
+        return None
+
+    *values, kind, referral_user_id, referral_unit_id = row
+    klass = kinds[kind][0]
+    attachment = klass.from_db(klass.objects.db, field_names, values)
+    attachment.referral_user_id = referral_user_id
+    attachment.referral_unit_id = referral_unit_id
+    return attachment
+
+
+def get_content_hash(file):
+    """
+    Get the SHA-256 hash of a file. Files uploaded to Partaj were hashed by the upload handlers
+    while they were received, others are read in chunks.
+    """
+    content_hash = getattr(file.file, "sha256", None)
+    if content_hash:
+        return content_hash
+
+    sha256 = hashlib.sha256()
+    for chunk in file.chunks():
+        sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def upload_attachment_file(attachment):
+    """
+    Upload the file of a new attachment to the object storage as a new blob, without saving the
+    blob or the attachment.
+    """
+    # The file was read to the end when it was hashed
+    attachment.file.seek(0)
+    # Use a new name for each upload, so concurrent uploads of the same content never overwrite
+    # each other's file
+    attachment.blob.file.save(
+        f"{attachment.id}/{os.path.basename(attachment.file.name)}",
+        attachment.file.file,
+        save=False,
+    )
+
+
+def save_attachments(attachments):
+    """
+    Save new attachments, storing each distinct content only once. Files are hashed and the new
+    contents uploaded concurrently in a bounded pool of threads, while contents that are
+    already stored are not transferred again.
+    Attachments are only written to the database, in a single transaction along with the
+    reference counts of their blobs, once all their files are stored. If anything fails, the
+    blob files that were uploaded are deleted and the error is raised. Contents whose blob was
+    collected after it was looked up are uploaded again.
+    Blob files uploaded in a transaction of the caller that is rolled back afterwards are left
+    unreferenced, until the `collect_attachment_blobs` command sweeps them.
+    """
+    if not attachments:
+        return
+
+    for attachment in attachments:
+        attachment.set_defaults()
+    # Files uploaded directly to the object storage are already stored under their own name
+    new_attachments = [
+        attachment for attachment in attachments if not attachment.file._committed
+    ]
+    uploaded_ids = [
+        attachment.id for attachment in attachments if attachment.file._committed
+    ]
+
+    # Blobs whose file was uploaded by this call, to delete if they end up unused
+    uploaded_blobs = []
+    duplicate_blobs = []
+    try:
+        with ThreadPoolExecutor(
+            max_workers=settings.ATTACHMENT_UPLOAD_MAX_WORKERS
+        ) as executor:
+            hashes = list(
+                executor.map(
+                    lambda attachment: get_content_hash(attachment.file),
+                    new_attachments,
+                )
+            )
+            blobs = AttachmentBlob.objects.in_bulk(hashes)
+
+            while True:
+                # Link attachments to their blob, uploading new ones for unknown contents
+                uploads = []
+                for attachment, sha256 in zip(new_attachments, hashes):
+                    if sha256 not in blobs:
+                        blobs[sha256] = AttachmentBlob(
+                            sha256=sha256, size=attachment.size
+                        )
+                        uploads.append(attachment)
+                    attachment.blob = blobs[sha256]
+
+                futures = [
+                    executor.submit(upload_attachment_file, attachment)
+                    for attachment in uploads
+                ]
+                wait(futures)
+                uploaded_blobs.extend(
+                    attachment.blob
+                    for attachment, future in zip(uploads, futures)
+                    if future.exception() is None
+                )
+                for future in futures:
+                    future.result()
+
+                with transaction.atomic():
+                    # Lock the known blobs so they cannot be collected until they are
+                    # referenced
+                    known_hashes = {
+                        sha256
+                        for sha256, blob in blobs.items()
+                        if not blob._state.adding
+                    }
+                    collected_hashes = known_hashes - set(
+                        AttachmentBlob.objects.select_for_update()
+                        .filter(sha256__in=known_hashes)
+                        .values_list("sha256", flat=True)
+                        if known_hashes
+                        else ()
+                    )
+                    if not collected_hashes:
+                        save_blobs_and_attachments(
+                            attachments,
+                            new_attachments,
+                            hashes,
+                            blobs,
+                            uploaded_ids,
+                            duplicate_blobs,
+                        )
+                        break
+
+                # Blobs collected since they were looked up: upload their contents again
+                for sha256 in collected_hashes:
+                    del blobs[sha256]
+    except Exception:
+        duplicate_blobs = uploaded_blobs
+        raise
+    finally:
+        for blob in duplicate_blobs:
+            blob.file.delete(save=False)
+
+
+def save_blobs_and_attachments(
+    attachments, new_attachments, hashes, blobs, uploaded_ids, duplicate_blobs
+):
+    """
+    Count the references to the blobs of new attachments, creating the blobs that were
+    uploaded, then save all the attachments. Blobs uploaded for a content that was stored
+    concurrently are added to the duplicates, so their file can be deleted.
+    """
+    for sha256, count in Counter(hashes).items():
+        if AttachmentBlob.objects.filter(sha256=sha256).update(
+            reference_count=F("reference_count") + count, updated_at=timezone.now(),
+        ):
+            if blobs[sha256]._state.adding:
+                # The same content was stored concurrently: use the stored blob
+                duplicate_blobs.append(blobs[sha256])
+                blobs[sha256] = AttachmentBlob.objects.get(sha256=sha256)
+        else:
+            blobs[sha256].reference_count = count
+            blobs[sha256].save(force_insert=True)
+    for attachment, sha256 in zip(new_attachments, hashes):
+        attachment.blob = blobs[sha256]
+        attachment.file = attachment.blob.file.name
+    # Registered uploads are no longer pending, their tokens cannot be used again
+    AttachmentUpload.objects.filter(id__in=uploaded_ids).delete()
+    for attachment in attachments:
+        attachment.save()
+
+
+@receiver(post_delete, sender=ReferralAttachment)
+@receiver(post_delete, sender=ReferralAnswerAttachment)
+def release_blob(sender, instance, **kwargs):
+    """
+    Release the blob of an attachment when it is deleted, so it can be collected once it is
+    no longer used.
+    """
+    if instance.blob_id:
+        AttachmentBlob.objects.filter(sha256=instance.blob_id).update(
+            reference_count=F("reference_count") - 1, updated_at=timezone.now()
+        )
@@ -0,0 +1,82 @@
+"""
+Email outbox model in our core app.
+"""
+import uuid
+
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+class OutgoingEmailState(models.TextChoices):
+    FAILED = "failed", _("Failed")
+    PENDING = "pending", _("Pending")
+    SENDING = "sending", _("Sending")
+    SENT = "sent", _("Sent")
+
+
+class OutgoingEmail(models.Model):
+    """
+    Transactional email waiting to be sent to our email provider. Emails are written to this
+    outbox in the same transaction as the changes that trigger them and actually sent by the
+    `send_emails` management command, so requests never wait on the email provider.
+    """
+
+    # Generic fields to build up minimal data on any email
+    id = models.UUIDField(
+        verbose_name=_("id"),
+        help_text=_("Primary key for the outgoing email as UUID"),
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False,
+    )
+    created_at = models.DateTimeField(verbose_name=_("created at"), auto_now_add=True)
+    updated_at = models.DateTimeField(verbose_name=_("updated at"), auto_now=True)
+
+    # Body of the call to the email provider's send email endpoint, as JSON
+    payload = models.TextField(
+        verbose_name=_("payload"),
+        help_text=_("JSON body of the request to the email provider"),
+    )
+
+    # Delivery tracking
+    state = models.CharField(
+        verbose_name=_("state"),
+        help_text=_("Delivery status for this email"),
+        max_length=20,
+        choices=OutgoingEmailState.choices,
+        default=OutgoingEmailState.PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(
+        verbose_name=_("attempts"),
+        help_text=_("Number of failed attempts to send this email"),
+        default=0,
+    )
+    send_after = models.DateTimeField(
+        verbose_name=_("send after"),
+        help_text=_(
+            "Date after which the next attempt to send this email can be made, or after "
+            "which a worker that claimed it is considered gone"
+        ),
+        default=timezone.now,
+    )
+    sent_at = models.DateTimeField(verbose_name=_("sent at"), blank=True, null=True,)
+    last_error = models.TextField(
+        verbose_name=_("last error"),
+        help_text=_("Error from the last failed attempt to send this email"),
+        blank=True,
+    )
+
+    class Meta:
+        db_table = "partaj_outgoing_email"
+        # Support fetching the next batch of emails to send
+        indexes = [
+            models.Index(
+                fields=["state", "send_after"], name="outgoing_email_state_idx"
+            )
+        ]
+        verbose_name = _("outgoing email")
+
+    def __str__(self):
+        """Get the string representation of an outgoing email."""
+        return f"{self._meta.verbose_name.title()} — {self.id}"
@@ -6,14 +6,18 @@ import uuid
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 
 from django_fsm import FSMField, RETURN_VALUE, transition
 
 from ..email import Mailer
-from .attachment import ReferralAnswerAttachment
-from .unit import Topic
+from .attachment import ReferralAnswerAttachment, save_attachments
+from .unit import Topic, Unit
 
 
 class ReferralState(models.TextChoices):
@@ -24,6 +28,14 @@ class ReferralState(models.TextChoices):
     ANSWERED = "answered", _("Answered")
 
 
+# States in which a referral still has to be handled by its unit
+OPEN_REFERRAL_STATES = [
+    ReferralState.RECEIVED,
+    ReferralState.ASSIGNED,
+    ReferralState.INCOMPLETE,
+]
+
+
 class ReferralUrgency(models.Model):
     """
     Referral urgency model.
@@ -55,6 +67,20 @@ class ReferralUrgency(models.Model):
         return f"{self._meta.verbose_name.title()}: {self.name}"
 
 
+class ReferralManager(models.Manager):
+    """
+    Leave the search vector out of referrals loaded from the database: it is only needed by
+    search queries, and saving a referral must not write back a vector that was updated since
+    the referral was loaded.
+    """
+
+    def get_queryset(self):
+        """
+        Defer the search vector on all referral querysets, including related managers.
+        """
+        return super().get_queryset().defer("search_vector")
+
+
 class Referral(models.Model):
     """
     Our main model. Here we modelize what a Referral is in the first place and provide other
@@ -105,6 +131,18 @@ class Referral(models.Model):
         to=Topic,
         on_delete=models.PROTECT,
     )
+    # Unit of the topic, copied on the referral so the lists of a unit are read in order from
+    # an index
+    unit = models.ForeignKey(
+        verbose_name=_("unit"),
+        help_text=_("Unit of the topic of the referral"),
+        to=Unit,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        blank=True,
+        null=True,
+        editable=False,
+    )
     urgency = models.CharField(
         verbose_name=_("urgency"),
         help_text=_("Urgency level. When do you need the referral?"),
@@ -157,14 +195,77 @@ class Referral(models.Model):
         help_text=_("What research did you already perform before the referral?"),
     )
 
+    # Full-text search document, maintained by `partaj.core.search` when the referral, its
+    # topic, answers or attachments change
+    search_vector = SearchVectorField(
+        verbose_name=_("search vector"), blank=True, null=True, editable=False
+    )
+
+    objects = ReferralManager()
+
     class Meta:
         db_table = "partaj_referral"
+        # Support keyset pagination on referral lists
+        indexes = [
+            models.Index(
+                fields=["created_at", "id"], name="referral_created_at_id_idx"
+            ),
+            # Support paginating the referrals of a unit, most recent first
+            models.Index(
+                fields=["unit", "created_at", "id"], name="referral_unit_created_idx",
+            ),
+            # Support full-text search on referrals
+            GinIndex(fields=["search_vector"], name="referral_search_vector_idx"),
+        ]
         verbose_name = _("referral")
 
     def __str__(self):
         """Get the string representation of a referral."""
         return f"{self._meta.verbose_name.title()} #{self.id}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remember the topic referrals are loaded with, to copy the unit of their topic again
+        only when it changes.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._saved_topic_id = instance.__dict__.get("topic_id")
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Override the default save to copy the unit of the topic on new referrals and referrals
+        that change topic. Other saves leave the unit alone, as it is updated in the database
+        when topics move to another unit.
+        """
+        if not self._state.adding and not kwargs.get("force_insert"):
+            update_fields = kwargs.get("update_fields")
+            if update_fields is None:
+                deferred_fields = self.get_deferred_fields()
+                update_fields = [
+                    field.name
+                    for field in self._meta.concrete_fields
+                    if not field.primary_key and field.attname not in deferred_fields
+                ]
+            update_fields = [name for name in update_fields if name != "unit"]
+            if (
+                "topic" in update_fields
+                and getattr(self, "_saved_topic_id", None) != self.topic_id
+            ):
+                update_fields.append("unit")
+            kwargs["update_fields"] = update_fields
+        if self._state.adding or "unit" in kwargs.get("update_fields", []):
+            self.unit_id = (
+                self.topic.unit_id
+                if Referral.topic.is_cached(self)
+                else Topic.objects.filter(id=self.topic_id)
+                .values_list("unit", flat=True)
+                .first()
+            )
+        super().save(*args, **kwargs)
+        self._saved_topic_id = self.topic_id
+
     def get_human_state(self):
         """
         Get the human readable, localized label for the current state of the Referral.
@@ -193,17 +294,23 @@ class Referral(models.Model):
         source=[ReferralState.ASSIGNED, ReferralState.RECEIVED],
         target=ReferralState.ANSWERED,
     )
-    def answer(self, content, attachments, created_by):
+    def answer(self, content, attachments, created_by, uploaded_attachments=()):
         """
-        Bring an answer to the referral, marking it as donee.
+        Bring an answer to the referral, marking it as donee. Files can be attached as
+        uploaded files, or as attachments whose files were uploaded directly to the storage.
         """
         answer = ReferralAnswer.objects.create(
             content=content, created_by=created_by, referral=self,
         )
-        for file in attachments:
-            ReferralAnswerAttachment.objects.create(
-                file=file, referral_answer=answer,
-            )
+        for attachment in uploaded_attachments:
+            attachment.referral_answer = answer
+        save_attachments(
+            [
+                ReferralAnswerAttachment(file=file, referral_answer=answer)
+                for file in attachments
+            ]
+            + list(uploaded_attachments)
+        )
 
         ReferralActivity.objects.create(
             actor=created_by,
@@ -281,6 +388,17 @@ class Referral(models.Model):
         )
 
 
+@receiver(post_save, sender=Topic)
+def update_referrals_unit(sender, instance, created, **kwargs):
+    """
+    Referrals follow their topic when it is moved to another unit.
+    """
+    if not created:
+        Referral.objects.filter(topic=instance.id).exclude(
+            unit=instance.unit_id
+        ).update(unit=instance.unit_id)
+
+
 class ReferralAssignment(models.Model):
     # Generic fields to build up minimal data on any assignment
     id = models.AutoField(
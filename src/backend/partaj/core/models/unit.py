@@ -15,6 +15,34 @@ class UnitMembershipRole(models.TextChoices):
     OWNER = "owner", _("Owner")
 
 
+class CountersMixin:
+    """
+    Keep the counters maintained by `partaj.core.counters` out of ordinary saves. They are
+    only written by relative updates: saving an instance loaded before one of them would
+    otherwise write back a stale value.
+    """
+
+    counter_fields = []
+
+    def save(self, *args, **kwargs):
+        """
+        Only write the other fields of existing rows, the counters are written on creation.
+        """
+        if not self._state.adding and not kwargs.get("force_insert"):
+            update_fields = kwargs.get("update_fields")
+            if update_fields is None:
+                deferred_fields = self.get_deferred_fields()
+                update_fields = [
+                    field.name
+                    for field in self._meta.concrete_fields
+                    if not field.primary_key and field.attname not in deferred_fields
+                ]
+            kwargs["update_fields"] = [
+                name for name in update_fields if name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
 class Unit(models.Model):
     """
     A unit is a group of people who own one or several topics.
@@ -70,7 +98,7 @@ class Unit(models.Model):
         )
 
 
-class UnitMembership(models.Model):
+class UnitMembership(CountersMixin, models.Model):
     """
     Explicit ManyToMany association table to manage user memberships to units.
     """
@@ -108,6 +136,16 @@ class UnitMembership(models.Model):
         default=UnitMembershipRole.MEMBER,
     )
 
+    # Number of assignments of the user on open referrals of the unit, kept up to date by
+    # `partaj.core.counters`
+    active_assignment_count = models.PositiveIntegerField(
+        verbose_name=_("active assignment count"),
+        help_text=_("Number of open referrals of the unit assigned to the user"),
+        default=0,
+        editable=False,
+    )
+    counter_fields = ["active_assignment_count"]
+
     class Meta:
         db_table = "partaj_unitmembership"
         unique_together = [["unit", "user"]]
@@ -120,7 +158,7 @@ class UnitMembership(models.Model):
         return UnitMembershipRole(self.role).label
 
 
-class Topic(models.Model):
+class Topic(CountersMixin, models.Model):
     """
     We use topics as user-friendly ways to direct users to the right unit that can handle their
     referral.
@@ -148,6 +186,21 @@ class Topic(models.Model):
         max_length=255,
     )
 
+    # Number of referrals on the topic, kept up to date by `partaj.core.counters`
+    referral_count = models.PositiveIntegerField(
+        verbose_name=_("referral count"),
+        help_text=_("Number of referrals on this topic"),
+        default=0,
+        editable=False,
+    )
+    open_referral_count = models.PositiveIntegerField(
+        verbose_name=_("open referral count"),
+        help_text=_("Number of referrals on this topic that are yet to be handled"),
+        default=0,
+        editable=False,
+    )
+    counter_fields = ["referral_count", "open_referral_count"]
+
     class Meta:
         db_table = "partaj_topic"
         verbose_name = _("topic")
@@ -0,0 +1,175 @@
+"""
+Extract previews, page counts and text from attachment files, so users can identify documents
+without downloading them. Files are processed in the background by the `process_attachments`
+management command, with tools installed on the system: poppler-utils for PDF files and
+ImageMagick for images.
+"""
+from collections import namedtuple
+from functools import partial
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+
+from .models import AttachmentPreviewState
+
+logger = logging.getLogger("partaj")
+
+# What we learned from a file: a PNG image of its first page, if any, its page count and text
+Preview = namedtuple("Preview", ["image", "page_count", "text"])
+
+PDF_PAGES_RE = re.compile(r"^Pages:\s+(\d+)\s*$", re.MULTILINE)
+
+
+def run_tool(*args):
+    """
+    Run a command line tool and get its output, raising if it fails or takes too long.
+    """
+    return subprocess.run(
+        args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True,
+        timeout=settings.ATTACHMENT_PREVIEW_TIMEOUT,
+    ).stdout
+
+
+def process_pdf(path):
+    """
+    Render the first page of a PDF file and extract its page count and text.
+    """
+    info = run_tool("pdfinfo", path).decode("utf-8", errors="replace")
+    match = PDF_PAGES_RE.search(info)
+    image = run_tool(
+        "pdftoppm",
+        "-png",
+        "-singlefile",
+        "-f",
+        "1",
+        "-scale-to-x",
+        str(settings.ATTACHMENT_PREVIEW_WIDTH),
+        "-scale-to-y",
+        "-1",
+        path,
+    )
+    text = run_tool("pdftotext", "-enc", "UTF-8", path, "-")
+    return Preview(
+        image=image,
+        page_count=int(match.group(1)) if match else None,
+        text=text.decode("utf-8", errors="replace"),
+    )
+
+
+def process_image(path, coder):
+    """
+    Render a thumbnail of an image, of its first frame for animated images. The image is read
+    with the coder of its expected type, so ImageMagick never guesses another format from the
+    content of the file.
+    """
+    width = settings.ATTACHMENT_PREVIEW_WIDTH
+    image = run_tool(
+        "convert", f"{coder}:{path}[0]", "-thumbnail", f"{width}x>", "png:-"
+    )
+    return Preview(image=image, page_count=1, text="")
+
+
+def process_text(path):
+    """
+    Extract the text of a plain text file.
+    """
+    with open(path, "rb") as file:
+        text = file.read(settings.ATTACHMENT_PREVIEW_TEXT_MAX_LENGTH * 4)
+    return Preview(image=None, page_count=None, text=text.decode("utf-8", "replace"))
+
+
+# Processors for each content type we support, with the tools they need
+PROCESSORS = {
+    "application/pdf": (process_pdf, ["pdfinfo", "pdftoppm", "pdftotext"]),
+    "image/gif": (partial(process_image, coder="gif"), ["convert"]),
+    "image/jpeg": (partial(process_image, coder="jpeg"), ["convert"]),
+    "image/png": (partial(process_image, coder="png"), ["convert"]),
+    "image/tiff": (partial(process_image, coder="tiff"), ["convert"]),
+    "text/plain": (process_text, []),
+}
+
+
+def get_processor(attachment):
+    """
+    Get the function that processes the file of an attachment, or None if its content type
+    is not supported or the tools it needs are not installed.
+    """
+    content_type, _ = mimetypes.guess_type(attachment.get_name_with_extension())
+    processor, tools = PROCESSORS.get(content_type, (None, []))
+    if processor and all(shutil.which(tool) for tool in tools):
+        return processor
+    return None
+
+
+def set_preview_state(attachment, state):
+    """
+    Record the preview state of an attachment, without failing if it was deleted meanwhile.
+    """
+    attachment.preview_state = state
+    attachment.__class__.objects.filter(id=attachment.id).update(preview_state=state)
+
+
+def save_preview(attachment, preview):
+    """
+    Save the preview, page count and text extracted from an attachment. The preview image is
+    stored first and deleted if the attachment cannot be saved, so no image is left behind.
+    """
+    if preview.image:
+        attachment.preview.save("preview.png", ContentFile(preview.image), save=False)
+    attachment.page_count = preview.page_count
+    # Databases do not store NUL characters in text columns
+    attachment.text = preview.text.replace("\x00", "")[
+        : settings.ATTACHMENT_PREVIEW_TEXT_MAX_LENGTH
+    ]
+    attachment.preview_state = AttachmentPreviewState.READY
+    try:
+        with transaction.atomic():
+            attachment.save(
+                update_fields=["preview_state", "preview", "page_count", "text"]
+            )
+    except Exception:
+        if preview.image:
+            attachment.preview.delete(save=False)
+        raise
+
+
+def process_attachment(attachment):
+    """
+    Extract the preview, page count and text of an attachment and save them. The file is
+    copied to a temporary file for the tools to read it, as it usually lives in an object
+    storage. Any error is logged and marks the attachment as failed, so one attachment never
+    stops the others from being processed.
+    """
+    processor = get_processor(attachment)
+    if processor is None:
+        set_preview_state(attachment, AttachmentPreviewState.UNSUPPORTED)
+        return
+
+    _, extension = os.path.splitext(attachment.file.name)
+    try:
+        with tempfile.NamedTemporaryFile(suffix=extension) as copy:
+            with attachment.file.open("rb") as file:
+                shutil.copyfileobj(file, copy)
+            copy.flush()
+            preview = processor(copy.name)
+        save_preview(attachment, preview)
+    except Exception as error:  # pylint: disable=broad-except
+        # Tools failing on broken files are expected, other errors are not
+        log = (
+            logger.warning
+            if isinstance(error, (OSError, subprocess.SubprocessError))
+            else logger.exception
+        )
+        log("Failed to process attachment %s: %s", attachment.id, error)
+        set_preview_state(attachment, AttachmentPreviewState.FAILED)
@@ -0,0 +1,42 @@
+"""
+Keep track of the reference data every referral form loads: topics and urgency levels. They
+rarely change, so the API serves them from the cache with validators and clients revalidate
+their copy instead of downloading them again. Cached lists are versioned like page fragments,
+and their versions are dropped when topics, units or urgency levels change.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .fragments import get_version, invalidate
+from .models import ReferralUrgency, Topic, Unit
+
+REFERENCE_DATA = "reference-data"
+TOPICS = "topics"
+URGENCIES = "urgencies"
+
+
+def get_reference_data_version(name):
+    """
+    Get the current version of a list of reference data.
+    """
+    return get_version(REFERENCE_DATA, name)
+
+
+@receiver(post_save, sender=Topic)
+@receiver(post_delete, sender=Topic)
+@receiver(post_save, sender=Unit)
+@receiver(post_delete, sender=Unit)
+def invalidate_topics(sender, instance, **kwargs):
+    """
+    Topics are listed with the name of their unit.
+    """
+    invalidate(REFERENCE_DATA, [TOPICS])
+
+
+@receiver(post_save, sender=ReferralUrgency)
+@receiver(post_delete, sender=ReferralUrgency)
+def invalidate_urgencies(sender, instance, **kwargs):
+    """
+    Urgency levels are listed in full.
+    """
+    invalidate(REFERENCE_DATA, [URGENCIES])
@@ -0,0 +1,259 @@
+"""
+Search referrals with PostgreSQL full-text search. Each referral keeps a search vector built
+from its question, context, prior work, requester, the name of its topic, the content of its
+answers and the text extracted from its attachments, stemmed with the French configuration and
+covered by a GIN index. Vectors are updated from the write paths of these objects once their
+transaction is committed, so searching never parses documents and only ranks the referrals
+that match.
+
+Other databases do not support full-text search: vectors are not maintained there and the
+search API is disabled.
+"""
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection, transaction
+from django.db.models import F, Func, OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Coalesce, Concat
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils.html import escape
+
+from .models import (
+    Referral,
+    ReferralAnswer,
+    ReferralAnswerAttachment,
+    ReferralAttachment,
+    Topic,
+)
+
+SEARCH_CONFIG = "french"
+
+# Referral fields included in the search vector
+SEARCHED_FIELDS = ["question", "context", "prior_work", "requester", "topic_id"]
+
+# Matched words are delimited with private use characters in headlines, then replaced with
+# tags once the rest of the headline is escaped
+HEADLINE_START = "\ue000"
+HEADLINE_STOP = "\ue001"
+HEADLINE_OPTIONS = (
+    f"StartSel={HEADLINE_START}, StopSel={HEADLINE_STOP}, "
+    'MaxFragments=2, MaxWords=30, MinWords=10, FragmentDelimiter=" … "'
+)
+
+
+class SearchHeadline(Func):
+    """
+    Highlight the words of a document that match a search query, with `ts_headline`, which
+    Django does not expose before version 3.1.
+    """
+
+    function = "ts_headline"
+    template = f"%(function)s('{SEARCH_CONFIG}'::regconfig, %(expressions)s)"
+    output_field = TextField()
+
+
+def is_search_enabled():
+    """
+    Full-text search requires PostgreSQL.
+    """
+    return connection.vendor == "postgresql"
+
+
+def aggregate_text(queryset, field, group_by):
+    """
+    Build a subquery joining the texts of a related queryset, NULL if there are none.
+    """
+    return Subquery(
+        queryset.order_by()
+        .values(group_by)
+        .annotate(text=StringAgg(field, delimiter="\n"))
+        .values("text")
+    )
+
+
+def get_answers_text():
+    """
+    Build a subquery joining the content of the answers of a referral.
+    """
+    return aggregate_text(
+        ReferralAnswer.objects.filter(referral=OuterRef("pk")), "content", "referral"
+    )
+
+
+def get_search_vector():
+    """
+    Build the search vector of a referral. Words are weighted by where they appear, from the
+    question and topic name down to the text of attachments, so ranking favors referrals that
+    are about the search terms over those that only mention them.
+    """
+    topic_name = Subquery(Topic.objects.filter(id=OuterRef("topic")).values("name"))
+    attachments_text = aggregate_text(
+        ReferralAttachment.objects.filter(referral=OuterRef("pk")), "text", "referral"
+    )
+    answer_attachments_text = aggregate_text(
+        ReferralAnswerAttachment.objects.filter(
+            referral_answer__referral=OuterRef("pk")
+        ),
+        "text",
+        "referral_answer__referral",
+    )
+    return (
+        SearchVector("question", topic_name, config=SEARCH_CONFIG, weight="A")
+        + SearchVector("context", "requester", config=SEARCH_CONFIG, weight="B")
+        + SearchVector(
+            "prior_work", get_answers_text(), config=SEARCH_CONFIG, weight="C"
+        )
+        + SearchVector(
+            attachments_text, answer_attachments_text, config=SEARCH_CONFIG, weight="D",
+        )
+    )
+
+
+def update_search_vectors(referral_ids):
+    """
+    Update the search vectors of some referrals, from a list of ids or a queryset of ids, in a
+    single query.
+    """
+    if is_search_enabled():
+        Referral.objects.filter(id__in=referral_ids).update(
+            search_vector=get_search_vector()
+        )
+
+
+def schedule_search_vectors_update(referral_ids):
+    """
+    Update the search vectors of some referrals once the current transaction is committed, or
+    right away outside of transactions. Writes are not slowed down by parsing documents, and
+    nothing is done for transactions that are rolled back.
+    Vectors changed by other means can be rebuilt with the `rebuild_search_vectors` command.
+    """
+    transaction.on_commit(lambda: update_search_vectors(referral_ids))
+
+
+def search_referrals(queryset, text):
+    """
+    Filter referrals matching a search text, ordered by relevance, with a headline of the
+    matching parts of their question, context, prior work and answers.
+    """
+    query = SearchQuery(text, config=SEARCH_CONFIG)
+    document = Concat(
+        "question",
+        Value("\n"),
+        "context",
+        Value("\n"),
+        "prior_work",
+        Value("\n"),
+        Coalesce(get_answers_text(), Value("")),
+        output_field=TextField(),
+    )
+    # PostgreSQL computes costly functions like `ts_headline` after sorting and limiting
+    # results, so headlines are only built for the referrals that are returned
+    return (
+        queryset.filter(search_vector=query)
+        .annotate(
+            rank=SearchRank(F("search_vector"), query),
+            headline=SearchHeadline(document, query, Value(HEADLINE_OPTIONS)),
+        )
+        .order_by("-rank", "-created_at", "-id")
+    )
+
+
+def format_headline(headline):
+    """
+    Escape a headline and mark the matching words.
+    """
+    return (
+        escape(headline)
+        .replace(HEADLINE_START, "<mark>")
+        .replace(HEADLINE_STOP, "</mark>")
+    )
+
+
+@receiver(post_init, sender=Referral)
+@receiver(post_init, sender=Topic)
+def remember_searched_values(sender, instance, **kwargs):
+    """
+    Remember the values of the searched fields as they were loaded, to only update search
+    vectors when they change. Deferred fields are left out so they are not loaded.
+    """
+    fields = SEARCHED_FIELDS if sender is Referral else ["name"]
+    instance._searched_values = {
+        field: instance.__dict__[field]
+        for field in fields
+        if field in instance.__dict__
+    }
+
+
+def have_searched_values_changed(instance, created, update_fields):
+    """
+    Check whether a saved referral or topic changed any of the values in search vectors, and
+    remember the saved values for later saves. Values missing from the previous ones, like
+    deferred fields, are considered changed.
+    """
+    previous = instance._searched_values
+    remember_searched_values(instance.__class__, instance)
+    saved = instance._searched_values
+    if update_fields is not None:
+        update_fields = {
+            instance._meta.get_field(name).attname for name in update_fields
+        }
+        saved = {field: saved[field] for field in update_fields.intersection(saved)}
+        instance._searched_values = {**previous, **saved}
+    return created or any(
+        field not in previous or previous[field] != value
+        for field, value in saved.items()
+    )
+
+
+@receiver(post_save, sender=Referral)
+def update_referral_search_vector(sender, instance, created, update_fields, **kwargs):
+    """
+    Referrals are indexed when they are created, and when searched fields change. Transitions
+    only change their state and leave their vector alone.
+    """
+    if have_searched_values_changed(instance, created, update_fields):
+        schedule_search_vectors_update([instance.id])
+
+
+@receiver(post_save, sender=Topic)
+def update_topic_search_vectors(sender, instance, created, update_fields, **kwargs):
+    """
+    Topic names are included in the vectors of all their referrals.
+    """
+    if not created and have_searched_values_changed(instance, created, update_fields):
+        schedule_search_vectors_update(
+            Referral.objects.filter(topic=instance.id).values_list("id", flat=True)
+        )
+
+
+@receiver(post_save, sender=ReferralAnswer)
+@receiver(post_delete, sender=ReferralAnswer)
+def update_answer_search_vector(sender, instance, **kwargs):
+    """
+    Answers are included in the vector of their referral.
+    """
+    schedule_search_vectors_update([instance.referral_id])
+
+
+@receiver(post_save, sender=ReferralAttachment)
+@receiver(post_save, sender=ReferralAnswerAttachment)
+@receiver(post_delete, sender=ReferralAttachment)
+@receiver(post_delete, sender=ReferralAnswerAttachment)
+def update_attachment_search_vector(sender, instance, update_fields=None, **kwargs):
+    """
+    Text is extracted from attachments after they are created, in the background: only
+    update vectors when there is text to add or remove, or when the text is updated.
+    """
+    if update_fields is None and not instance.text:
+        return
+    if update_fields is not None and "text" not in update_fields:
+        return
+    if sender is ReferralAttachment:
+        referral_ids = [instance.referral_id]
+    elif ReferralAnswerAttachment.referral_answer.is_cached(instance):
+        referral_ids = [instance.referral_answer.referral_id]
+    else:
+        referral_ids = ReferralAnswer.objects.filter(
+            id=instance.referral_answer_id
+        ).values_list("referral", flat=True)
+    schedule_search_vectors_update(referral_ids)
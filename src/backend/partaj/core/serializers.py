@@ -6,6 +6,88 @@ from rest_framework import serializers
 
 from partaj.users.models import User
 from . import models
+from .search import format_headline
+
+# Number of characters of the text extracted from attachments sent to clients
+EXCERPT_LENGTH = 300
+
+
+def get_sparse_fieldsets(request):
+    """
+    Read the sparse fieldsets query parameters from a request. Return None when the client did
+    not ask for specific fields, or a tuple with the set of requested fields and the set of
+    fields to expand.
+    """
+    if request is None or not request.query_params.get("fields"):
+        return None
+
+    def get_names(param):
+        return {
+            name.strip()
+            for name in request.query_params.get(param, "").split(",")
+            if name.strip()
+        }
+
+    return get_names("fields"), get_names("expand")
+
+
+def is_field_rendered(request, name):
+    """
+    Whether a field of the root serializer is rendered in the response to a request.
+    """
+    sparse_fieldsets = get_sparse_fieldsets(request)
+    return sparse_fieldsets is None or name in sparse_fieldsets[0]
+
+
+def is_field_expanded(request, name):
+    """
+    Whether a nested object of the root serializer is rendered in full in the response
+    to a request.
+    """
+    sparse_fieldsets = get_sparse_fieldsets(request)
+    return sparse_fieldsets is None or (
+        name in sparse_fieldsets[0] and name in sparse_fieldsets[1]
+    )
+
+
+class SparseFieldsetsMixin:
+    """
+    Let API clients choose which fields they need on the root serializer of a response with
+    query parameters:
+    - `fields`: comma-separated list of fields to render. All fields are rendered by default;
+    - `expand`: comma-separated list of nested objects to render in full when `fields` is used.
+      Nested objects that are listed in `fields` but not in `expand` are collapsed to their
+      primary key(s).
+    """
+
+    def get_fields(self):
+        """
+        Filter and collapse fields according to the sparse fieldsets in the request.
+        """
+        fields = super().get_fields()
+
+        # Nested serializers always render all their fields, only the root serializer (or the
+        # child of the root list serializer) reads the query parameters.
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        sparse_fieldsets = get_sparse_fieldsets(self.context.get("request"))
+        if parent is not None or sparse_fieldsets is None:
+            return fields
+
+        requested, expanded = sparse_fieldsets
+        for name in list(fields):
+            field = fields[name]
+            if name not in requested:
+                del fields[name]
+            elif name not in expanded and isinstance(field, serializers.BaseSerializer):
+                fields[name] = serializers.PrimaryKeyRelatedField(
+                    many=isinstance(field, serializers.ListSerializer),
+                    read_only=True,
+                    **({"source": field.source} if field.source else {}),
+                )
+
+        return fields
 
 
 class ReferralActivityItemField(serializers.RelatedField):
@@ -82,19 +164,27 @@ class UnitMemberSerializer(serializers.ModelSerializer):
         """
         self.unit = kwargs.pop("unit")
         super(UnitMemberSerializer, self).__init__(*args, **kwargs)
+        # Reuse one membership serializer for all members instead of building its fields
+        # again for each of them
+        self.membership_serializer = UnitMembershipSerializer()
 
     def get_membership(self, member):
         """
         Get the one membership for this user that links them with this unit. Unicity is guaranteed
-        by a database constraint defined on the model, so we can safely use "get" here and be sure
-        we do not miss anything.
+        by a database constraint defined on the model, so we can safely pick the first match and be
+        sure we do not miss anything.
+        We iterate over `all()` instead of filtering in the database so memberships can be
+        prefetched along with unit members.
         """
-        return UnitMembershipSerializer(
-            member.unitmembership_set.get(unit=self.unit)
-        ).data
+        membership = next(
+            membership
+            for membership in member.unitmembership_set.all()
+            if str(membership.unit_id) == str(self.unit)
+        )
+        return self.membership_serializer.to_representation(membership)
 
 
-class UnitSerializer(serializers.ModelSerializer):
+class UnitSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """
     Unit serializer. Override default members to make use of the UnitMemberSerializer.
     """
@@ -108,14 +198,12 @@ class UnitSerializer(serializers.ModelSerializer):
     def get_members(self, unit):
         """
         Pass the unit id as an additional keyword argument to the unit member serializer.
+        Serialize all members with one list serializer so fields are only built once.
         """
-        return [
-            UnitMemberSerializer(member, unit=unit.id).data
-            for member in unit.members.all()
-        ]
+        return UnitMemberSerializer(unit.members.all(), many=True, unit=unit.id).data
 
 
-class TopicSerializer(serializers.ModelSerializer):
+class TopicSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """
     Topic serializer. Passthrough that allows us to more precisely specify downstream serializers,
     including unit, members and memberships.
@@ -128,6 +216,25 @@ class TopicSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class TopicSummarySerializer(serializers.ModelSerializer):
+    """
+    Compact topic serializer for lists of topics. Only includes what is necessary to pick a
+    topic, with the id and name of its unit instead of its members.
+    """
+
+    unit = serializers.SerializerMethodField()
+
+    class Meta:
+        model = models.Topic
+        fields = ["id", "name", "unit"]
+
+    def get_unit(self, topic):
+        """
+        Get the id and name of the unit, which is expected to be selected with the topic.
+        """
+        return {"id": str(topic.unit_id), "name": topic.unit.name}
+
+
 class ReferralActivitySerializer(serializers.ModelSerializer):
     """
     Referral activity serializer. We had to create a custom field to add the generic content
@@ -142,23 +249,59 @@ class ReferralActivitySerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class ReferralAnswerAttachmentSerializer(serializers.ModelSerializer):
+class AttachmentSerializerMixin(serializers.Serializer):
     """
-    Referral answer attachment serializer. Add a utility to display attachments more
-    easily on the client side.
+    Add utilities to display attachments more easily on the client side: links to the file and
+    its preview, an excerpt of its text and its name with its extension. The models must not
+    expose their blob and full text, which serializers using this mixin exclude.
     """
 
+    excerpt = serializers.SerializerMethodField()
+    file = serializers.SerializerMethodField()
     name_with_extension = serializers.SerializerMethodField()
+    preview = serializers.SerializerMethodField()
 
-    class Meta:
-        model = models.ReferralAnswerAttachment
-        fields = "__all__"
+    def get_excerpt(self, attachment):
+        """
+        Start of the text extracted from the file, to help users identify it.
+        """
+        return attachment.text[:EXCERPT_LENGTH]
+
+    def get_file(self, attachment):
+        """
+        Link to the view that serves the file, whatever the name its content is stored under.
+        """
+        url = attachment.get_url()
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
+
+    def get_preview(self, attachment):
+        """
+        Link to the view that serves the preview image of the file, once it is ready.
+        """
+        if not attachment.preview:
+            return None
+        url = attachment.get_preview_url()
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
 
-    def get_name_with_extension(self, referral_answer_attachment):
+    def get_name_with_extension(self, attachment):
         """
-        Call the relevant utility method to add information on serialized referral answer attachments.
+        Call the relevant utility method to add information on serialized attachments.
         """
-        return referral_answer_attachment.get_name_with_extension()
+        return attachment.get_name_with_extension()
+
+
+class ReferralAnswerAttachmentSerializer(
+    AttachmentSerializerMixin, serializers.ModelSerializer
+):
+    """
+    Referral answer attachment serializer.
+    """
+
+    class Meta:
+        model = models.ReferralAnswerAttachment
+        exclude = ["blob", "text"]
 
 
 class ReferralAnswerSerializer(serializers.ModelSerializer):
@@ -174,23 +317,16 @@ class ReferralAnswerSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class ReferralAttachmentSerializer(serializers.ModelSerializer):
+class ReferralAttachmentSerializer(
+    AttachmentSerializerMixin, serializers.ModelSerializer
+):
     """
-    Referral attachment serializer. Add a utility to display attachments more
-    easily on the client side.
+    Referral attachment serializer.
     """
 
-    name_with_extension = serializers.SerializerMethodField()
-
     class Meta:
         model = models.ReferralAttachment
-        fields = "__all__"
-
-    def get_name_with_extension(self, referral_attachment):
-        """
-        Call the relevant utility method to add information on serialized referral attachments.
-        """
-        return referral_attachment.get_name_with_extension()
+        exclude = ["blob", "text"]
 
 
 class ReferralUrgencySerializer(serializers.ModelSerializer):
@@ -212,7 +348,7 @@ class ReferralUrgencySerializer(serializers.ModelSerializer):
         return referral_urgency.name
 
 
-class ReferralSerializer(serializers.ModelSerializer):
+class ReferralSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     """
     Referral serializer. Uses our other serializers to limit available data on our nested objects
     and add relevant information where applicable.
@@ -227,4 +363,97 @@ class ReferralSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = models.Referral
-        fields = "__all__"
+        exclude = ["search_vector"]
+
+
+class ReferralSummarySerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    """
+    Compact referral serializer for lists of referrals. Only includes what is necessary to
+    display a referral as one row in a table, with names instead of nested objects.
+    """
+
+    assignees = serializers.SerializerMethodField()
+    due_date = serializers.SerializerMethodField()
+    topic = serializers.CharField(source="topic.name", read_only=True)
+    urgency_level = serializers.SerializerMethodField()
+
+    class Meta:
+        model = models.Referral
+        fields = [
+            "assignees",
+            "created_at",
+            "due_date",
+            "id",
+            "requester",
+            "state",
+            "topic",
+            "urgency_level",
+        ]
+
+    def get_assignees(self, referral):
+        """
+        Get the full names of the assignees, which are expected to be prefetched.
+        """
+        return [assignee.get_full_name() for assignee in referral.assignees.all()]
+
+    def get_due_date(self, referral):
+        """
+        Compute the date at which the answer is expected from the referral urgency level.
+        """
+        if referral.urgency_level is None:
+            return None
+        return serializers.DateTimeField().to_representation(
+            referral.created_at + referral.urgency_level.duration
+        )
+
+    def get_urgency_level(self, referral):
+        """
+        Get the name of the urgency level, if any.
+        """
+        return referral.urgency_level.name if referral.urgency_level else None
+
+
+class ReferralSearchResultSerializer(ReferralSummarySerializer):
+    """
+    Referral serializer for search results: the compact referral along with its relevance and
+    an excerpt of its texts where the words that match the search are marked.
+    """
+
+    headline = serializers.SerializerMethodField()
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta(ReferralSummarySerializer.Meta):
+        fields = ReferralSummarySerializer.Meta.fields + ["headline", "rank"]
+
+    def get_headline(self, referral):
+        """
+        Escape the headline computed by the search query as HTML, with matching words in
+        `mark` tags.
+        """
+        return format_headline(referral.headline)
+
+
+class ReferralListQuerySerializer(serializers.Serializer):
+    """
+    Validate the query parameters used to filter lists of referrals. Each filter can be passed
+    several times to match any of the values.
+    """
+
+    assignee = serializers.ListField(child=serializers.UUIDField(), required=False)
+    state = serializers.ListField(
+        child=serializers.ChoiceField(choices=models.ReferralState.choices),
+        required=False,
+    )
+    topic = serializers.ListField(child=serializers.UUIDField(), required=False)
+    unit = serializers.ListField(child=serializers.UUIDField(), required=False)
+    urgency = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+
+class ReferralSearchQuerySerializer(serializers.Serializer):
+    """
+    Validate the query parameters used to search referrals, on top of the filters of lists of
+    referrals.
+    """
+
+    limit = serializers.IntegerField(default=20, min_value=1, max_value=100)
+    q = serializers.CharField(max_length=200)
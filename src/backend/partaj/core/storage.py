@@ -1,5 +1,9 @@
+import os
+
 from django.conf import settings
 
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
 from storages.backends.s3boto3 import S3Boto3Storage
 
 
@@ -17,3 +21,89 @@ class SecuredStorage(S3Boto3Storage):
         """
         referral_attachment_id = name.rsplit("/", 1)[0]
         return f"/{settings.ATTACHMENT_FILES_PATH}{referral_attachment_id}/"
+
+    def _save(self, name, content):
+        """
+        Stream files to the object storage, with a multipart upload for large files. Unlike the
+        parent class, use the connection of the current thread so several files can be uploaded
+        concurrently.
+        """
+        cleaned_name = self._clean_name(name)
+        name = self._normalize_name(cleaned_name)
+        params = self._get_write_parameters(name, content)
+
+        content.seek(0, os.SEEK_SET)
+        self.connection.Object(
+            self.bucket_name, self._encode_name(name)
+        ).upload_fileobj(
+            content,
+            Config=TransferConfig(
+                multipart_chunksize=settings.ATTACHMENT_UPLOAD_MULTIPART_CHUNKSIZE,
+                multipart_threshold=settings.ATTACHMENT_UPLOAD_MULTIPART_THRESHOLD,
+            ),
+            ExtraArgs=params,
+        )
+        return cleaned_name
+
+    def get_download_url(self, name, expire, content_type, content_disposition):
+        """
+        Generate a signed URL to download a file directly from the object storage, once the
+        user has been authorized. Headers are forced on the response so the file is downloaded
+        with its name, as when it is served by Django.
+        """
+        name = self._normalize_name(self._clean_name(name))
+        return self.bucket.meta.client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket.name,
+                "Key": self._encode_name(name),
+                "ResponseContentDisposition": content_disposition,
+                "ResponseContentType": content_type,
+            },
+            ExpiresIn=expire,
+        )
+
+    def open_range(self, name, start, end):
+        """
+        Open a byte range of a file, both ends included, only fetching this part of the file
+        from the object storage.
+        """
+        name = self._normalize_name(self._clean_name(name))
+        return self.bucket.Object(self._encode_name(name)).get(
+            Range=f"bytes={start}-{end}"
+        )["Body"]
+
+    def open_stream(self, name):
+        """
+        Open a file as a stream read straight from the object storage, without spooling it to
+        memory or disk first as the files returned by `open` do.
+        """
+        name = self._normalize_name(self._clean_name(name))
+        return self.bucket.Object(self._encode_name(name)).get()["Body"]
+
+    def get_upload_target(self, name, expire, max_size):
+        """
+        Generate a signed target for a client to upload a file directly to the object storage,
+        with a POST request. It can only be used for this file, up to the maximum size, until
+        it expires.
+        """
+        name = self._normalize_name(self._clean_name(name))
+        return self.connection.meta.client.generate_presigned_post(
+            self.bucket_name,
+            self._encode_name(name),
+            Conditions=[["content-length-range", 0, max_size]],
+            ExpiresIn=expire,
+        )
+
+    def get_uploaded_size(self, name):
+        """
+        Get the size of a file uploaded directly by a client, with a HEAD request to the object
+        storage. Return None if the file was not uploaded.
+        """
+        name = self._normalize_name(self._clean_name(name))
+        try:
+            return self.connection.meta.client.head_object(
+                Bucket=self.bucket_name, Key=self._encode_name(name)
+            )["ContentLength"]
+        except ClientError:
+            return None
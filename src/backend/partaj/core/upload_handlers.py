@@ -0,0 +1,50 @@
+"""
+Upload handlers that hash files while they are received, so attachments do not need to be read
+again to find out whether their content is already stored.
+"""
+import hashlib
+
+from django.core.files.uploadhandler import (
+    MemoryFileUploadHandler,
+    TemporaryFileUploadHandler,
+)
+
+
+class HashingUploadHandlerMixin:
+    """
+    Compute the SHA-256 hash of uploaded files chunk by chunk, and set it on the files as their
+    `sha256` attribute.
+    """
+
+    def new_file(self, *args, **kwargs):
+        # The memory handler stops other handlers from this call, so start hashing first
+        self.content_hash = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        # Files too large for memory are passed on and hashed by the next handler
+        if getattr(self, "activated", True):
+            self.content_hash.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.content_hash.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(
+    HashingUploadHandlerMixin, MemoryFileUploadHandler
+):
+    """
+    Keep small uploaded files in memory, hashing them as they are received.
+    """
+
+
+class HashingTemporaryFileUploadHandler(
+    HashingUploadHandlerMixin, TemporaryFileUploadHandler
+):
+    """
+    Stream large uploaded files to a temporary file, hashing them as they are received.
+    """
@@ -0,0 +1,113 @@
+"""
+Let browsers upload attachment files directly to the object storage, so their content does not
+go through our servers. Clients first get signed upload targets for their files, upload them,
+then send the upload tokens along with the referral or answer, instead of the files themselves.
+"""
+import os
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+
+from .models import AttachmentUpload, ReferralAttachment
+
+# Namespace upload tokens so they cannot be mixed up with other signed values
+SALT = "partaj.core.uploads"
+
+
+def direct_uploads_enabled():
+    """
+    Direct uploads need to be enabled in settings and supported by the storage.
+    """
+    return bool(settings.ATTACHMENT_DIRECT_UPLOAD_EXPIRE) and hasattr(
+        default_storage, "get_upload_target"
+    )
+
+
+def get_upload_token_max_age():
+    """
+    Get the number of seconds upload tokens are accepted for. Leave time to submit the form
+    after uploads that started just before their target expired.
+    """
+    return settings.ATTACHMENT_DIRECT_UPLOAD_EXPIRE * 2
+
+
+def get_upload_target(filename, user):
+    """
+    Reserve an attachment id and storage key for a file, and get the target the client can
+    upload it to, along with a signed token for the user to register the attachment afterwards.
+    The upload is recorded so its file can be deleted if it is never registered.
+    """
+    name, _ = os.path.splitext(filename)
+    attachment = ReferralAttachment(id=uuid.uuid4(), name=name[:200])
+    # Build the key exactly as for files uploaded through Django
+    key = attachment._meta.get_field("file").generate_filename(attachment, filename)
+
+    target = default_storage.get_upload_target(
+        key,
+        expire=settings.ATTACHMENT_DIRECT_UPLOAD_EXPIRE,
+        max_size=settings.ATTACHMENT_DIRECT_UPLOAD_MAX_SIZE,
+    )
+    AttachmentUpload.objects.create(id=attachment.id, key=key)
+    return {
+        "fields": target["fields"],
+        "upload": signing.dumps(
+            {
+                "id": str(attachment.id),
+                "key": key,
+                "name": attachment.name,
+                "user": str(user.id),
+            },
+            salt=SALT,
+        ),
+        "url": target["url"],
+    }
+
+
+def get_uploaded_attachments(attachment_class, uploads, user):
+    """
+    Build new attachments, without their owner, for files uploaded directly to the object
+    storage, from the tokens returned to the user with their upload targets. Tokens sent several
+    times, for instance by clients retrying, are only used once.
+    Make sure each token is genuine, recent and unused, and that its file was actually uploaded
+    with an acceptable size, before any attachment is saved: raise a `ValidationError` otherwise.
+    """
+    tokens = {}
+    for upload in uploads:
+        try:
+            data = signing.loads(upload, salt=SALT, max_age=get_upload_token_max_age())
+        except signing.BadSignature:
+            raise ValidationError(f"{upload} is not a valid upload.")
+        if data["user"] != str(user.id):
+            raise ValidationError(f"{upload} is not a valid upload.")
+        tokens.setdefault(data["id"], (upload, data))
+
+    # Uploads are pending until they are registered as attachments
+    pending_ids = {
+        str(upload_id)
+        for upload_id in AttachmentUpload.objects.filter(
+            id__in=list(tokens)
+        ).values_list("id", flat=True)
+    }
+
+    attachments = []
+    for upload, data in tokens.values():
+        if data["id"] not in pending_ids:
+            raise ValidationError(f"{upload} is not a valid upload.")
+
+        # Check the file exists on the storage and get its actual size
+        size = default_storage.get_uploaded_size(data["key"])
+        if size is None:
+            raise ValidationError(f"{data['name']} was not uploaded.")
+        if size > settings.ATTACHMENT_DIRECT_UPLOAD_MAX_SIZE:
+            raise ValidationError(f"{data['name']} is too large.")
+
+        attachments.append(
+            attachment_class(
+                id=data["id"], file=data["key"], name=data["name"], size=size
+            )
+        )
+
+    return attachments
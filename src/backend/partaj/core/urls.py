@@ -9,11 +9,14 @@ from rest_framework import routers
 from . import api
 from .views import (
     AuthenticatedFilesView,
+    AuthenticatedPreviewsView,
     IndexView,
+    ReferralAttachmentsArchiveView,
     RequesterReferralCreateView,
     RequesterReferralDetailView,
     RequesterReferralListView,
     RequesterReferralSavedView,
+    UnitArchivesView,
     UnitInboxView,
     UnitMembersView,
     UnitReferralDetailView,
@@ -63,6 +66,7 @@ urlpatterns = [
         include(
             [
                 path("inbox/", UnitInboxView.as_view(), name="unit-inbox"),
+                path("archives/", UnitArchivesView.as_view(), name="unit-archives"),
                 path(
                     "referral-detail/<int:pk>/",
                     UnitReferralDetailView.as_view(),
@@ -79,5 +83,15 @@ urlpatterns = [
         AuthenticatedFilesView.as_view(),
         name="authenticated-files",
     ),
+    path(
+        f"{settings.ATTACHMENT_FILES_PATH}<uuid:attachment_id>/preview/",
+        AuthenticatedPreviewsView.as_view(),
+        name="authenticated-previews",
+    ),
+    path(
+        f"{settings.ATTACHMENT_FILES_PATH}referral/<int:referral_id>/",
+        ReferralAttachmentsArchiveView.as_view(),
+        name="referral-attachments-archive",
+    ),
     path("", IndexView.as_view(), name="index"),
 ]
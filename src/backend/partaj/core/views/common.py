@@ -2,55 +2,350 @@
 Common views that serve a purpose for any Partaj user.
 """
 import mimetypes
+import os
+import re
+from urllib.parse import quote
+import zipfile
 
-from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import FileResponse, HttpResponse
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseRedirect,
+    StreamingHttpResponse,
+)
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django.views import View
 from django.views.generic import TemplateView
 
-from ..models import ReferralAnswerAttachment, ReferralAttachment
+from ..memberships import get_user_unit_roles
+from ..models import (
+    Referral,
+    ReferralAnswerAttachment,
+    ReferralAttachment,
+    get_attachment,
+)
 
+# Single byte range, the only kind we support: "bytes=0-99", "bytes=100-" or "bytes=-100"
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
 
-class AuthenticatedFilesView(LoginRequiredMixin, View):
+
+class UserCanAccessAttachmentMixin(UserPassesTestMixin):
+    """
+    Use a django builtin mixin to implement attachment authorization.
+    """
+
+    def test_func(self):
+        """
+        Make sure the user is the requester for the referral the attachment belongs to, a member
+        of the unit that handles it, or staff, before letting them access the attachment.
+        """
+        self.attachment = get_attachment(self.kwargs["attachment_id"])
+        # None of the attachment models had an attachment matching this ID
+        if not self.attachment:
+            raise Http404()
+
+        user = self.request.user
+        return (
+            user.is_staff
+            or user.id == self.attachment.referral_user_id
+            or str(self.attachment.referral_unit_id) in get_user_unit_roles(user)
+        )
+
+
+def get_content_disposition(filename):
+    """
+    Build the Content-Disposition header to download a file, as Django's `FileResponse` does.
+    """
+    try:
+        filename.encode("ascii")
+        return f'attachment; filename="{filename}"'
+    except UnicodeEncodeError:
+        return f"attachment; filename*=utf-8''{quote(filename)}"
+
+
+def parse_range_header(header, size):
+    """
+    Get the first and last positions of the byte range requested in a Range header for a file
+    of the given size. Return None when the whole file should be served instead, and a
+    range that starts after the end of the file when it cannot be satisfied.
+    """
+    match = RANGE_RE.match(header or "")
+    if not match or match.groups() == ("", ""):
+        return None
+
+    start, end = match.groups()
+    if not start:
+        # Suffix range: serve the last bytes of the file
+        return (max(size - int(end), 0), size - 1) if int(end) else (size, size)
+    start, end = int(start), min(int(end), size - 1) if end else size - 1
+    return (start, end) if start <= end or start >= size else None
+
+
+def iter_file_range(file, length, block_size=FileResponse.block_size):
+    """
+    Stream a number of bytes from a file, closing it when done.
+    """
+    try:
+        while length > 0:
+            chunk = file.read(min(block_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+class AuthenticatedFilesView(LoginRequiredMixin, UserCanAccessAttachmentMixin, View):
     def get(self, request, attachment_id):
         """
         Verify the current user is logged-in (using a builtin Django mixin) and allowed to see the
-        requested attachment (TBD), then serve the file to them.
-
-        NB: we are aware of the issues (wrt. monopolizing of Python threads and therefore scaling)
-        with serving files directly with Django views.
-        Given our setup and usage levels, it's an acceptable trade-off with the ease of deployment
-        that we're making.
-        """
-
-        # Try to get the attachment from our attachment models
-        attachment = None
-        for klass in [ReferralAttachment, ReferralAnswerAttachment]:
-            if not attachment:
-                try:
-                    attachment = klass.objects.get(id=attachment_id)
-                except klass.DoesNotExist:
-                    pass
-        # None of the models had an attachment matching this ID
-        if not attachment:
-            return HttpResponse(status=404)
-
-        # Get the actual filename from the referral attachment (ie. remove the UUID prefix
-        # and slash)
-        filename = str(attachment.file).rsplit("/", 1)[-1]
+        requested attachment, then serve the file to them.
+
+        NB: serving files directly with Django views monopolizes Python threads. Set
+        `ATTACHMENT_FILES_SIGNED_URL_EXPIRE` to redirect users to the object storage, or
+        `ATTACHMENT_FILES_SENDFILE_HEADER` to let the front proxy stream the file, after we
+        authorized the request.
+        """
+        attachment = self.attachment
+
+        # Get the name of the file from the attachment, as its content may be stored under
+        # another name when it is shared with other attachments
+        filename = attachment.get_name_with_extension()
 
         # Get the content type and encoding to serve the file as best we can
         content_type, encoding = mimetypes.guess_type(str(filename))
         content_type = content_type or "application/octet-stream"
 
+        # Attachment files never change: a strong validator only needs the id and size
+        size = attachment.size if attachment.size is not None else attachment.file.size
+        etag = f'"{attachment.id}-{size}"'
+        last_modified = int(attachment.created_at.timestamp())
+        conditional_response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if conditional_response:
+            conditional_response["ETag"] = etag
+            return conditional_response
+
+        # Send the user to download the file directly from the object storage
+        expire = settings.ATTACHMENT_FILES_SIGNED_URL_EXPIRE
+        if expire and hasattr(attachment.file.storage, "get_download_url"):
+            return HttpResponseRedirect(
+                attachment.file.storage.get_download_url(
+                    attachment.file.name,
+                    expire=expire,
+                    content_type=content_type,
+                    content_disposition=get_content_disposition(filename),
+                )
+            )
+
+        # Delegate streaming the file to the front proxy through an internal redirection
+        sendfile_header = settings.ATTACHMENT_FILES_SENDFILE_HEADER
+        if sendfile_header:
+            location = (
+                f"{settings.ATTACHMENT_FILES_SENDFILE_ROOT}{attachment.file.name}"
+            )
+            response = HttpResponse(content_type=content_type)
+            # nginx expects a URI, other servers a path on their filesystem
+            response[sendfile_header] = (
+                quote(location)
+                if sendfile_header.lower() == "x-accel-redirect"
+                else location
+            )
+            response["Content-Disposition"] = get_content_disposition(filename)
+            return response
+
+        # Serve the requested part of the file, unless the client's copy is outdated
+        byte_range = parse_range_header(request.META.get("HTTP_RANGE"), size)
+        if_range = request.META.get("HTTP_IF_RANGE")
+        if byte_range and (not if_range or if_range == etag):
+            start, end = byte_range
+            if start >= size:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{size}"
+                return response
+
+            # Only read the requested bytes from storages that support it
+            storage = attachment.file.storage
+            if hasattr(storage, "open_range"):
+                file = storage.open_range(attachment.file.name, start, end)
+            else:
+                file = attachment.file.open("rb")
+                file.seek(start)
+
+            response = StreamingHttpResponse(
+                iter_file_range(file, end - start + 1),
+                status=206,
+                content_type=content_type,
+            )
+            response["Content-Disposition"] = get_content_disposition(filename)
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+            response["Content-Length"] = end - start + 1
+
         # Actually serve the file using Django's http facilities
-        response = FileResponse(
-            attachment.file.open("rb"),
-            content_type=content_type,
-            as_attachment=True,
-            filename=filename,
+        else:
+            response = FileResponse(
+                attachment.file.open("rb"),
+                content_type=content_type,
+                as_attachment=True,
+                filename=filename,
+            )
+            response["Content-Length"] = size
+
+        response["Accept-Ranges"] = "bytes"
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        return response
+
+
+class AuthenticatedPreviewsView(LoginRequiredMixin, UserCanAccessAttachmentMixin, View):
+    def get(self, request, attachment_id):
+        """
+        Verify the current user is logged-in and allowed to see the requested attachment, then
+        serve the preview image of its file, which is small enough to go through Django.
+        """
+        preview = self.attachment.preview
+        if not preview:
+            raise Http404()
+
+        response = FileResponse(preview.open("rb"), content_type="image/png")
+        # Previews are only generated once for each attachment
+        response["Cache-Control"] = "private, max-age=86400"
+        return response
+
+
+class UserCanAccessReferralAttachmentsMixin(UserPassesTestMixin):
+    """
+    Authorize access to all the attachments of a referral, as for each of them.
+    """
+
+    def test_func(self):
+        """
+        Make sure the user is the requester for the referral, a member of the unit that
+        handles it, or staff, before letting them access its attachments.
+        """
+        self.referral = get_object_or_404(
+            Referral.objects.select_related("topic"), id=self.kwargs["referral_id"]
+        )
+
+        user = self.request.user
+        return (
+            user.is_staff
+            or user.id == self.referral.user_id
+            or str(self.referral.topic.unit_id) in get_user_unit_roles(user)
+        )
+
+
+class ZipStream:
+    """
+    Write-only file object that hands over what is written to it, so a ZIP archive can be sent
+    while it is being built. Archives written to it use data descriptors as it cannot seek.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        """
+        Get the data written since the last call.
+        """
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def get_archive_names(attachments):
+    """
+    Get names for attachments in an archive, numbering attachments that have the same name.
+    """
+    names = []
+    for attachment in attachments:
+        name = attachment.get_name_with_extension()
+        root, extension = os.path.splitext(name)
+        index = 1
+        while name in names:
+            index += 1
+            name = f"{root} ({index}){extension}"
+        names.append(name)
+    return names
+
+
+def open_attachment_stream(attachment):
+    """
+    Open the file of an attachment for reading, streaming it from storages that support it.
+    """
+    storage = attachment.file.storage
+    if hasattr(storage, "open_stream"):
+        return storage.open_stream(attachment.file.name)
+    return attachment.file.open("rb")
+
+
+def iter_zip_archive(attachments, block_size=FileResponse.block_size):
+    """
+    Stream a ZIP archive of attachments, reading one block of one file at a time.
+    """
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for attachment, name in zip(attachments, get_archive_names(attachments)):
+            info = zipfile.ZipInfo(name, attachment.created_at.timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            # Let zipfile know the size of the file, so it can use ZIP64 extensions as needed
+            info.file_size = attachment.size or 0
+            file = open_attachment_stream(attachment)
+            try:
+                with archive.open(info, mode="w") as entry:
+                    for chunk in iter(lambda: file.read(block_size), b""):
+                        entry.write(chunk)
+                        yield stream.pop()
+            finally:
+                file.close()
+            yield stream.pop()
+    yield stream.pop()
+
+
+class ReferralAttachmentsArchiveView(
+    LoginRequiredMixin, UserCanAccessReferralAttachmentsMixin, View
+):
+    def get(self, request, referral_id):
+        """
+        Verify the current user is logged-in and allowed to see the attachments of the referral,
+        then send them all the attachments of the referral and its answers as a ZIP archive.
+
+        The archive is built as it is sent, from files streamed from the storage one block at a
+        time, so it is never held in memory or on disk.
+        """
+        attachments = list(
+            ReferralAttachment.objects.filter(referral=self.referral).order_by(
+                "created_at"
+            )
+        ) + list(
+            ReferralAnswerAttachment.objects.filter(
+                referral_answer__referral=self.referral
+            ).order_by("created_at")
         )
+        if not attachments:
+            raise Http404()
 
+        response = StreamingHttpResponse(
+            (chunk for chunk in iter_zip_archive(attachments) if chunk),
+            content_type="application/zip",
+        )
+        response["Content-Disposition"] = get_content_disposition(
+            f"referral_{self.referral.id}_attachments.zip"
+        )
         return response
 
 
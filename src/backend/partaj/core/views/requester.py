@@ -3,6 +3,7 @@ Views dedicated to the requester. Create a referral and everything else they
 need to do in Partaj.
 """
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.db.models import Count
 from django.views.generic import DetailView, ListView
 from django.views.generic.base import TemplateView
 
@@ -62,7 +63,14 @@ class RequesterReferralListView(LoginRequiredMixin, ListView):
         """
         Limit the referrals queryset to those linked to the current user as a requester.
         """
-        return Referral.objects.filter(user=self.request.user).order_by("-created_at")
+        # Load everything the list displays for each referral in a constant number of queries
+        return (
+            Referral.objects.filter(user=self.request.user)
+            .select_related("topic", "urgency_level")
+            .prefetch_related("assignees")
+            .annotate(assignee_count=Count("assignees", distinct=True))
+            .order_by("-created_at")
+        )
 
 
 class RequesterReferralSavedView(
@@ -2,10 +2,17 @@
 Views dedicated to a unit receiving requests. Handle, manage & respond to referrals.
 """
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.db.models import Count
+from django.http import QueryDict
 from django.shortcuts import get_object_or_404
+from django.utils.functional import SimpleLazyObject, cached_property
 from django.views.generic import DetailView, ListView
 
-from ..models import Referral, Unit
+from ..cursors import decode_cursor, encode_cursor, get_cursor_filter
+from ..forms import UnitReferralFilterForm
+from ..fragments import get_unit_version
+from ..memberships import get_user_unit_roles
+from ..models import OPEN_REFERRAL_STATES, Referral, ReferralState, Unit
 
 
 class UserIsMemberOfUnitMixin(UserPassesTestMixin):
@@ -13,33 +20,140 @@ class UserIsMemberOfUnitMixin(UserPassesTestMixin):
         """
         Make sure the user is a member of this unit before allowing them to access its inbox.
         """
-        user = self.request.user
-        if user.unitmembership_set.filter(unit__id=self.kwargs["unit_id"]).exists():
-            return True
-        return False
+        return str(self.kwargs["unit_id"]) in get_user_unit_roles(self.request.user)
 
 
-class UnitInboxView(LoginRequiredMixin, UserIsMemberOfUnitMixin, ListView):
-    breadcrumbs = ["unit", "unit-inbox"]
+class UnitReferralListView(LoginRequiredMixin, UserIsMemberOfUnitMixin, ListView):
+    """
+    Base view to list the referrals of a unit in some states, most recent first, with filters
+    and keyset pagination: each page starts after the last referral of the previous one. Pages
+    are read in order from the index on the unit copied on referrals, its creation date and
+    id, skipping referrals in other states, whatever their position in the list.
+    Referrals are only loaded when the list is rendered, which is skipped when it is cached.
+    """
+
     context_object_name = "referrals"
+    page_size = 50
+    states = []
     template_name = "core/unit/inbox.html"
 
     def get_queryset(self):
         """
-        Limit the referrals queryset to those relevant to the current unit.
+        Get the referrals of the unit matching the filters, from the current page on.
         """
         self.unit = get_object_or_404(Unit, id=self.kwargs["unit_id"])
-        return Referral.objects.filter(topic__unit=self.unit).order_by("-created_at")
+        self.filters = UnitReferralFilterForm(
+            self.request.GET, unit=self.unit, states=self.states
+        )
+        # Load everything the list displays for each referral in a constant number of queries
+        queryset = (
+            Referral.objects.filter(unit=self.unit, state__in=self.states)
+            .filter(**self.filters.get_filters())
+            .select_related("topic", "urgency_level")
+            .prefetch_related("assignees")
+            .annotate(assignee_count=Count("assignees", distinct=True))
+            .order_by("-created_at", "-id")
+        )
+
+        # Invalid cursors are ignored so lists start from their first page
+        self.position = decode_cursor(self.request.GET.get("cursor", ""))
+        if self.position:
+            queryset = queryset.filter(get_cursor_filter(self.position))
+        return queryset
+
+    @cached_property
+    def query(self):
+        """
+        Get the normalized query parameters of the list: its valid filters and cursor. They
+        identify the cached list and are kept in the links to other pages, whatever else the
+        URL contains.
+        """
+        query = QueryDict(mutable=True)
+        for name, value in self.filters.cleaned_data.items():
+            if value:
+                query[name] = str(getattr(value, "pk", value))
+        if self.position:
+            query["cursor"] = encode_cursor(*self.position)
+        return query
+
+    @cached_property
+    def page(self):
+        """
+        Load the referrals of the current page, and whether there is a next page.
+        """
+        # Fetch one more referral to know whether there is a next page
+        referrals = list(self.object_list[: self.page_size + 1])
+        return referrals[: self.page_size], len(referrals) > self.page_size
+
+    def get_url(self, **params):
+        """
+        Get the URL of the list with the current query parameters, updated with new values.
+        Empty values remove parameters.
+        """
+        query = self.query.copy()
+        for name, value in params.items():
+            query.pop(name, None)
+            if value:
+                query[name] = value
+        return (
+            f"{self.request.path}?{query.urlencode()}" if query else self.request.path
+        )
+
+    def get_next_page_url(self):
+        """
+        Get the URL of the next page, if there is one.
+        """
+        referrals, has_next_page = self.page
+        if has_next_page:
+            return self.get_url(
+                cursor=encode_cursor(referrals[-1].created_at, referrals[-1].id)
+            )
+        return None
 
     def get_context_data(self, **kwargs):
         """
-        Add the unit to context, necessary for all "unit" views.
+        Add the unit, filters and links to other pages and states to context. The referrals
+        of the page and the link to the next one are loaded by the template, if it renders them.
         """
         context = super().get_context_data(**kwargs)
+        context["referrals"] = SimpleLazyObject(lambda: self.page[0])
+        context["next_page_url"] = self.get_next_page_url
         context["unit"] = self.unit
+        context["unit_fragments_version"] = get_unit_version(self.unit.id)
+        context["filters"] = self.filters
+        context["list_cache_key"] = self.query.urlencode()
+        current_state = self.query.get("state", "")
+        context["state_tabs"] = [
+            {
+                "label": label,
+                "is_active": value == current_state,
+                "url": self.get_url(state=value, cursor=None),
+            }
+            for value, label in self.filters.fields["state"].choices
+        ]
+        if self.position:
+            context["first_page_url"] = self.get_url(cursor=None)
         return context
 
 
+class UnitInboxView(UnitReferralListView):
+    """
+    List the referrals the unit still has to handle.
+    """
+
+    breadcrumbs = ["unit", "unit-inbox"]
+    states = OPEN_REFERRAL_STATES
+
+
+class UnitArchivesView(UnitReferralListView):
+    """
+    List the referrals the unit is done with.
+    """
+
+    breadcrumbs = ["unit", "unit-archives"]
+    states = [ReferralState.ANSWERED, ReferralState.CLOSED]
+
+
 class UnitMembersView(LoginRequiredMixin, UserIsMemberOfUnitMixin, DetailView):
     breadcrumbs = ["unit", "unit-members"]
     context_object_name = "unit"
@@ -47,6 +161,18 @@ class UnitMembersView(LoginRequiredMixin, UserIsMemberOfUnitMixin, DetailView):
     pk_url_kwarg = "unit_id"
     template_name = "core/unit/members.html"
 
+    def get_context_data(self, **kwargs):
+        """
+        Add the memberships of the unit to context, with their users and counters, sorted by
+        the database, and the version of the cached table.
+        """
+        context = super().get_context_data(**kwargs)
+        context["memberships"] = self.object.get_memberships().order_by(
+            "user__last_name", "user__first_name"
+        )
+        context["unit_fragments_version"] = get_unit_version(self.object.id)
+        return context
+
 
 class UnitReferralDetailView(LoginRequiredMixin, UserIsMemberOfUnitMixin, DetailView):
     breadcrumbs = ["unit", "unit-inbox", "unit-inbox-referral-detail"]
@@ -70,3 +196,13 @@ class UnitTopicsView(LoginRequiredMixin, UserIsMemberOfUnitMixin, DetailView):
     model = Unit
     pk_url_kwarg = "unit_id"
     template_name = "core/unit/topics.html"
+
+    def get_context_data(self, **kwargs):
+        """
+        Add the topics of the unit to context, with their counters, sorted by the database,
+        and the version of the cached table.
+        """
+        context = super().get_context_data(**kwargs)
+        context["topics"] = self.object.topic_set.order_by("name")
+        context["unit_fragments_version"] = get_unit_version(self.object.id)
+        return context
@@ -43,7 +43,7 @@ class DRFMixin:
 
     REST_FRAMEWORK = {
         "DEFAULT_AUTHENTICATION_CLASSES": [
-            "rest_framework.authentication.TokenAuthentication",
+            "partaj.users.authentication.CachedTokenAuthentication",
         ],
         "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.LimitOffsetPagination",
         "PAGE_SIZE": 10,
@@ -71,6 +71,15 @@ class SendinblueMixin:
         ),
     }
 
+    # Calls to the email provider go through a pool of keep-alive connections in each process.
+    # Failed connections and explicit refusals (429 & 503) are retried with an exponential
+    # backoff; read errors are not, as the email may have been sent already.
+    EMAIL_PROVIDER_CONNECT_TIMEOUT = values.FloatValue(3.05)
+    EMAIL_PROVIDER_READ_TIMEOUT = values.FloatValue(10)
+    EMAIL_PROVIDER_POOL_SIZE = values.IntegerValue(10)
+    EMAIL_PROVIDER_MAX_RETRIES = values.IntegerValue(3)
+    EMAIL_PROVIDER_RETRY_BACKOFF_FACTOR = values.FloatValue(0.5)
+
 
 class Base(SendinblueMixin, DRFMixin, Configuration):
     """
@@ -101,10 +110,70 @@ class Base(SendinblueMixin, DRFMixin, Configuration):
     AWS_DEFAULT_ACL = "private"
     AWS_QUERYSTRING_AUTH = False
 
+    # Hash uploaded files while they are received, to find out whether their content is already
+    # stored without reading them again
+    FILE_UPLOAD_HANDLERS = [
+        "partaj.core.upload_handlers.HashingMemoryFileUploadHandler",
+        "partaj.core.upload_handlers.HashingTemporaryFileUploadHandler",
+    ]
+
+    # Upload the attachments of a request to the object storage concurrently, with this many
+    # threads. Files larger than the threshold are split in parts, uploaded in parallel.
+    ATTACHMENT_UPLOAD_MAX_WORKERS = values.IntegerValue(4)
+    ATTACHMENT_UPLOAD_MULTIPART_THRESHOLD = values.IntegerValue(8 * 1024 * 1024)
+    ATTACHMENT_UPLOAD_MULTIPART_CHUNKSIZE = values.IntegerValue(8 * 1024 * 1024)
+
+    # Let browsers upload attachment files directly to the object storage, with signed upload
+    # targets valid for this many seconds, for files up to the maximum size in bytes. The
+    # bucket needs a CORS configuration allowing POST requests from Partaj.
+    ATTACHMENT_DIRECT_UPLOAD_EXPIRE = values.IntegerValue(0)
+    ATTACHMENT_DIRECT_UPLOAD_MAX_SIZE = values.IntegerValue(100 * 1024 * 1024)
+
     # Path prefix to access attachment files that are served by Django after
     # authenticating and authorizing a logged-in user
     ATTACHMENT_FILES_PATH = "attachment-file/"
 
+    # Optionally let the front proxy stream attachment files instead of Django: once the request
+    # is authorized, the view only returns this header (eg. "X-Accel-Redirect" for nginx or
+    # "X-Sendfile" for Apache) pointing to the file name under the root below. The root is
+    # an internal location on the proxy (eg. proxied to the object storage bucket) or a path on
+    # its filesystem.
+    ATTACHMENT_FILES_SENDFILE_HEADER = values.Value(None)
+    ATTACHMENT_FILES_SENDFILE_ROOT = values.Value("/attachment-files-internal/")
+
+    # Alternatively, redirect authorized users to a signed object storage URL which expires
+    # after this many seconds, so downloads do not go through our servers at all. Storages
+    # that cannot sign URLs (eg. in tests) fall back to the modes above.
+    ATTACHMENT_FILES_SIGNED_URL_EXPIRE = values.IntegerValue(0)
+
+    # Attachments are processed in the background by the `process_attachments` command, which
+    # extracts their page count and text and renders a preview of their first page this many
+    # pixels wide, with poppler-utils for PDFs and ImageMagick for images. Tools taking longer
+    # than the timeout, in seconds, are stopped.
+    ATTACHMENT_PREVIEW_WIDTH = values.IntegerValue(300)
+    ATTACHMENT_PREVIEW_TIMEOUT = values.IntegerValue(60)
+    ATTACHMENT_PREVIEW_TEXT_MAX_LENGTH = values.IntegerValue(100000)
+
+    # Cache the units each user is a member of across requests for this many seconds.
+    # Invalidation happens in the process where memberships change, so only enable this
+    # with a cache backend that is shared by all processes.
+    UNIT_MEMBERSHIPS_CACHE_TIMEOUT = values.IntegerValue(0)
+
+    # Cache fragments of unit and requester pages for this many seconds. They are invalidated
+    # when the referrals, assignments, memberships and topics they show change, and expire
+    # to bound how long other changes, like user names, take to show up. 0 disables them.
+    FRAGMENT_CACHE_TIMEOUT = values.IntegerValue(300)
+
+    # Keep up to this many API tokens and their users in the memory of each process, for this
+    # many seconds. Deleted tokens and updated users are dropped from all processes through
+    # versions kept in the shared cache, checked on each request. 0 disables the cache.
+    API_TOKEN_CACHE_MAX_SIZE = values.IntegerValue(1000)
+    API_TOKEN_CACHE_TIMEOUT = values.IntegerValue(60)
+
+    # Cache the lists of topics and urgency levels served by the API for this many seconds.
+    # They are invalidated whenever topics, units or urgency levels change.
+    REFERENCE_DATA_CACHE_TIMEOUT = values.IntegerValue(24 * 60 * 60)
+
     SECRET_KEY = values.SecretValue()
 
     DEBUG = values.BooleanValue(False)
@@ -134,6 +203,29 @@ class Base(SendinblueMixin, DRFMixin, Configuration):
         }
     }
 
+    # Cache fragments of pages and data shared across requests. Files are shared by all the
+    # processes of a host, so invalidations reach all of them: configure a networked backend,
+    # such as Memcached, when running on several hosts.
+    CACHES = {
+        "default": {
+            "BACKEND": values.Value(
+                "django.core.cache.backends.filebased.FileBasedCache",
+                environ_name="CACHE_BACKEND",
+                environ_prefix=None,
+            ),
+            "LOCATION": values.Value(
+                os.path.join(str(BASE_DIR), "data/cache"),
+                environ_name="CACHE_LOCATION",
+                environ_prefix=None,
+            ),
+            "OPTIONS": {
+                "MAX_ENTRIES": values.IntegerValue(
+                    10000, environ_name="CACHE_MAX_ENTRIES", environ_prefix=None
+                )
+            },
+        }
+    }
+
     ALLOWED_HOSTS = []
     PARTAJ_PRIMARY_LOCATION = values.Value()
 
@@ -153,6 +245,7 @@ class Base(SendinblueMixin, DRFMixin, Configuration):
         "django.contrib.contenttypes",
         "django.contrib.sessions",
         "django.contrib.messages",
+        "django.contrib.postgres",
         "django.contrib.staticfiles",
         "django_extensions",
         "dockerflow.django",
@@ -337,6 +430,7 @@ class Test(Base):
     """Test environment settings."""
 
     DEFAULT_FILE_STORAGE = 'inmemorystorage.InMemoryStorage'
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
 
 
 class Staging(Base):
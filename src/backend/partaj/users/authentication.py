@@ -0,0 +1,193 @@
+"""
+Authenticate API calls with tokens without querying the database each time. Recently used
+tokens and their users are kept in memory, in a bounded cache where entries expire. Each entry
+is checked against a version of its token kept in the shared cache, which is dropped when the
+token or its user change, so all processes stop using their copy right away.
+"""
+from collections import OrderedDict
+import threading
+import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+def get_token_version_key(key):
+    """
+    Build the shared cache key for the version of a token.
+    """
+    return f"partaj:api-token-version:{key}"
+
+
+def get_token_version(key):
+    """
+    Get the current version of a token from the shared cache. Missing versions start from a
+    random value, so copies made under a version that was evicted or dropped are not used
+    again.
+    """
+    version_key = get_token_version_key(key)
+    version = uuid4().hex
+    if not cache.add(version_key, version, None):
+        version = cache.get(version_key, version)
+    return version
+
+
+def invalidate_token_versions(keys):
+    """
+    Drop the versions of some tokens, so all processes stop using their copy. They are dropped
+    right away, and again when the transaction is committed, as other requests may have
+    copied the previous data in between.
+    """
+    version_keys = [get_token_version_key(key) for key in keys]
+    if version_keys:
+        cache.delete_many(version_keys)
+        transaction.on_commit(lambda: cache.delete_many(version_keys))
+
+
+class TokenCache:
+    """
+    Least recently used cache of the tokens of a process and the row of their user, where
+    entries expire after `API_TOKEN_CACHE_TIMEOUT` seconds. Settings are read on each call so
+    they can be changed at runtime.
+    We keep field values rather than instances, and build new instances for each request, as
+    instances are modified while handling requests. Entries are only used while the version of
+    their token in the shared cache is the one they were stored with.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Get the token with this key and its user, or None if they are not in the cache.
+        """
+        with self.lock:
+            try:
+                expires_at, created, _, version, values = self.entries[key]
+            except KeyError:
+                return None
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+
+        if cache.get(get_token_version_key(key)) != version:
+            self.delete(key)
+            return None
+
+        User = get_user_model()
+        user = User.from_db(
+            DEFAULT_DB_ALIAS,
+            [field.attname for field in User._meta.concrete_fields],
+            values,
+        )
+        token = Token(key=key, user=user, created=created)
+        return user, token
+
+    def set(self, user, token, version):
+        """
+        Keep a token and its user, read under a version of the token, evicting the least
+        recently used tokens beyond the maximum size of the cache.
+        """
+        timeout = settings.API_TOKEN_CACHE_TIMEOUT
+        max_size = settings.API_TOKEN_CACHE_MAX_SIZE
+        if not timeout or not max_size:
+            return
+
+        values = tuple(
+            getattr(user, field.attname) for field in user._meta.concrete_fields
+        )
+        with self.lock:
+            self.entries[token.key] = (
+                time.monotonic() + timeout,
+                token.created,
+                user.pk,
+                version,
+                values,
+            )
+            self.entries.move_to_end(token.key)
+            while len(self.entries) > max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Drop a token from the cache.
+        """
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def delete_user(self, user_id):
+        """
+        Drop all the tokens of a user from the cache.
+        """
+        with self.lock:
+            for key in [
+                key
+                for key, (_, _, entry_user_id, _, _) in self.entries.items()
+                if entry_user_id == user_id
+            ]:
+                del self.entries[key]
+
+    def clear(self):
+        """
+        Drop all tokens from the cache.
+        """
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication reading tokens and their users from the token cache first. Tokens are
+    only cached once they were validated, for active users.
+    Tokens are dropped from the cache of all processes when they are deleted, or when their
+    user is updated, for instance deactivated.
+    """
+
+    def authenticate_credentials(self, key):
+        """
+        Get the user and token from the cache, or validate them from the database. The version
+        of the token is read first, so changes committed while the database is read drop the
+        copy that is cached.
+        """
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+
+        version = get_token_version(key)
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(user, token, version)
+        return user, token
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    """
+    Rotated or deleted tokens must stop working right away.
+    """
+    token_cache.delete(instance.key)
+    invalidate_token_versions([instance.key])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_tokens(sender, instance, **kwargs):
+    """
+    Deactivated users must be rejected right away, and other changes to users visible.
+    """
+    token_cache.delete_user(instance.pk)
+    invalidate_token_versions(
+        Token.objects.filter(user=instance.pk).values_list("key", flat=True)
+    )
@@ -1,9 +1,14 @@
 from io import BytesIO
 from unittest import mock
 
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework.authtoken.models import Token
+from rest_framework.fields import DateTimeField
 
 from partaj.core import factories, models
 
@@ -24,25 +29,254 @@ class ReferralApiTestCase(TestCase):
 
     def test_list_referrals_by_random_logged_in_user(self, _):
         """
-        Logged-in users cannot make list requests on the referral endpoints.
+        Logged-in users can make list requests on the referral endpoints but only get the
+        referrals they have access to.
         """
         user = factories.UserFactory()
+        factories.ReferralFactory()
         response = self.client.get(
             "/api/referrals/",
             HTTP_AUTHORIZATION=f"Token {Token.objects.get_or_create(user=user)[0]}",
         )
-        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], [])
 
     def test_list_referrals_by_admin_user(self, _):
         """
-        Admin users cannot make list requests on the referral endpoints.
+        Admin users do not get access to all referrals through the list endpoint.
         """
         user = factories.UserFactory(is_staff=True)
+        factories.ReferralFactory()
         response = self.client.get(
             "/api/referrals/",
             HTTP_AUTHORIZATION=f"Token {Token.objects.get_or_create(user=user)[0]}",
         )
-        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], [])
+
+    def test_list_referrals_by_linked_user_and_unit_member(self, _):
+        """
+        Users get the referrals they created and the referrals linked to their units,
+        most recent first.
+        """
+        user = factories.UserFactory()
+        created_referral = factories.ReferralFactory(user=user)
+        unit_referral = factories.ReferralFactory()
+        unit_referral.topic.unit.members.add(user)
+        factories.ReferralFactory()
+
+        response = self.client.get(
+            "/api/referrals/",
+            HTTP_AUTHORIZATION=f"Token {Token.objects.get_or_create(user=user)[0]}",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [referral["id"] for referral in response.json()["results"]],
+            [unit_referral.id, created_referral.id],
+        )
+
+        response = self.client.get(
+            "/api/referrals/?ordering=created_at",
+            HTTP_AUTHORIZATION=f"Token {Token.objects.get_or_create(user=user)[0]}",
+        )
+        self.assertEqual(
+            [referral["id"] for referral in response.json()["results"]],
+            [created_referral.id, unit_referral.id],
+        )
+
+    def test_list_referrals_with_filters(self, _):
+        """
+        Lists of referrals can be filtered by state, topic, unit, assignee and urgency.
+        """
+        user = factories.UserFactory()
+        unit = factories.UnitFactory()
+        unit.members.add(user)
+        topic = factories.TopicFactory(unit=unit)
+        received_referral = factories.ReferralFactory(topic=topic)
+        assigned_referral = factories.ReferralFactory(
+            state=models.ReferralState.ASSIGNED, topic=topic
+        )
+        assignment = factories.ReferralAssignmentFactory(
+            referral=assigned_referral, unit=unit
+        )
+        other_topic_referral = factories.ReferralFactory(
+            topic=factories.TopicFactory(unit=unit)
+        )
+        token = Token.objects.get_or_create(user=user)[0]
+
+        def get_ids(query):
+            response = self.client.get(
+                f"/api/referrals/?{query}", HTTP_AUTHORIZATION=f"Token {token}",
+            )
+            self.assertEqual(response.status_code, 200)
+            return [referral["id"] for referral in response.json()["results"]]
+
+        self.assertEqual(
+            get_ids(f"unit={unit.id}"),
+            [other_topic_referral.id, assigned_referral.id, received_referral.id],
+        )
+        self.assertEqual(
+            get_ids(f"topic={topic.id}"), [assigned_referral.id, received_referral.id]
+        )
+        self.assertEqual(
+            get_ids("state=received&state=closed"),
+            [other_topic_referral.id, received_referral.id],
+        )
+        self.assertEqual(
+            get_ids(f"assignee={assignment.assignee.id}"), [assigned_referral.id]
+        )
+        self.assertEqual(
+            get_ids(f"urgency={received_referral.urgency_level.id}"),
+            [received_referral.id],
+        )
+
+    def test_list_referrals_with_invalid_filters(self, _):
+        """
+        Invalid filter values are reported to the client.
+        """
+        user = factories.UserFactory()
+        response = self.client.get(
+            "/api/referrals/?state=unknown&topic=42",
+            HTTP_AUTHORIZATION=f"Token {Token.objects.get_or_create(user=user)[0]}",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json().keys()), {"state", "topic"})
+
+    def test_list_referrals_pagination(self, _):
+        """
+        Referral lists are paginated with cursors and every page costs the same number
+        of queries.
+        """
+        user = factories.UserFactory()
+        referrals = factories.ReferralFactory.create_batch(5, user=user)
+        token = Token.objects.get_or_create(user=user)[0]
+
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                "/api/referrals/?limit=2", HTTP_AUTHORIZATION=f"Token {token}",
+            )
+        self.assertEqual(
+            [referral["id"] for referral in response.json()["results"]],
+            [referrals[4].id, referrals[3].id],
+        )
+        self.assertIsNone(response.json()["previous"])
+
+        # The token is now read from the cache
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                response.json()["next"], HTTP_AUTHORIZATION=f"Token {token}",
+            )
+        self.assertEqual(
+            [referral["id"] for referral in response.json()["results"]],
+            [referrals[2].id, referrals[1].id],
+        )
+
+        response = self.client.get(
+            response.json()["next"], HTTP_AUTHORIZATION=f"Token {token}",
+        )
+        self.assertEqual(
+            [referral["id"] for referral in response.json()["results"]],
+            [referrals[0].id],
+        )
+        self.assertIsNone(response.json()["next"])
+
+    def test_list_referrals_pagination_same_creation_date(self, _):
+        """
+        Pages are keyed on the creation date and id of referrals, without offsets, so none is
+        skipped or repeated when they share the same creation date, in both directions and orderings.
+        """
+        user = factories.UserFactory()
+        referrals = factories.ReferralFactory.create_batch(5, user=user)
+        models.Referral.objects.update(created_at=referrals[0].created_at)
+        token = Token.objects.get_or_create(user=user)[0]
+
+        for ordering, expected in [
+            ("", [referral.id for referral in reversed(referrals)]),
+            ("&ordering=created_at", [referral.id for referral in referrals]),
+        ]:
+            pages = []
+            url = f"/api/referrals/?limit=2{ordering}"
+            while url:
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, HTTP_AUTHORIZATION=f"Token {token}")
+                self.assertEqual(response.status_code, 200)
+                # Pages start at their position in the list, not at an offset
+                self.assertFalse(
+                    any("OFFSET" in query["sql"] for query in queries.captured_queries)
+                )
+                pages.append(
+                    [referral["id"] for referral in response.json()["results"]]
+                )
+                url = response.json()["next"]
+            self.assertEqual(pages, [expected[:2], expected[2:4], expected[4:]])
+
+            # Going back from the last page lists the same referrals
+            response = self.client.get(
+                response.json()["previous"], HTTP_AUTHORIZATION=f"Token {token}"
+            )
+            self.assertEqual(
+                [referral["id"] for referral in response.json()["results"]],
+                expected[2:4],
+            )
+
+    def test_list_referrals_pagination_invalid_cursor(self, _):
+        """
+        Cursors with a position that is not a creation date and id are rejected.
+        """
+        user = factories.UserFactory()
+        token = Token.objects.get_or_create(user=user)[0]
+
+        # "p=2020-01-01" encoded the way DRF encodes cursors
+        response = self.client.get(
+            "/api/referrals/?cursor=cD0yMDIwLTAxLTAx",
+            HTTP_AUTHORIZATION=f"Token {token}",
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_list_referrals_summary(self, _):
+        """
+        Referral lists use a compact representation of referrals.
+        """
+        user = factories.UserFactory()
+        referral = factories.ReferralFactory(
+            state=models.ReferralState.ASSIGNED, user=user
+        )
+        assignment = factories.ReferralAssignmentFactory(
+            referral=referral, unit=referral.topic.unit
+        )
+
+        response = self.client.get(
+            "/api/referrals/",
+            HTTP_AUTHORIZATION=f"Token {Token.objects.get_or_create(user=user)[0]}",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["results"],
+            [
+                {
+                    "assignees": [assignment.assignee.get_full_name()],
+                    "created_at": DateTimeField().to_representation(
+                        referral.created_at
+                    ),
+                    "due_date": DateTimeField().to_representation(
+                        referral.created_at + referral.urgency_level.duration
+                    ),
+                    "id": referral.id,
+                    "requester": referral.requester,
+                    "state": "assigned",
+                    "topic": referral.topic.name,
+                    "urgency_level": referral.urgency_level.name,
+                }
+            ],
+        )
+
+        response = self.client.get(
+            "/api/referrals/?fields=id,state",
+            HTTP_AUTHORIZATION=f"Token {Token.objects.get_or_create(user=user)[0]}",
+        )
+        self.assertEqual(
+            response.json()["results"], [{"id": referral.id, "state": "assigned"}]
+        )
 
     # RETRIEVE TESTS
     def test_retrieve_referral_by_anonymous_user(self, _):
@@ -109,6 +343,97 @@ class ReferralApiTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json()["id"], referral.id)
 
+    def test_retrieve_referral_query_count(self, _):
+        """
+        Retrieving a referral costs a constant number of queries, regardless of the number of
+        unit members, attachments, answers or activities on the referral.
+        """
+        user = factories.UserFactory()
+        referral = factories.ReferralFactory(user=user)
+        token = Token.objects.get_or_create(user=user)[0]
+
+        def add_related_objects():
+            # Flesh out the referral with more of every nested object we serialize
+            factories.UnitMembershipFactory(unit=referral.topic.unit)
+            factories.ReferralAttachmentFactory(referral=referral)
+            assignment = factories.ReferralAssignmentFactory(
+                referral=referral, unit=referral.topic.unit
+            )
+            factories.ReferralActivityFactory(
+                actor=assignment.created_by,
+                referral=referral,
+                verb=models.ReferralActivityVerb.ASSIGNED,
+                item_content_object=assignment.assignee,
+            )
+            answer = factories.ReferralAnswerFactory(referral=referral)
+            factories.ReferralAnswerAttachmentFactory(referral_answer=answer)
+            factories.ReferralActivityFactory(
+                actor=answer.created_by,
+                referral=referral,
+                verb=models.ReferralActivityVerb.ANSWERED,
+                item_content_object=answer,
+            )
+
+        add_related_objects()
+        with self.assertNumQueries(13):
+            response = self.client.get(
+                f"/api/referrals/{referral.id}/", HTTP_AUTHORIZATION=f"Token {token}",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["activity"]), 2)
+
+        # The token is now read from the cache
+        for _ in range(3):
+            add_related_objects()
+        with self.assertNumQueries(12):
+            response = self.client.get(
+                f"/api/referrals/{referral.id}/", HTTP_AUTHORIZATION=f"Token {token}",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["activity"]), 8)
+        self.assertEqual(len(response.json()["answers"]), 4)
+        for activity in response.json()["activity"]:
+            if activity["verb"] == models.ReferralActivityVerb.ANSWERED:
+                self.assertEqual(len(activity["item_content_object"]["attachments"]), 1)
+            else:
+                self.assertIn("email", activity["item_content_object"])
+        self.assertEqual(len(response.json()["attachments"]), 4)
+        self.assertEqual(len(response.json()["topic"]["unit"]["members"]), 12)
+
+    def test_retrieve_referral_with_sparse_fieldsets(self, _):
+        """
+        Clients can pick the fields they need and which nested objects to expand. Objects
+        that are not expanded are collapsed to their primary key and relations that are
+        not rendered are not queried at all.
+        """
+        user = factories.UserFactory()
+        referral = factories.ReferralFactory(user=user)
+        attachment = factories.ReferralAttachmentFactory(referral=referral)
+        token = Token.objects.get_or_create(user=user)[0]
+
+        with self.assertNumQueries(4):
+            response = self.client.get(
+                f"/api/referrals/{referral.id}/?fields=id,attachments,topic",
+                HTTP_AUTHORIZATION=f"Token {token}",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {
+                "attachments": [str(attachment.id)],
+                "id": referral.id,
+                "topic": str(referral.topic.id),
+            },
+        )
+
+        response = self.client.get(
+            f"/api/referrals/{referral.id}/?fields=id,topic&expand=topic",
+            HTTP_AUTHORIZATION=f"Token {token}",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["topic"]["name"], referral.topic.name)
+        self.assertEqual(response.json()["topic"]["unit"]["members"], [])
+
     # CREATE TESTS
     def test_create_referral_by_anonymous_user(self, _):
         """
@@ -319,6 +644,30 @@ class ReferralApiTestCase(TestCase):
         self.assertEqual(response.json()["state"], models.ReferralState.ANSWERED)
         self.assertEqual(response.json()["answers"][0]["content"], "answer content")
 
+    def test_answer_referral_query_count(self, _):
+        """
+        Permission checks on the answer action share one referral lookup and check
+        membership with a single query.
+        """
+        referral = factories.ReferralFactory()
+        user = factories.UnitMembershipFactory(
+            role=models.UnitMembershipRole.MEMBER, unit=referral.topic.unit
+        ).user
+        token = Token.objects.get_or_create(user=user)[0]
+
+        # Warm up the content types cache, which is shared by all requests in a process
+        ContentType.objects.get_for_model(models.ReferralAnswer)
+
+        # Including the savepoint around the transition, as tests run in a transaction, and
+        # the queries keeping topic and assignment counters up to date
+        with self.assertNumQueries(21):
+            response = self.client.post(
+                f"/api/referrals/{referral.id}/answer/",
+                {"content": "answer content"},
+                HTTP_AUTHORIZATION=f"Token {token}",
+            )
+        self.assertEqual(response.status_code, 200)
+
     # ASSIGN TESTS
     def test_assign_referral_by_anonymous_user(self, _):
         """
@@ -435,6 +784,31 @@ class ReferralApiTestCase(TestCase):
             response.json()["assignees"], [str(exsting_assignee.id), str(assignee.id)]
         )
 
+    def test_assign_referral_query_count(self, _):
+        """
+        Permission checks on the assign action share one referral lookup and check
+        the organizer role with a single query.
+        """
+        referral = factories.ReferralFactory()
+        user = factories.UnitMembershipFactory(
+            role=models.UnitMembershipRole.OWNER, unit=referral.topic.unit
+        ).user
+        assignee = factories.UnitMembershipFactory(unit=referral.topic.unit).user
+        token = Token.objects.get_or_create(user=user)[0]
+
+        # Warm up the content types cache, which is shared by all requests in a process
+        ContentType.objects.get_for_model(get_user_model())
+
+        # Including the savepoint around the transition, as tests run in a transaction, and
+        # the queries keeping topic and assignment counters up to date
+        with self.assertNumQueries(20):
+            response = self.client.post(
+                f"/api/referrals/{referral.id}/assign/",
+                {"assignee_id": assignee.id},
+                HTTP_AUTHORIZATION=f"Token {token}",
+            )
+        self.assertEqual(response.status_code, 200)
+
     # ASSIGN TESTS
     def test_unassign_referral_by_anonymous_user(self, _):
         """
@@ -563,3 +937,27 @@ class ReferralApiTestCase(TestCase):
         self.assertEqual(
             response.json()["assignees"], [str(assignment_to_keep.assignee.id)]
         )
+
+    def test_unassign_referral_query_count(self, _):
+        """
+        Permission checks on the unassign action share one referral lookup and check
+        the organizer role with a single query.
+        """
+        referral = factories.ReferralFactory(state=models.ReferralState.ASSIGNED)
+        assignment = factories.ReferralAssignmentFactory(
+            referral=referral, unit=referral.topic.unit,
+        )
+        token = Token.objects.get_or_create(user=assignment.created_by)[0]
+
+        # Warm up the content types cache, which is shared by all requests in a process
+        ContentType.objects.get_for_model(get_user_model())
+
+        # Including the savepoint around the transition, as tests run in a transaction, and
+        # the queries keeping topic and assignment counters and cached fragments up to date
+        with self.assertNumQueries(29):
+            response = self.client.post(
+                f"/api/referrals/{referral.id}/unassign/",
+                {"assignee_id": assignment.assignee.id},
+                HTTP_AUTHORIZATION=f"Token {token}",
+            )
+        self.assertEqual(response.status_code, 200)
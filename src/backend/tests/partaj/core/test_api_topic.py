@@ -1,3 +1,4 @@
+from django.core.cache import cache
 from django.test import TestCase
 from rest_framework.authtoken.models import Token
 
@@ -11,6 +12,9 @@ class TopicApiTestCase(TestCase):
     Test API routes and actions related to Topic endpoints.
     """
 
+    def setUp(self):
+        cache.clear()
+
     # CREATE, UPDATE and DESTROY are not supported
     def test_create_topic(self):
         """
@@ -77,6 +81,83 @@ class TopicApiTestCase(TestCase):
         self.assertEqual(response.json()["count"], 11)
         self.assertEqual(len(response.json()["results"]), 11)
 
+    def test_list_topics_compact_payload(self):
+        """
+        Topics are listed with the id and name of their unit only, in a constant number
+        of queries.
+        """
+        user = factories.UserFactory()
+        token = Token.objects.get_or_create(user=user)[0]
+        unit = factories.UnitFactory(name="The unit")
+        factories.UnitMembershipFactory.create_batch(3, unit=unit)
+        topic = factories.TopicFactory(name="The topic", unit=unit)
+        factories.TopicFactory.create_batch(3)
+
+        # Authentication, count and topics
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                "/api/topics/?limit=999", HTTP_AUTHORIZATION=f"Token {token}"
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            {
+                "id": str(topic.id),
+                "name": "The topic",
+                "unit": {"id": str(unit.id), "name": "The unit"},
+            },
+            response.json()["results"],
+        )
+
+    def test_list_topics_cached_and_conditional(self):
+        """
+        Lists are served from the cache with an ETag, and clients with a current copy get a
+        304. Lists are invalidated when topics or units change.
+        """
+        user = factories.UserFactory()
+        token = Token.objects.get_or_create(user=user)[0]
+        topic = factories.TopicFactory()
+        auth = {"HTTP_AUTHORIZATION": f"Token {token}"}
+
+        response = self.client.get("/api/topics/?limit=999", **auth)
+        etag = response["ETag"]
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertIn("private", response["Cache-Control"])
+
+        # The token is read from the cache too
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/topics/?limit=999", **auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["count"], 1)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                "/api/topics/?limit=999", HTTP_IF_NONE_MATCH=etag, **auth
+            )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        # Other queries are different lists with their own ETag
+        response = self.client.get(f"/api/topics/?unit={topic.unit.id}", **auth)
+        self.assertNotEqual(response["ETag"], etag)
+
+        topic.unit.name = "New unit name"
+        topic.unit.save()
+        response = self.client.get(
+            "/api/topics/?limit=999", HTTP_IF_NONE_MATCH=etag, **auth
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["unit"]["name"], "New unit name")
+        etag = response["ETag"]
+
+        factories.TopicFactory()
+        response = self.client.get(
+            "/api/topics/?limit=999", HTTP_IF_NONE_MATCH=etag, **auth
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 2)
+
     def test_list_topics_by_anonymous_user(self):
         """
         Anonymous users cannot list existing topics.
@@ -0,0 +1,239 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from partaj.core import factories, models
+
+
+@override_settings(ATTACHMENT_DIRECT_UPLOAD_EXPIRE=60)
+@mock.patch("partaj.core.email.Mailer.send")
+@mock.patch("partaj.core.uploads.default_storage")
+class UploadsApiTestCase(TestCase):
+    """
+    Test direct uploads of attachment files to the object storage, and their registration
+    with referrals and answers.
+    """
+
+    def get_upload_targets(self, user, names):
+        """
+        Get upload targets for a list of file names with the API.
+        """
+        return self.client.post(
+            "/api/referrals/upload-targets/",
+            {"names": names},
+            content_type="application/json",
+            HTTP_AUTHORIZATION=f"Token {Token.objects.get_or_create(user=user)[0]}",
+        )
+
+    def create_referral(self, user, uploads):
+        """
+        Create a referral with attachments uploaded directly to the object storage.
+        """
+        return self.client.post(
+            "/api/referrals/",
+            {
+                "context": "le contexte",
+                "prior_work": "le travail préalable",
+                "question": "la question posée",
+                "requester": "le demandeur ou la demandeuse",
+                "topic": str(factories.TopicFactory().id),
+                "uploads": uploads,
+                "urgency_level": factories.ReferralUrgencyFactory().id,
+                "urgency_explanation": "la justification de l'urgence",
+            },
+            HTTP_AUTHORIZATION=f"Token {Token.objects.get_or_create(user=user)[0]}",
+        )
+
+    def test_upload_targets_anonymous_user(self, mock_storage, _):
+        """
+        Anonymous users cannot get upload targets.
+        """
+        response = self.client.post(
+            "/api/referrals/upload-targets/",
+            {"names": ["notes.txt"]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 401)
+        mock_storage.get_upload_target.assert_not_called()
+
+    @override_settings(ATTACHMENT_DIRECT_UPLOAD_EXPIRE=0)
+    def test_upload_targets_disabled(self, mock_storage, _):
+        """
+        Direct uploads are not available unless they are enabled in settings.
+        """
+        response = self.get_upload_targets(factories.UserFactory(), ["notes.txt"])
+        self.assertEqual(response.status_code, 404)
+
+    def test_upload_targets_invalid_names(self, mock_storage, _):
+        """
+        A list of file names is required to get upload targets.
+        """
+        user = factories.UserFactory()
+        for names in [None, "notes.txt", [""], [3]]:
+            response = self.get_upload_targets(user, names)
+            self.assertEqual(response.status_code, 400)
+
+    def test_upload_targets_and_create_referral(self, mock_storage, _):
+        """
+        Logged-in users get a signed upload target for each file, then create a referral
+        with the upload tokens, after the size of each uploaded file was checked.
+        """
+        mock_storage.get_upload_target.side_effect = [
+            {"fields": {"key": "first"}, "url": "https://s3.example.com/bucket"},
+            {"fields": {"key": "second"}, "url": "https://s3.example.com/bucket"},
+        ]
+        user = factories.UserFactory()
+
+        response = self.get_upload_targets(user, ["Décision finale.pdf", "notes.txt"])
+        self.assertEqual(response.status_code, 201)
+        targets = response.json()
+        self.assertEqual(
+            [(target["fields"], target["url"]) for target in targets],
+            [
+                ({"key": "first"}, "https://s3.example.com/bucket"),
+                ({"key": "second"}, "https://s3.example.com/bucket"),
+            ],
+        )
+        keys = [call[0][0] for call in mock_storage.get_upload_target.call_args_list]
+        self.assertRegex(keys[0], r"^[0-9a-f-]{36}/Décision_finale\.pdf$")
+        self.assertRegex(keys[1], r"^[0-9a-f-]{36}/notes\.txt$")
+        self.assertEqual(
+            mock_storage.get_upload_target.call_args[1],
+            {"expire": 60, "max_size": 100 * 1024 * 1024},
+        )
+
+        mock_storage.get_uploaded_size.side_effect = [1234, 56]
+        response = self.create_referral(user, [target["upload"] for target in targets])
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(
+            [call[0][0] for call in mock_storage.get_uploaded_size.call_args_list],
+            keys,
+        )
+        referral = models.Referral.objects.get(id=response.json()["id"])
+        attachments = referral.attachments.order_by("name")
+        self.assertEqual(
+            [
+                (
+                    str(attachment.id),
+                    attachment.file.name,
+                    attachment.name,
+                    attachment.size,
+                )
+                for attachment in attachments
+            ],
+            [
+                (keys[0].split("/")[0], keys[0], "Décision finale", 1234),
+                (keys[1].split("/")[0], keys[1], "notes", 56),
+            ],
+        )
+
+    def test_create_referral_invalid_uploads(self, mock_storage, _):
+        """
+        Referrals are not created with forged, foreign, reused or missing uploads.
+        """
+        mock_storage.get_upload_target.return_value = {"fields": {}, "url": "url"}
+        mock_storage.get_uploaded_size.return_value = 10
+        user = factories.UserFactory()
+        upload = self.get_upload_targets(user, ["notes.txt"]).json()[0]["upload"]
+
+        # Forged token
+        response = self.create_referral(user, [upload + "x"])
+        self.assertEqual(response.status_code, 400)
+        # Token for another user
+        response = self.create_referral(factories.UserFactory(), [upload])
+        self.assertEqual(response.status_code, 400)
+        # File that was not uploaded
+        mock_storage.get_uploaded_size.return_value = None
+        response = self.create_referral(user, [upload])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"uploads": ["notes was not uploaded."]})
+        # File that is too large
+        mock_storage.get_uploaded_size.return_value = 100 * 1024 * 1024 + 1
+        response = self.create_referral(user, [upload])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(models.Referral.objects.count(), 0)
+
+        # Reused token
+        mock_storage.get_uploaded_size.return_value = 10
+        self.assertEqual(self.create_referral(user, [upload]).status_code, 201)
+        response = self.create_referral(user, [upload])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(models.Referral.objects.count(), 1)
+
+    def test_create_referral_duplicate_uploads(self, mock_storage, _):
+        """
+        Upload tokens sent several times in a request are only registered once.
+        """
+        mock_storage.get_upload_target.return_value = {"fields": {}, "url": "url"}
+        mock_storage.get_uploaded_size.return_value = 10
+        user = factories.UserFactory()
+        upload = self.get_upload_targets(user, ["notes.txt"]).json()[0]["upload"]
+
+        response = self.create_referral(user, [upload, upload])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(models.ReferralAttachment.objects.count(), 1)
+        self.assertEqual(mock_storage.get_uploaded_size.call_count, 1)
+        self.assertFalse(models.AttachmentUpload.objects.exists())
+
+    def test_collect_attachment_uploads(self, mock_storage, _):
+        """
+        Uploads that were never registered are deleted with their file once their token
+        expired for the grace period.
+        """
+        mock_storage.get_upload_target.return_value = {"fields": {}, "url": "url"}
+        user = factories.UserFactory()
+        self.get_upload_targets(user, ["expired.txt", "recent.txt"])
+        expired = models.AttachmentUpload.objects.get(key__endswith="/expired.txt")
+        recent = models.AttachmentUpload.objects.get(key__endswith="/recent.txt")
+        # Tokens expire after 120 seconds, collect uploads an hour later
+        models.AttachmentUpload.objects.filter(id=expired.id).update(
+            created_at=timezone.now() - timedelta(hours=1, seconds=121)
+        )
+
+        with mock.patch(
+            "partaj.core.management.commands.collect_attachment_uploads.default_storage"
+        ) as mock_collected_storage, mock.patch(
+            "django.db.transaction.on_commit", side_effect=lambda callback: callback()
+        ):
+            call_command(
+                "collect_attachment_uploads", grace_period=1, stdout=mock.Mock()
+            )
+
+        mock_collected_storage.delete.assert_called_once_with(expired.key)
+        self.assertEqual(list(models.AttachmentUpload.objects.all()), [recent])
+
+    def test_answer_referral_with_uploads(self, mock_storage, _):
+        """
+        Unit members can answer a referral with files uploaded directly to the storage.
+        """
+        mock_storage.get_upload_target.return_value = {"fields": {}, "url": "url"}
+        mock_storage.get_uploaded_size.return_value = 10
+        referral = factories.ReferralFactory(state=models.ReferralState.ASSIGNED)
+        user = factories.UnitMembershipFactory(unit=referral.topic.unit).user
+        upload = self.get_upload_targets(user, ["answer.pdf"]).json()[0]["upload"]
+
+        response = self.client.post(
+            f"/api/referrals/{referral.id}/answer/",
+            {"content": "answer content", "uploads": [upload + "x"]},
+            HTTP_AUTHORIZATION=f"Token {Token.objects.get_or_create(user=user)[0]}",
+        )
+        self.assertEqual(response.status_code, 400)
+        referral.refresh_from_db()
+        self.assertEqual(referral.state, models.ReferralState.ASSIGNED)
+
+        response = self.client.post(
+            f"/api/referrals/{referral.id}/answer/",
+            {"content": "answer content", "uploads": [upload]},
+            HTTP_AUTHORIZATION=f"Token {Token.objects.get_or_create(user=user)[0]}",
+        )
+        self.assertEqual(response.status_code, 200)
+        attachment = models.ReferralAnswerAttachment.objects.get()
+        self.assertEqual(attachment.referral_answer.referral, referral)
+        self.assertEqual(attachment.name, "answer")
+        self.assertEqual(attachment.size, 10)
@@ -0,0 +1,60 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from rest_framework.authtoken.models import Token
+
+from partaj.core import factories
+
+
+class UrgencyApiTestCase(TestCase):
+    """
+    Test API routes and actions related to urgency endpoints.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_list_urgencies_cached_and_conditional(self):
+        """
+        Urgency levels are listed from the cache, and invalidated when they change.
+        """
+        user = factories.UserFactory()
+        auth = {"HTTP_AUTHORIZATION": f"Token {Token.objects.create(user=user)}"}
+        urgency = factories.ReferralUrgencyFactory(name="One week")
+
+        def get_name(response):
+            return {item["id"]: item["name"] for item in response.json()["results"]}[
+                urgency.id
+            ]
+
+        response = self.client.get("/api/urgencies/?limit=999", **auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_name(response), "One week")
+        etag = response["ETag"]
+
+        response = self.client.get(
+            "/api/urgencies/?limit=999", HTTP_IF_NONE_MATCH=etag, **auth
+        )
+        self.assertEqual(response.status_code, 304)
+
+        urgency.name = "Seven days"
+        urgency.save()
+        response = self.client.get(
+            "/api/urgencies/?limit=999", HTTP_IF_NONE_MATCH=etag, **auth
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_name(response), "Seven days")
+
+    def test_list_urgencies_by_anonymous_user(self):
+        """
+        Anonymous users cannot list urgency levels, even from the cache.
+        """
+        factories.ReferralUrgencyFactory()
+        user = factories.UserFactory()
+        self.client.get(
+            "/api/urgencies/?limit=999",
+            HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=user)}",
+        )
+
+        response = self.client.get("/api/urgencies/?limit=999")
+        self.assertEqual(response.status_code, 401)
@@ -0,0 +1,202 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from partaj.core import factories, models
+
+
+class CountersTestCase(TestCase):
+    """
+    Test the counters of referrals and assignments displayed on unit pages.
+    """
+
+    def assertCounters(self, topic, referral_count, open_referral_count):
+        """
+        Check the counters of a topic as stored in the database.
+        """
+        topic.refresh_from_db()
+        self.assertEqual(
+            (topic.referral_count, topic.open_referral_count),
+            (referral_count, open_referral_count),
+        )
+
+    def get_active_assignment_count(self, user, unit):
+        """
+        Get the counter of active assignments of a user in a unit.
+        """
+        return models.UnitMembership.objects.get(
+            user=user, unit=unit
+        ).active_assignment_count
+
+    def test_counters_referral_lifecycle(self):
+        """
+        Counters follow referrals as they are created, assigned, answered and deleted.
+        """
+        topic = factories.TopicFactory()
+        unit = topic.unit
+        assignee = factories.UnitMembershipFactory(unit=unit).user
+        owner = factories.UnitMembershipFactory(
+            unit=unit, role=models.UnitMembershipRole.OWNER
+        ).user
+
+        referral = factories.ReferralFactory(topic=topic)
+        factories.ReferralFactory(topic=topic, state=models.ReferralState.CLOSED)
+        self.assertCounters(topic, 2, 1)
+
+        referral.assign(assignee=assignee, created_by=owner)
+        referral.save()
+        self.assertCounters(topic, 2, 1)
+        self.assertEqual(self.get_active_assignment_count(assignee, unit), 1)
+
+        referral.answer(content="The answer", attachments=[], created_by=assignee)
+        referral.save()
+        self.assertCounters(topic, 2, 0)
+        self.assertEqual(self.get_active_assignment_count(assignee, unit), 0)
+
+        # Assignments of answered referrals are not counted out a second time
+        referral.delete()
+        self.assertCounters(topic, 1, 0)
+        self.assertEqual(self.get_active_assignment_count(assignee, unit), 0)
+
+    def test_counters_unassign_and_move_topic(self):
+        """
+        Unassigned members and the topics referrals are moved from are counted down.
+        """
+        topic = factories.TopicFactory()
+        other_topic = factories.TopicFactory(unit=topic.unit)
+        referral = factories.ReferralFactory(topic=topic)
+        assignment = factories.ReferralAssignmentFactory(
+            referral=referral, unit=topic.unit
+        )
+        referral.state = models.ReferralState.ASSIGNED
+        referral.save()
+        self.assertEqual(
+            self.get_active_assignment_count(assignment.assignee, topic.unit), 1
+        )
+
+        referral.unassign(
+            assignee=assignment.assignee, created_by=assignment.created_by
+        )
+        referral.save()
+        self.assertEqual(referral.state, models.ReferralState.RECEIVED)
+        self.assertEqual(
+            self.get_active_assignment_count(assignment.assignee, topic.unit), 0
+        )
+
+        referral.topic = other_topic
+        referral.save()
+        self.assertCounters(topic, 0, 0)
+        self.assertCounters(other_topic, 1, 1)
+
+    def test_counters_membership_created_after_assignment(self):
+        """
+        Assignments made before a user joins the unit are counted when they join.
+        """
+        unit = factories.UnitFactory()
+        user = factories.UserFactory()
+        factories.ReferralAssignmentFactory(
+            assignee=user, referral=factories.ReferralFactory(), unit=unit
+        )
+
+        membership = factories.UnitMembershipFactory(unit=unit, user=user)
+        self.assertEqual(membership.active_assignment_count, 1)
+
+    def test_counters_members_added_to_unit(self):
+        """
+        Members added through the relation of units and users get their assignments counted,
+        and can then be unassigned.
+        """
+        topic = factories.TopicFactory()
+        unit = topic.unit
+        users = factories.UserFactory.create_batch(2)
+        referral = factories.ReferralFactory(topic=topic)
+        for user in users:
+            factories.ReferralAssignmentFactory(
+                assignee=user, referral=referral, unit=unit
+            )
+        referral.state = models.ReferralState.ASSIGNED
+        referral.save()
+
+        unit.members.add(users[0])
+        users[1].unit_set.add(unit)
+        for user in users:
+            self.assertEqual(self.get_active_assignment_count(user, unit), 1)
+
+        for user in users:
+            referral.unassign(assignee=user, created_by=user)
+            referral.save()
+            self.assertEqual(self.get_active_assignment_count(user, unit), 0)
+
+    def test_counters_stale_instances_saved(self):
+        """
+        Saving topics and memberships loaded before their counters changed keeps the counters.
+        """
+        topic = factories.TopicFactory()
+        membership = factories.UnitMembershipFactory(unit=topic.unit)
+        stale_topic = models.Topic.objects.get(id=topic.id)
+        stale_membership = models.UnitMembership.objects.get(id=membership.id)
+
+        factories.ReferralAssignmentFactory(
+            assignee=membership.user,
+            referral=factories.ReferralFactory(topic=topic),
+            unit=topic.unit,
+        )
+        stale_topic.name = "New name"
+        stale_topic.save()
+        stale_membership.role = models.UnitMembershipRole.ADMIN
+        stale_membership.save()
+        stale_membership.save(update_fields=["role", "active_assignment_count"])
+
+        self.assertCounters(topic, 1, 1)
+        topic.refresh_from_db()
+        self.assertEqual(topic.name, "New name")
+        membership.refresh_from_db()
+        self.assertEqual(membership.role, models.UnitMembershipRole.ADMIN)
+        self.assertEqual(membership.active_assignment_count, 1)
+
+    def test_counters_rebuild_counters_command(self):
+        """
+        The command fixes counters that drifted after bulk updates.
+        """
+        topic = factories.TopicFactory()
+        assignment = factories.ReferralAssignmentFactory(
+            referral=factories.ReferralFactory(topic=topic), unit=topic.unit
+        )
+        models.Referral.objects.update(state=models.ReferralState.CLOSED)
+        self.assertCounters(topic, 1, 1)
+
+        call_command("rebuild_counters", stdout=StringIO())
+        self.assertCounters(topic, 1, 0)
+        self.assertEqual(
+            self.get_active_assignment_count(assignment.assignee, topic.unit), 0
+        )
+
+    def test_counters_unit_pages_constant_queries(self):
+        """
+        The topics and members pages do not count referrals and assignments.
+        """
+        unit = factories.UnitFactory()
+        user = factories.UnitMembershipFactory(unit=unit).user
+        self.client.force_login(user)
+        for _ in range(3):
+            factories.ReferralAssignmentFactory(
+                referral=factories.ReferralFactory(
+                    topic=factories.TopicFactory(unit=unit)
+                ),
+                unit=unit,
+            )
+
+        with self.assertNumQueries(6):
+            response = self.client.get(f"/unit/{unit.id}/topics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["topics"]), 3)
+        self.assertContains(response, "<td>1</td>", count=6)
+
+        # The navigation is read from the cache
+        with self.assertNumQueries(5):
+            response = self.client.get(f"/unit/{unit.id}/members/")
+        self.assertEqual(response.status_code, 200)
+        # Each assignment created an assignee and an owner, besides the logged in user
+        self.assertEqual(len(response.context["memberships"]), 7)
+        self.assertContains(response, "<td>1</td>", count=3)
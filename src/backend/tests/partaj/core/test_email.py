@@ -0,0 +1,383 @@
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+import requests
+
+from partaj.core import factories, models
+from partaj.core.email import Mailer
+
+
+@override_settings(SENDINBLUE={**settings.SENDINBLUE, "API_KEY": "some-api-key"})
+class EmailOutboxTestCase(TestCase):
+    """
+    Test the email outbox: emails are queued by the Mailer and sent by the `send_emails`
+    management command.
+    """
+
+    def test_email_send_queues_email(self):
+        """
+        Sending an email only writes it to the outbox without calling the email provider.
+        """
+        referral = factories.ReferralFactory()
+        with mock.patch("partaj.core.email.requests.Session.request") as mock_request:
+            Mailer.send_referral_saved(referral)
+
+        mock_request.assert_not_called()
+        email = models.OutgoingEmail.objects.get()
+        self.assertEqual(email.state, models.OutgoingEmailState.PENDING)
+        self.assertEqual(email.attempts, 0)
+        self.assertEqual(
+            json.loads(email.payload),
+            {
+                "params": {"case_number": referral.id},
+                "replyTo": {"email": "contact@partaj.beta.gouv.fr", "name": "Partaj"},
+                "templateId": settings.SENDINBLUE["REFERRAL_SAVED_TEMPLATE_ID"],
+                "to": [{"email": referral.user.email}],
+            },
+        )
+
+    def test_email_send_referral_received_batches_organizers(self):
+        """
+        Organizers of the unit each get their own copy of the email, in a single call.
+        """
+        referral = factories.ReferralFactory()
+        unit = referral.topic.unit
+        owner = factories.UnitMembershipFactory(
+            role=models.UnitMembershipRole.OWNER, unit=unit
+        ).user
+        admin = factories.UnitMembershipFactory(
+            role=models.UnitMembershipRole.ADMIN, unit=unit
+        ).user
+        factories.UnitMembershipFactory(
+            role=models.UnitMembershipRole.MEMBER, unit=unit
+        )
+
+        Mailer.send_referral_received(referral)
+
+        payload = json.loads(models.OutgoingEmail.objects.get().payload)
+        self.assertNotIn("to", payload)
+        self.assertEqual(payload["params"]["case_number"], referral.id)
+        self.assertCountEqual(
+            payload["messageVersions"],
+            [{"to": [{"email": owner.email}]}, {"to": [{"email": admin.email}]}],
+        )
+
+    def test_email_send_batch(self):
+        """
+        Single versions are sent as regular emails, and large batches are split to fit the
+        limits of the email provider.
+        """
+        data = {"params": {"common": "value"}, "templateId": 1}
+
+        Mailer.send_batch(data, [{"to": [{"email": "one@example.com"}]}])
+        self.assertEqual(
+            json.loads(models.OutgoingEmail.objects.get().payload),
+            {
+                "params": {"common": "value"},
+                "templateId": 1,
+                "to": [{"email": "one@example.com"}],
+            },
+        )
+
+        models.OutgoingEmail.objects.all().delete()
+        versions = [{"to": [{"email": f"{i}@example.com"}]} for i in range(5)]
+        with mock.patch.object(Mailer, "max_message_versions", 2):
+            Mailer.send_batch(data, versions)
+        self.assertEqual(
+            [
+                json.loads(email.payload)["messageVersions"]
+                for email in models.OutgoingEmail.objects.order_by("created_at")
+            ],
+            [versions[0:2], versions[2:4], versions[4:5]],
+        )
+
+        models.OutgoingEmail.objects.all().delete()
+        Mailer.send_batch(data, [])
+        self.assertEqual(models.OutgoingEmail.objects.count(), 0)
+
+    def test_email_referral_send_queues_grouped_emails(self):
+        """
+        Sending a referral notifies the requester and all organizers of the unit with one
+        email per template.
+        """
+        referral = factories.ReferralFactory()
+        factories.UnitMembershipFactory.create_batch(
+            3, role=models.UnitMembershipRole.ADMIN, unit=referral.topic.unit
+        )
+
+        referral.send()
+
+        self.assertEqual(models.OutgoingEmail.objects.count(), 2)
+
+    @override_settings(SENDINBLUE={**settings.SENDINBLUE, "API_KEY": None})
+    def test_email_send_without_api_key(self):
+        """
+        No email is queued when no email provider is configured.
+        """
+        Mailer.send_referral_saved(factories.ReferralFactory())
+        self.assertEqual(models.OutgoingEmail.objects.count(), 0)
+
+    def test_email_send_emails_command_delivers_pending_emails(self):
+        """
+        Pending emails whose time has come are sent in order and marked as sent.
+        """
+        first = models.OutgoingEmail.objects.create(
+            payload='{"to": "first"}', send_after=timezone.now() - timedelta(minutes=2),
+        )
+        second = models.OutgoingEmail.objects.create(
+            payload='{"to": "second"}',
+            send_after=timezone.now() - timedelta(minutes=1),
+        )
+        later = models.OutgoingEmail.objects.create(
+            payload='{"to": "later"}', send_after=timezone.now() + timedelta(minutes=1),
+        )
+        sent = models.OutgoingEmail.objects.create(
+            payload='{"to": "sent"}', state=models.OutgoingEmailState.SENT
+        )
+
+        with mock.patch("partaj.core.email.requests.Session.request") as mock_request:
+            call_command("send_emails")
+
+        self.assertEqual(
+            [call[1]["data"] for call in mock_request.call_args_list],
+            ['{"to": "first"}', '{"to": "second"}'],
+        )
+        self.assertEqual(mock_request.call_args[0], ("POST", Mailer.send_email_url))
+        self.assertEqual(
+            mock_request.call_args[1]["timeout"],
+            (
+                settings.EMAIL_PROVIDER_CONNECT_TIMEOUT,
+                settings.EMAIL_PROVIDER_READ_TIMEOUT,
+            ),
+        )
+        for email in [first, second]:
+            email.refresh_from_db()
+            self.assertEqual(email.state, models.OutgoingEmailState.SENT)
+            self.assertIsNotNone(email.sent_at)
+        for email in [later, sent]:
+            email.refresh_from_db()
+            self.assertIsNone(email.sent_at)
+        self.assertEqual(later.state, models.OutgoingEmailState.PENDING)
+
+    def test_email_send_emails_command_retries_with_backoff(self):
+        """
+        Failed emails are retried later with an exponential backoff, until they reach the
+        maximum number of attempts.
+        """
+        email = models.OutgoingEmail.objects.create(payload="{}")
+
+        with mock.patch(
+            "partaj.core.email.requests.Session.request",
+            side_effect=requests.ConnectionError("Provider unreachable"),
+        ):
+            call_command("send_emails", max_attempts=3)
+            email.refresh_from_db()
+            self.assertEqual(email.state, models.OutgoingEmailState.PENDING)
+            self.assertEqual(email.attempts, 1)
+            self.assertEqual(email.last_error, "Provider unreachable")
+            first_delay = email.send_after - timezone.now()
+            self.assertTrue(
+                timedelta(seconds=25) < first_delay <= timedelta(seconds=30)
+            )
+
+            # The email is not retried before its time has come
+            call_command("send_emails", max_attempts=3)
+            email.refresh_from_db()
+            self.assertEqual(email.attempts, 1)
+
+            email.send_after = timezone.now()
+            email.save()
+            call_command("send_emails", max_attempts=3)
+            email.refresh_from_db()
+            self.assertEqual(email.attempts, 2)
+            second_delay = email.send_after - timezone.now()
+            self.assertTrue(
+                timedelta(seconds=55) < second_delay <= timedelta(seconds=60)
+            )
+
+            email.send_after = timezone.now()
+            email.save()
+            call_command("send_emails", max_attempts=3)
+            email.refresh_from_db()
+            self.assertEqual(email.state, models.OutgoingEmailState.FAILED)
+            self.assertEqual(email.attempts, 3)
+
+    def test_email_send_emails_command_http_error(self):
+        """
+        Emails rejected by the email provider are retried as well.
+        """
+        email = models.OutgoingEmail.objects.create(payload="{}")
+        response = requests.Response()
+        response.status_code = 503
+
+        with mock.patch(
+            "partaj.core.email.requests.Session.request", return_value=response
+        ):
+            call_command("send_emails")
+
+        email.refresh_from_db()
+        self.assertEqual(email.state, models.OutgoingEmailState.PENDING)
+        self.assertEqual(email.attempts, 1)
+        self.assertIn("503", email.last_error)
+
+    def test_email_send_emails_command_records_each_result(self):
+        """
+        Each email is recorded as soon as it is sent, and unexpected errors on one email are
+        retried without affecting the others.
+        """
+        failing = models.OutgoingEmail.objects.create(
+            payload='{"to": "failing"}',
+            send_after=timezone.now() - timedelta(minutes=2),
+        )
+        delivered = models.OutgoingEmail.objects.create(
+            payload='{"to": "delivered"}',
+            send_after=timezone.now() - timedelta(minutes=1),
+        )
+
+        def deliver(payload, timeout=None):
+            if payload == failing.payload:
+                raise ValueError("Unexpected error")
+            # The failing email was recorded before this one is sent
+            failing.refresh_from_db()
+            self.assertEqual(failing.state, models.OutgoingEmailState.PENDING)
+            self.assertEqual(failing.attempts, 1)
+            delivered.refresh_from_db()
+            self.assertEqual(delivered.state, models.OutgoingEmailState.SENDING)
+
+        with mock.patch("partaj.core.email.Mailer.deliver", side_effect=deliver):
+            call_command("send_emails")
+
+        failing.refresh_from_db()
+        self.assertEqual(failing.last_error, "Unexpected error")
+        delivered.refresh_from_db()
+        self.assertEqual(delivered.state, models.OutgoingEmailState.SENT)
+
+    def test_email_send_emails_command_reclaims_abandoned_emails(self):
+        """
+        Emails claimed by another worker are skipped until their claim expires, for instance
+        because the worker crashed before recording the result.
+        """
+        claimed = models.OutgoingEmail.objects.create(
+            payload="{}",
+            state=models.OutgoingEmailState.SENDING,
+            send_after=timezone.now() + timedelta(minutes=1),
+        )
+        abandoned = models.OutgoingEmail.objects.create(
+            payload="{}",
+            state=models.OutgoingEmailState.SENDING,
+            send_after=timezone.now() - timedelta(minutes=1),
+        )
+
+        with mock.patch("partaj.core.email.Mailer.deliver") as mock_deliver:
+            call_command("send_emails")
+
+        self.assertEqual(mock_deliver.call_count, 1)
+        claimed.refresh_from_db()
+        self.assertEqual(claimed.state, models.OutgoingEmailState.SENDING)
+        abandoned.refresh_from_db()
+        self.assertEqual(abandoned.state, models.OutgoingEmailState.SENT)
+
+
+class FakeEmailProviderHandler(BaseHTTPRequestHandler):
+    """
+    Answer calls to the fake email provider with the next status in the server's list,
+    recording the client port for each call.
+    """
+
+    # Keep connections alive between calls
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.calls.append(self.client_address[1])
+        status = self.server.statuses.pop(0) if self.server.statuses else 201
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        # Do not ask the client to wait before retrying refused calls
+        self.send_header("Retry-After", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(EMAIL_PROVIDER_RETRY_BACKOFF_FACTOR=0)
+class MailerSessionTestCase(TestCase):
+    """
+    Test the HTTP session the Mailer uses to call the email provider.
+    """
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeEmailProviderHandler)
+        self.server.calls = []
+        self.server.statuses = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        # Start each test with a new session, pointed at the fake email provider
+        Mailer._session = None
+        self.addCleanup(setattr, Mailer, "_session", None)
+        patcher = mock.patch.object(
+            Mailer, "send_email_url", f"http://127.0.0.1:{self.server.server_port}/"
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_mailer_deliver_reuses_connections(self):
+        """
+        Successive calls reuse the same connection, and their durations are logged.
+        """
+        with self.assertLogs("partaj", level="INFO") as logs:
+            for _ in range(3):
+                Mailer.deliver("{}")
+
+        self.assertEqual(len(self.server.calls), 3)
+        self.assertEqual(len(set(self.server.calls)), 1)
+        self.assertEqual(len(logs.records), 3)
+        self.assertEqual(logs.records[0].email_provider_status, 201)
+        self.assertGreater(logs.records[0].email_provider_duration, 0)
+
+    def test_mailer_deliver_retries_refused_calls(self):
+        """
+        Calls refused by the email provider are retried up to the configured number of times.
+        """
+        self.server.statuses = [429, 503]
+        Mailer.deliver("{}")
+        self.assertEqual(len(self.server.calls), 3)
+
+        self.server.calls = []
+        self.server.statuses = [503, 503]
+        with override_settings(EMAIL_PROVIDER_MAX_RETRIES=1):
+            Mailer._session = None
+            with self.assertRaises(requests.HTTPError):
+                Mailer.deliver("{}")
+        self.assertEqual(len(self.server.calls), 2)
+
+    def test_mailer_deliver_does_not_retry_server_errors(self):
+        """
+        Server errors are not retried, as the email may have been sent already.
+        """
+        self.server.statuses = [500]
+        with self.assertRaises(requests.HTTPError):
+            Mailer.deliver("{}")
+        self.assertEqual(len(self.server.calls), 1)
+
+    def test_mailer_get_session_per_process(self):
+        """
+        The session is shared by all calls in a process, and recreated after a fork.
+        """
+        session = Mailer.get_session()
+        self.assertIs(Mailer.get_session(), session)
+        self.assertEqual(session.headers["api-key"], Mailer.default_headers["api-key"])
+
+        with mock.patch("partaj.core.email.os.getpid", return_value=-1):
+            self.assertIsNot(Mailer.get_session(), session)
@@ -0,0 +1,141 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from partaj.core import factories, models
+from partaj.core.fragments import get_unit_version, get_user_version, invalidate
+
+
+class FragmentsTestCase(TestCase):
+    """
+    Test the versions of cached page fragments and their invalidation.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def login_member(self, unit):
+        """
+        Log in as a new member of a unit.
+        """
+        user = factories.UnitMembershipFactory(unit=unit).user
+        self.client.force_login(user)
+        return user
+
+    def test_fragments_versions(self):
+        """
+        Versions are kept until they are invalidated, again when the transaction is
+        committed, and then start from a new value.
+        """
+        unit = factories.UnitFactory()
+        version = get_unit_version(unit.id)
+        self.assertEqual(get_unit_version(unit.id), version)
+        self.assertNotEqual(get_user_version(unit.id), version)
+
+        with mock.patch("django.db.transaction.on_commit") as mock_on_commit:
+            invalidate("unit", [unit.id])
+        new_version = get_unit_version(unit.id)
+        self.assertNotEqual(new_version, version)
+
+        mock_on_commit.call_args[0][0]()
+        self.assertNotIn(get_unit_version(unit.id), [version, new_version])
+
+    def test_fragments_unit_topics_and_members(self):
+        """
+        Tables are read from the cache until the topics, referrals or assignments of the unit
+        change.
+        """
+        unit = factories.UnitFactory()
+        self.login_member(unit)
+        topic = factories.TopicFactory(name="First name", unit=unit)
+        self.client.get(f"/unit/{unit.id}/topics/")
+
+        # The topics and the navigation are not loaded anymore
+        with self.assertNumQueries(4):
+            response = self.client.get(f"/unit/{unit.id}/topics/")
+        self.assertContains(response, "First name")
+
+        topic.name = "Second name"
+        topic.save()
+        response = self.client.get(f"/unit/{unit.id}/topics/")
+        self.assertContains(response, "Second name")
+
+        assignment = factories.ReferralAssignmentFactory(
+            referral=factories.ReferralFactory(topic=topic), unit=unit
+        )
+        response = self.client.get(f"/unit/{unit.id}/topics/")
+        self.assertContains(response, "<td>1</td>", count=2)
+        response = self.client.get(f"/unit/{unit.id}/members/")
+        self.assertContains(response, assignment.assignee.get_full_name())
+        self.assertContains(response, "<td>1</td>", count=1)
+
+        assignment.delete()
+        response = self.client.get(f"/unit/{unit.id}/members/")
+        self.assertNotContains(response, "<td>1</td>")
+
+    def test_fragments_unit_inbox(self):
+        """
+        Each page and set of filters of the inbox is cached until the referrals of the
+        unit change.
+        """
+        unit = factories.UnitFactory()
+        self.login_member(unit)
+        topic = factories.TopicFactory(unit=unit)
+        referral = factories.ReferralFactory(topic=topic)
+        self.client.get(f"/unit/{unit.id}/inbox/")
+
+        # Neither the referrals nor the filters are loaded anymore
+        with self.assertNumQueries(4):
+            response = self.client.get(f"/unit/{unit.id}/inbox/")
+        self.assertContains(response, f"#{referral.id}")
+
+        # Lists are cached under their valid filters and cursor, whatever else the URL holds
+        with self.assertNumQueries(4):
+            response = self.client.get(
+                f"/unit/{unit.id}/inbox/?cursor=invalid&utm_source=email"
+            )
+        self.assertContains(response, f"#{referral.id}")
+
+        response = self.client.get(f"/unit/{unit.id}/inbox/?state=assigned")
+        self.assertNotContains(response, f"#{referral.id}")
+
+        assignment = factories.ReferralAssignmentFactory(referral=referral, unit=unit)
+        referral.state = models.ReferralState.ASSIGNED
+        referral.save()
+        response = self.client.get(f"/unit/{unit.id}/inbox/?state=assigned")
+        self.assertContains(response, f"#{referral.id}")
+        self.assertContains(response, assignment.assignee.get_full_name())
+
+    def test_fragments_navigation_and_requester_list(self):
+        """
+        The navigation and referral list of a user are cached until their memberships or
+        referrals change.
+        """
+        user = factories.UserFactory()
+        self.client.force_login(user)
+        response = self.client.get("/requester/referral-list/")
+        self.assertNotContains(response, "/requester/referral-list/")
+
+        referral = factories.ReferralFactory(user=user)
+        response = self.client.get("/requester/referral-list/")
+        self.assertContains(response, "/requester/referral-list/")
+        self.assertContains(response, f"#{referral.id}")
+
+        unit = factories.UnitFactory(name="Unit name")
+        unit.members.add(user)
+        response = self.client.get("/requester/referral-list/")
+        self.assertContains(response, "Unit name")
+
+        factories.ReferralAssignmentFactory(assignee=user, referral=referral, unit=unit)
+        response = self.client.get("/requester/referral-list/")
+        self.assertContains(response, f"<li>{user.get_full_name()}</li>")
+
+        unit.name = "New unit name"
+        unit.save()
+        response = self.client.get("/requester/referral-list/")
+        self.assertContains(response, "New unit name")
+
+        unit.members.clear()
+        response = self.client.get("/requester/referral-list/")
+        self.assertNotContains(response, "New unit name")
@@ -0,0 +1,90 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from partaj.core import factories, models
+from partaj.core.memberships import get_user_unit_roles, get_user_units
+
+
+class MembershipsTestCase(TestCase):
+    """
+    Test the helpers that load and cache the units of a user.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def get_fresh_user(self, user):
+        """
+        Load a new instance of the user, as happens on each new request.
+        """
+        return get_user_model().objects.get(id=user.id)
+
+    def test_memberships_get_user_units(self):
+        """
+        Units are listed by name with the role of the user, and memoized on the user
+        instance.
+        """
+        user = factories.UserFactory()
+        unit_b = factories.UnitFactory(name="B unit")
+        unit_a = factories.UnitFactory(name="A unit")
+        factories.UnitMembershipFactory(
+            role=models.UnitMembershipRole.OWNER, unit=unit_b, user=user
+        )
+        factories.UnitMembershipFactory(
+            role=models.UnitMembershipRole.MEMBER, unit=unit_a, user=user
+        )
+
+        with self.assertNumQueries(1):
+            units = get_user_units(user)
+            roles = get_user_unit_roles(user)
+        self.assertEqual(
+            [(unit.id, unit.name, unit.role) for unit in units],
+            [(str(unit_a.id), "A unit", "member"), (str(unit_b.id), "B unit", "owner")],
+        )
+        self.assertEqual(roles, {str(unit_a.id): "member", str(unit_b.id): "owner"})
+
+        # Without the cross-request cache, each new user instance queries again
+        fresh_user = self.get_fresh_user(user)
+        with self.assertNumQueries(1):
+            get_user_units(fresh_user)
+
+    @override_settings(UNIT_MEMBERSHIPS_CACHE_TIMEOUT=60)
+    def test_memberships_get_user_units_cached_across_requests(self):
+        """
+        When enabled, the cross-request cache is invalidated when memberships or units
+        change.
+        """
+        user = factories.UserFactory()
+        unit = factories.UnitFactory(name="The unit")
+        membership = factories.UnitMembershipFactory(
+            role=models.UnitMembershipRole.MEMBER, unit=unit, user=user
+        )
+
+        get_user_units(self.get_fresh_user(user))
+        fresh_user = self.get_fresh_user(user)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user_unit_roles(fresh_user), {str(unit.id): "member"})
+
+        membership.role = models.UnitMembershipRole.ADMIN
+        membership.save()
+        self.assertEqual(
+            get_user_unit_roles(self.get_fresh_user(user)), {str(unit.id): "admin"}
+        )
+
+        unit.name = "The renamed unit"
+        unit.save()
+        self.assertEqual(
+            get_user_units(self.get_fresh_user(user))[0].name, "The renamed unit"
+        )
+
+        other_unit = factories.UnitFactory()
+        other_unit.members.add(user)
+        self.assertEqual(
+            get_user_unit_roles(self.get_fresh_user(user)),
+            {str(unit.id): "admin", str(other_unit.id): "member"},
+        )
+
+        other_unit.members.remove(user)
+        membership.delete()
+        self.assertEqual(get_user_unit_roles(self.get_fresh_user(user)), {})
@@ -0,0 +1,291 @@
+from contextlib import suppress
+from datetime import timedelta
+import hashlib
+import threading
+from unittest import mock
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopFutureHandlers
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from partaj.core import factories, models, upload_handlers
+from partaj.core.management.commands.collect_attachment_blobs import (
+    collect_attachment_blobs,
+)
+from partaj.core.models import attachment as attachment_module
+
+
+class SaveAttachmentsTestCase(TestCase):
+    """
+    Test the helper that uploads and saves several attachments at once.
+    """
+
+    def get_attachments(self, count, content=None):
+        """
+        Build new attachments for a referral, with files as uploaded by users.
+        """
+        referral = factories.ReferralFactory()
+        return [
+            models.ReferralAttachment(
+                file=SimpleUploadedFile(
+                    f"file {i}.txt", content or f"content {i}".encode()
+                ),
+                referral=referral,
+            )
+            for i in range(count)
+        ]
+
+    @override_settings(ATTACHMENT_UPLOAD_MAX_WORKERS=2)
+    def test_save_attachments_concurrently(self):
+        """
+        Files are uploaded in parallel, then attachments are saved with their defaults.
+        """
+        attachments = self.get_attachments(2)
+        # Each upload waits for the other one to start: this only passes if they run
+        # concurrently
+        barrier = threading.Barrier(2, timeout=5)
+        upload_attachment_file = attachment_module.upload_attachment_file
+
+        def upload(attachment):
+            barrier.wait()
+            upload_attachment_file(attachment)
+
+        with mock.patch.object(attachment_module, "upload_attachment_file", upload):
+            models.save_attachments(attachments)
+
+        for i, attachment in enumerate(attachments):
+            attachment = models.ReferralAttachment.objects.get(id=attachment.id)
+            self.assertEqual(attachment.name, f"file {i}")
+            self.assertEqual(attachment.size, 9)
+            sha256 = hashlib.sha256(f"content {i}".encode()).hexdigest()
+            self.assertEqual(attachment.blob_id, sha256)
+            self.assertEqual(
+                attachment.file.name, f"blobs/{sha256}/{attachment.id}/file_{i}.txt"
+            )
+            self.assertEqual(attachment.file.read(), f"content {i}".encode())
+
+    def test_save_attachments_upload_failure(self):
+        """
+        When an upload fails, no attachment is saved and uploaded files are deleted.
+        """
+        attachments = self.get_attachments(3)
+        upload_attachment_file = attachment_module.upload_attachment_file
+
+        uploaded_names = []
+
+        def upload(attachment):
+            if attachment is attachments[1]:
+                raise OSError("Storage unavailable")
+            upload_attachment_file(attachment)
+            uploaded_names.append(attachment.blob.file.name)
+
+        with mock.patch.object(attachment_module, "upload_attachment_file", upload):
+            with self.assertRaises(OSError):
+                models.save_attachments(attachments)
+
+        self.assertEqual(models.ReferralAttachment.objects.count(), 0)
+        self.assertEqual(models.AttachmentBlob.objects.count(), 0)
+        self.assertEqual(len(uploaded_names), 2)
+        for name in uploaded_names:
+            self.assertFalse(default_storage.exists(name))
+
+    def test_save_attachments_database_failure(self):
+        """
+        When attachments cannot be saved, their uploaded files are deleted.
+        """
+        attachments = self.get_attachments(2)
+        attachments[1].referral_id = None
+        upload_attachment_file = attachment_module.upload_attachment_file
+        uploaded_names = []
+
+        def upload(attachment):
+            upload_attachment_file(attachment)
+            uploaded_names.append(attachment.blob.file.name)
+
+        with mock.patch.object(attachment_module, "upload_attachment_file", upload):
+            with self.assertRaises(Exception):
+                models.save_attachments(attachments)
+
+        self.assertEqual(models.ReferralAttachment.objects.count(), 0)
+        self.assertEqual(models.AttachmentBlob.objects.count(), 0)
+        self.assertEqual(len(uploaded_names), 2)
+        for name in uploaded_names:
+            self.assertFalse(default_storage.exists(name))
+
+    def test_save_attachments_identical_contents(self):
+        """
+        Identical contents are stored once and shared by their attachments, including
+        attachments saved later on, which do not upload their file again.
+        """
+        attachments = self.get_attachments(2, b"same content")
+        models.save_attachments(attachments)
+
+        blob = models.AttachmentBlob.objects.get()
+        self.assertEqual(blob.sha256, hashlib.sha256(b"same content").hexdigest())
+        self.assertEqual(blob.size, 12)
+        self.assertEqual(blob.reference_count, 2)
+        for attachment in attachments:
+            attachment.refresh_from_db()
+            self.assertEqual(attachment.blob, blob)
+            self.assertEqual(attachment.file.name, blob.file.name)
+
+        answer_attachment = models.ReferralAnswerAttachment(
+            file=SimpleUploadedFile("other name.txt", b"same content"),
+            referral_answer=factories.ReferralAnswerFactory(),
+        )
+        with mock.patch.object(
+            attachment_module, "upload_attachment_file"
+        ) as upload_mock:
+            models.save_attachments([answer_attachment])
+        upload_mock.assert_not_called()
+
+        answer_attachment.refresh_from_db()
+        self.assertEqual(answer_attachment.name, "other name")
+        self.assertEqual(answer_attachment.file.read(), b"same content")
+        blob.refresh_from_db()
+        self.assertEqual(blob.reference_count, 3)
+
+    def test_save_attachments_collected_blob(self):
+        """
+        Contents whose blob was collected after it was looked up are uploaded again.
+        """
+        models.save_attachments(self.get_attachments(1, b"same content"))
+        models.ReferralAttachment.objects.get().delete()
+        attachments = self.get_attachments(1, b"same content")
+
+        in_bulk = models.AttachmentBlob.objects.in_bulk
+
+        def in_bulk_and_collect(*args):
+            blobs = in_bulk(*args)
+            models.AttachmentBlob.objects.all().delete()
+            return blobs
+
+        with mock.patch.object(
+            models.AttachmentBlob.objects, "in_bulk", in_bulk_and_collect
+        ):
+            models.save_attachments(attachments)
+
+        blob = models.AttachmentBlob.objects.get()
+        self.assertEqual(blob.reference_count, 1)
+        attachment = models.ReferralAttachment.objects.get()
+        self.assertEqual(attachment.blob, blob)
+        self.assertEqual(attachment.file.read(), b"same content")
+
+    def test_save_attachments_uploaded_hash(self):
+        """
+        Files hashed by the upload handlers while they were received are not read again.
+        """
+        attachments = self.get_attachments(1)
+        attachments[0].file.file.sha256 = "a" * 64
+        models.save_attachments(attachments)
+
+        self.assertEqual(models.AttachmentBlob.objects.get().sha256, "a" * 64)
+
+
+class HashingUploadHandlerTestCase(TestCase):
+    """
+    Test the upload handlers that hash files while they are received.
+    """
+
+    def test_hashing_upload_handlers(self):
+        """
+        Files kept in memory and files streamed to disk are both hashed.
+        """
+        sha256 = hashlib.sha256(b"some content").hexdigest()
+        for handler_class in [
+            upload_handlers.HashingMemoryFileUploadHandler,
+            upload_handlers.HashingTemporaryFileUploadHandler,
+        ]:
+            handler = handler_class()
+            handler.handle_raw_input(None, {}, 12, "boundary")
+            # The memory handler stops the next handlers from receiving the file
+            with suppress(StopFutureHandlers):
+                handler.new_file("files", "file.txt", "text/plain", 12)
+            for start, chunk in [(0, b"some "), (5, b"content")]:
+                handler.receive_data_chunk(chunk, start)
+            file = handler.file_complete(12)
+            self.assertEqual(file.sha256, sha256)
+            self.assertEqual(file.read(), b"some content")
+
+
+class AttachmentBlobTestCase(TestCase):
+    """
+    Test the reference counting and garbage collection of attachment blobs.
+    """
+
+    def test_attachment_blob_release_and_collect(self):
+        """
+        Blobs are released when their attachments are deleted, then collected with their
+        file once they have been unreferenced for the grace period.
+        """
+        referral = factories.ReferralFactory()
+        attachments = [
+            models.ReferralAttachment(
+                file=SimpleUploadedFile("file.txt", b"content"), referral=referral
+            )
+            for _ in range(2)
+        ]
+        models.save_attachments(attachments)
+        blob = models.AttachmentBlob.objects.get()
+
+        attachments[0].delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.reference_count, 1)
+
+        attachments[1].delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.reference_count, 0)
+
+        # The blob is kept during the grace period
+        collect_attachment_blobs(timedelta(hours=24))
+        self.assertTrue(models.AttachmentBlob.objects.filter(sha256=blob.sha256))
+
+        models.AttachmentBlob.objects.filter(sha256=blob.sha256).update(
+            updated_at=timezone.now() - timedelta(hours=25)
+        )
+        # Run the deletion of files right away, as the test transaction is never committed
+        with mock.patch("django.db.transaction.on_commit", lambda func: func()):
+            collect_attachment_blobs(timedelta(hours=24))
+        self.assertFalse(models.AttachmentBlob.objects.filter(sha256=blob.sha256))
+        self.assertFalse(default_storage.exists(blob.file.name))
+
+    def test_attachment_blob_collect_orphan_files(self):
+        """
+        Blob files left without a blob, when the transaction that created the blob was rolled
+        back, are deleted once the grace period is over.
+        """
+        attachments = [
+            models.ReferralAttachment(
+                file=SimpleUploadedFile(name, content),
+                referral=factories.ReferralFactory(),
+            )
+            for name, content in [("kept.txt", b"kept"), ("orphan.txt", b"orphan")]
+        ]
+        models.save_attachments([attachments[0]])
+        try:
+            with transaction.atomic():
+                models.save_attachments([attachments[1]])
+                raise RuntimeError("Rolled back")
+        except RuntimeError:
+            pass
+        kept_name, orphan_name = (
+            attachments[0].file.name,
+            attachments[1].file.name,
+        )
+        self.assertTrue(default_storage.exists(orphan_name))
+        self.assertEqual(models.AttachmentBlob.objects.count(), 1)
+
+        for modified_time, exists in [
+            (timezone.now(), True),
+            (timezone.now() - timedelta(hours=25), False),
+        ]:
+            with mock.patch.object(
+                default_storage, "get_modified_time", return_value=modified_time
+            ):
+                call_command("collect_attachment_blobs", stdout=mock.Mock())
+            self.assertEqual(default_storage.exists(orphan_name), exists)
+            self.assertTrue(default_storage.exists(kept_name))
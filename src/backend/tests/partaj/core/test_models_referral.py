@@ -1,8 +1,8 @@
 from django.test import TestCase
 from django.utils import translation
 
-from partaj.core.factories import ReferralFactory
-from partaj.core.models import ReferralState
+from partaj.core.factories import ReferralFactory, TopicFactory, UnitFactory
+from partaj.core.models import Referral, ReferralState
 
 
 class ReferralTestCase(TestCase):
@@ -44,3 +44,25 @@ class ReferralTestCase(TestCase):
             self.assertEqual(referral.get_human_state(), "Incomplete")
         with translation.override("fr"):
             self.assertEqual(referral.get_human_state(), "Incomplète")
+
+    def test_referral_unit_follows_topic(self):
+        """
+        Referrals keep a copy of the unit of their topic, updated when they change topic and
+        when their topic moves to another unit, but not by saves of stale instances.
+        """
+        referral = ReferralFactory()
+        self.assertEqual(referral.unit_id, referral.topic.unit_id)
+
+        other_topic = TopicFactory()
+        referral = Referral.objects.get(id=referral.id)
+        referral.topic = other_topic
+        referral.save()
+        self.assertEqual(Referral.objects.get(id=referral.id).unit, other_topic.unit)
+
+        stale_referral = Referral.objects.get(id=referral.id)
+        other_topic.unit = UnitFactory()
+        other_topic.save()
+        self.assertEqual(Referral.objects.get(id=referral.id).unit, other_topic.unit)
+        stale_referral.question = "New question"
+        stale_referral.save()
+        self.assertEqual(Referral.objects.get(id=referral.id).unit, other_topic.unit)
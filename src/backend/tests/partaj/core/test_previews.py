@@ -0,0 +1,305 @@
+from datetime import timedelta
+import subprocess
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from partaj.core import factories, models
+from partaj.core.serializers import ReferralAttachmentSerializer
+
+PDFINFO_OUTPUT = b"""Title:          Decision
+Producer:       LibreOffice 6.4
+Pages:          12
+Page size:      595.304 x 841.89 pts (A4)
+"""
+
+
+def fake_tool(args, **kwargs):
+    """
+    Pretend to run poppler-utils and ImageMagick, checking they were called as expected.
+    """
+    outputs = {
+        "convert": b"image thumbnail",
+        "pdfinfo": PDFINFO_OUTPUT,
+        "pdftoppm": b"first page",
+        "pdftotext": "Décision\x00 finale".encode("utf-8"),
+    }
+    assert kwargs["check"] is True and kwargs["timeout"] == 60
+    return subprocess.CompletedProcess(args, 0, stdout=outputs[args[0]], stderr=b"")
+
+
+def broken_tool(args, **kwargs):
+    """
+    Pretend a tool failed to process a file.
+    """
+    raise subprocess.CalledProcessError(1, args, stderr=b"Syntax Error")
+
+
+@mock.patch("partaj.core.previews.shutil.which", lambda tool: f"/usr/bin/{tool}")
+@mock.patch("partaj.core.previews.subprocess.run", side_effect=fake_tool)
+class ProcessAttachmentsTestCase(TestCase):
+    """
+    Test the extraction of previews, page counts and text from attachments in the background.
+    """
+
+    def test_previews_process_pdf(self, mock_run):
+        """
+        The first page of PDF files is rendered and their page count and text extracted.
+        """
+        attachment = factories.ReferralAttachmentFactory(
+            file=ContentFile(b"%PDF-1.4", name="Décision.pdf")
+        )
+        self.assertEqual(
+            attachment.preview_state, models.AttachmentPreviewState.PENDING
+        )
+
+        call_command("process_attachments")
+
+        attachment.refresh_from_db()
+        self.assertEqual(attachment.preview_state, models.AttachmentPreviewState.READY)
+        self.assertEqual(
+            attachment.preview.name, f"{attachment.id}/preview/preview.png"
+        )
+        self.assertEqual(attachment.preview.read(), b"first page")
+        self.assertEqual(attachment.page_count, 12)
+        self.assertEqual(attachment.text, "Décision finale")
+        self.assertEqual(
+            [call[0][0][0] for call in mock_run.call_args_list],
+            ["pdfinfo", "pdftoppm", "pdftotext"],
+        )
+        # Tools read a local copy of the file
+        path = mock_run.call_args_list[0][0][0][1]
+        self.assertTrue(path.endswith(".pdf"))
+        self.assertIn("300", mock_run.call_args_list[1][0][0])
+
+    def test_previews_process_image(self, mock_run):
+        """
+        Images get a thumbnail.
+        """
+        attachment = factories.ReferralAnswerAttachmentFactory(
+            file=ContentFile(b"PNG", name="photo.png")
+        )
+        call_command("process_attachments")
+
+        attachment.refresh_from_db()
+        self.assertEqual(attachment.preview_state, models.AttachmentPreviewState.READY)
+        self.assertEqual(attachment.preview.read(), b"image thumbnail")
+        self.assertEqual(attachment.page_count, 1)
+        self.assertEqual(attachment.text, "")
+        # The image is read with the coder of its expected type
+        args = mock_run.call_args[0][0]
+        self.assertEqual(args[0], "convert")
+        self.assertTrue(args[1].startswith("png:/"))
+        self.assertTrue(args[1].endswith(".png[0]"))
+
+    @override_settings(ATTACHMENT_PREVIEW_TEXT_MAX_LENGTH=10)
+    def test_previews_process_text(self, mock_run):
+        """
+        The text of plain text files is extracted without any tool, up to the maximum length.
+        """
+        attachment = factories.ReferralAttachmentFactory(
+            file=ContentFile(b"Some notes about the case", name="notes.txt")
+        )
+        call_command("process_attachments")
+
+        attachment.refresh_from_db()
+        self.assertEqual(attachment.preview_state, models.AttachmentPreviewState.READY)
+        self.assertFalse(attachment.preview)
+        self.assertIsNone(attachment.page_count)
+        self.assertEqual(attachment.text, "Some notes")
+        mock_run.assert_not_called()
+
+    def test_previews_process_unsupported(self, mock_run):
+        """
+        Files of other types, or whose tools are not installed, are marked as unsupported.
+        """
+        document = factories.ReferralAttachmentFactory(
+            file=ContentFile(b"PK", name="report.docx")
+        )
+        pdf = factories.ReferralAttachmentFactory(
+            file=ContentFile(b"%PDF-1.4", name="report.pdf")
+        )
+        with mock.patch("partaj.core.previews.shutil.which", return_value=None):
+            call_command("process_attachments")
+
+        for attachment in [document, pdf]:
+            attachment.refresh_from_db()
+            self.assertEqual(
+                attachment.preview_state, models.AttachmentPreviewState.UNSUPPORTED
+            )
+        mock_run.assert_not_called()
+
+    def test_previews_process_failure(self, mock_run):
+        """
+        Files that tools fail to process are marked as failed, without stopping the batch.
+        """
+        broken = factories.ReferralAttachmentFactory(
+            file=ContentFile(b"broken", name="broken.pdf")
+        )
+        image = factories.ReferralAttachmentFactory(
+            file=ContentFile(b"PNG", name="photo.png")
+        )
+        mock_run.side_effect = lambda args, **kwargs: (
+            fake_tool(args, **kwargs)
+            if args[0] == "convert"
+            else broken_tool(args, **kwargs)
+        )
+
+        call_command("process_attachments")
+
+        broken.refresh_from_db()
+        self.assertEqual(broken.preview_state, models.AttachmentPreviewState.FAILED)
+        self.assertFalse(broken.preview)
+        image.refresh_from_db()
+        self.assertEqual(image.preview_state, models.AttachmentPreviewState.READY)
+
+    def test_previews_process_unexpected_error(self, mock_run):
+        """
+        Attachments are marked as failed whatever the error, and preview images already
+        stored are deleted when the attachment cannot be saved.
+        """
+        attachments = [
+            factories.ReferralAttachmentFactory(
+                file=ContentFile(b"PNG", name="photo.png")
+            )
+            for _ in range(2)
+        ]
+        mock_run.side_effect = ValueError("Unexpected")
+        call_command("process_attachments")
+        attachments[0].refresh_from_db()
+        self.assertEqual(
+            attachments[0].preview_state, models.AttachmentPreviewState.FAILED
+        )
+
+        models.ReferralAttachment.objects.update(
+            preview_state=models.AttachmentPreviewState.PENDING
+        )
+        mock_run.side_effect = fake_tool
+        stored_names = []
+
+        def save_and_fail(attachment, *args, **kwargs):
+            stored_names.append(attachment.preview.name)
+            self.assertTrue(default_storage.exists(attachment.preview.name))
+            raise DatabaseError("Connection lost")
+
+        with mock.patch.object(models.ReferralAttachment, "save", save_and_fail):
+            call_command("process_attachments")
+
+        self.assertEqual(len(stored_names), 2)
+        for attachment, name in zip(attachments, stored_names):
+            self.assertFalse(default_storage.exists(name))
+            attachment.refresh_from_db()
+            self.assertEqual(
+                attachment.preview_state, models.AttachmentPreviewState.FAILED
+            )
+            self.assertFalse(attachment.preview)
+
+    def test_previews_process_claims(self, mock_run):
+        """
+        Attachments claimed by another worker are left alone, unless their claim expired.
+        """
+        claimed, expired = [
+            factories.ReferralAttachmentFactory(
+                file=ContentFile(b"notes", name="notes.txt"),
+                preview_state=models.AttachmentPreviewState.PROCESSING,
+            )
+            for _ in range(2)
+        ]
+        models.ReferralAttachment.objects.filter(id=claimed.id).update(
+            preview_claimed_at=timezone.now() - timedelta(minutes=5)
+        )
+        models.ReferralAttachment.objects.filter(id=expired.id).update(
+            preview_claimed_at=timezone.now() - timedelta(hours=1)
+        )
+
+        call_command("process_attachments")
+
+        claimed.refresh_from_db()
+        self.assertEqual(
+            claimed.preview_state, models.AttachmentPreviewState.PROCESSING
+        )
+        expired.refresh_from_db()
+        self.assertEqual(expired.preview_state, models.AttachmentPreviewState.READY)
+
+    def test_previews_process_batches(self, mock_run):
+        """
+        Only pending attachments are processed, in batches until there are none left.
+        """
+        attachments = [
+            factories.ReferralAttachmentFactory(
+                file=ContentFile(b"notes", name="notes.txt")
+            )
+            for _ in range(3)
+        ]
+        done = factories.ReferralAttachmentFactory(
+            file=ContentFile(b"notes", name="notes.txt"),
+            preview_state=models.AttachmentPreviewState.FAILED,
+        )
+
+        call_command("process_attachments", batch_size=2)
+
+        for attachment in attachments:
+            attachment.refresh_from_db()
+            self.assertEqual(
+                attachment.preview_state, models.AttachmentPreviewState.READY
+            )
+        done.refresh_from_db()
+        self.assertEqual(done.preview_state, models.AttachmentPreviewState.FAILED)
+
+
+class AttachmentPreviewsApiTestCase(TestCase):
+    """
+    Test how previews are served to users.
+    """
+
+    def test_previews_serializer(self):
+        """
+        Attachments are serialized with a link to their preview, once it is ready, and an
+        excerpt of their text.
+        """
+        attachment = factories.ReferralAttachmentFactory()
+        data = ReferralAttachmentSerializer(attachment).data
+        self.assertIsNone(data["preview"])
+        self.assertEqual(data["excerpt"], "")
+        self.assertEqual(data["preview_state"], "pending")
+        self.assertNotIn("text", data)
+
+        attachment.preview.save("preview.png", ContentFile(b"image"), save=False)
+        attachment.text = "A" * 1000
+        attachment.page_count = 3
+        attachment.preview_state = models.AttachmentPreviewState.READY
+        attachment.save()
+        data = ReferralAttachmentSerializer(attachment).data
+        self.assertEqual(data["preview"], f"/attachment-file/{attachment.id}/preview/")
+        self.assertEqual(data["excerpt"], "A" * 300)
+        self.assertEqual(data["page_count"], 3)
+
+    def test_previews_view(self):
+        """
+        Previews are served to users who can access the attachment.
+        """
+        attachment = factories.ReferralAttachmentFactory()
+        url = f"/attachment-file/{attachment.id}/preview/"
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(factories.UserFactory())
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(attachment.referral.user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+
+        attachment.preview.save("preview.png", ContentFile(b"image"))
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertEqual(b"".join(response.streaming_content), b"image")
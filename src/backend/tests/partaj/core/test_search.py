@@ -0,0 +1,224 @@
+from io import StringIO
+from unittest import mock, skipIf, skipUnless
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from rest_framework.authtoken.models import Token
+
+from partaj.core import factories, models
+
+
+@mock.patch("partaj.core.search.schedule_search_vectors_update")
+class SearchVectorsUpdateTestCase(TestCase):
+    """
+    Test which writes update the search vectors of referrals.
+    """
+
+    def get_scheduled_ids(self, mock_schedule):
+        """
+        Get the ids of the referrals whose vectors were scheduled for an update, and forget
+        them for the next checks.
+        """
+        referral_ids = [
+            list(referral_ids) for (referral_ids,), _ in mock_schedule.call_args_list
+        ]
+        mock_schedule.reset_mock()
+        return referral_ids
+
+    def test_search_vectors_update_referral(self, mock_schedule):
+        """
+        Vectors are updated when referrals are created and when searched fields change, but
+        not when referrals only change state.
+        """
+        referral = factories.ReferralFactory()
+        self.assertEqual(self.get_scheduled_ids(mock_schedule), [[referral.id]])
+
+        assignee = factories.UnitMembershipFactory(unit=referral.topic.unit).user
+        referral.assign(assignee=assignee, created_by=assignee)
+        referral.save()
+        self.assertEqual(self.get_scheduled_ids(mock_schedule), [])
+
+        # Referrals loaded from the database do not carry their vector around
+        referral = models.Referral.objects.get(id=referral.id)
+        self.assertIn("search_vector", referral.get_deferred_fields())
+        referral.question = "New question"
+        referral.save()
+        self.assertEqual(self.get_scheduled_ids(mock_schedule), [[referral.id]])
+
+        referral.question = "Another question"
+        referral.save(update_fields=["state"])
+        referral.topic = factories.TopicFactory()
+        referral.save(update_fields=["topic"])
+        self.assertEqual(self.get_scheduled_ids(mock_schedule), [[referral.id]])
+
+    def test_search_vectors_update_related_objects(self, mock_schedule):
+        """
+        Vectors are updated when answers change, when text is extracted from attachments and
+        when topics are renamed.
+        """
+        referral = factories.ReferralFactory()
+        mock_schedule.reset_mock()
+
+        answer = factories.ReferralAnswerFactory(referral=referral)
+        attachment = factories.ReferralAttachmentFactory(referral=referral)
+        answer_attachment = factories.ReferralAnswerAttachmentFactory(
+            referral_answer=answer
+        )
+        self.assertEqual(self.get_scheduled_ids(mock_schedule), [[referral.id]])
+
+        for item in [attachment, answer_attachment]:
+            item.preview_state = models.AttachmentPreviewState.READY
+            item.save(update_fields=["preview_state"])
+            item.text = "Extracted text"
+            item.save(update_fields=["preview_state", "text"])
+        answer_attachment.delete()
+        answer.delete()
+        self.assertEqual(self.get_scheduled_ids(mock_schedule), [[referral.id]] * 4)
+
+        other_referral = factories.ReferralFactory(topic=referral.topic)
+        mock_schedule.reset_mock()
+        topic = models.Topic.objects.get(id=referral.topic_id)
+        topic.save()
+        self.assertEqual(self.get_scheduled_ids(mock_schedule), [])
+        topic.name = "New name"
+        topic.save()
+        self.assertEqual(
+            [
+                sorted(referral_ids)
+                for referral_ids in self.get_scheduled_ids(mock_schedule)
+            ],
+            [sorted([referral.id, other_referral.id])],
+        )
+
+    @skipIf(connection.vendor == "postgresql", "Full-text search is supported")
+    def test_search_api_unsupported(self, _):
+        """
+        The search endpoint does not exist on databases without full-text search.
+        """
+        user = factories.UserFactory()
+        response = self.client.get(
+            "/api/referrals/search/?q=question",
+            HTTP_AUTHORIZATION=f"Token {Token.objects.get_or_create(user=user)[0]}",
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+@skipUnless(connection.vendor == "postgresql", "Full-text search requires PostgreSQL")
+@mock.patch("partaj.core.email.Mailer.send")
+class SearchApiTestCase(TransactionTestCase):
+    """
+    Test the full-text search of referrals. Vectors are updated once transactions are
+    committed, so tests run outside of a transaction.
+    """
+
+    def search(self, user, **params):
+        """
+        Search referrals as a user.
+        """
+        return self.client.get(
+            "/api/referrals/search/",
+            params,
+            HTTP_AUTHORIZATION=f"Token {Token.objects.get_or_create(user=user)[0]}",
+        )
+
+    def create_referral(self, **kwargs):
+        """
+        Create a referral with texts that do not match searches by chance.
+        """
+        return factories.ReferralFactory(
+            **{
+                "context": "Contexte",
+                "prior_work": "Recherches",
+                "question": "Question",
+                "requester": "Jeanne Dupont",
+                **kwargs,
+            }
+        )
+
+    def test_search_api_ranking_and_headlines(self, _):
+        """
+        Users find referrals from their words or other forms of them, most relevant first,
+        with the matching words marked in escaped headlines.
+        """
+        user = factories.UserFactory()
+        topic = factories.TopicFactory(name="Droit")
+        topic.unit.members.add(user)
+        question = self.create_referral(
+            topic=topic, question="Règles des marchés publics & concessions"
+        )
+        answer = factories.ReferralAnswerFactory(
+            referral=self.create_referral(topic=topic),
+            content="Les règles du marché public s'appliquent.",
+        )
+        attachment = factories.ReferralAttachmentFactory(
+            referral=self.create_referral(topic=topic)
+        )
+        attachment.text = "Annexe sur les marchés publics"
+        attachment.save(update_fields=["text"])
+        self.create_referral(topic=topic, question="Une autre question")
+
+        response = self.search(user, q="marché public")
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual(
+            [result["id"] for result in results],
+            [question.id, answer.referral_id, attachment.referral_id],
+        )
+        self.assertIn(
+            "<mark>marchés</mark> <mark>publics</mark> &amp; concessions",
+            results[0]["headline"],
+        )
+        self.assertGreater(results[0]["rank"], results[1]["rank"])
+
+        response = self.search(user, q="marché public", limit=1)
+        self.assertEqual(len(response.json()["results"]), 1)
+
+    def test_search_api_scope_and_filters(self, _):
+        """
+        Users only find the referrals they can list, with the filters of the list.
+        """
+        user = factories.UserFactory()
+        created_referral = self.create_referral(user=user, question="Subvention")
+        unit_referral = self.create_referral(
+            question="Subventions", state=models.ReferralState.ASSIGNED
+        )
+        unit_referral.topic.unit.members.add(user)
+        self.create_referral(question="Subvention")
+
+        response = self.search(user, q="subvention")
+        self.assertEqual(
+            sorted(result["id"] for result in response.json()["results"]),
+            sorted([created_referral.id, unit_referral.id]),
+        )
+
+        response = self.search(user, q="subvention", state="assigned")
+        self.assertEqual(
+            [result["id"] for result in response.json()["results"]], [unit_referral.id],
+        )
+
+        response = self.search(user, q="")
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_vectors_follow_changes(self, _):
+        """
+        Referrals are found from the current names of their topics, and vectors can be
+        rebuilt with a command.
+        """
+        user = factories.UserFactory()
+        referral = self.create_referral(user=user)
+        topic = referral.topic
+        topic.name = "Urbanisme"
+        topic.save()
+        response = self.search(user, q="urbanisme")
+        self.assertEqual(
+            [result["id"] for result in response.json()["results"]], [referral.id]
+        )
+
+        models.Referral.objects.update(search_vector=None)
+        output = StringIO()
+        call_command("rebuild_search_vectors", stdout=output)
+        self.assertIn("Rebuilt", output.getvalue())
+        response = self.search(user, q="urbanisme")
+        self.assertEqual(len(response.json()["results"]), 1)
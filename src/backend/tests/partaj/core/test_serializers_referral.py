@@ -0,0 +1,135 @@
+import json
+import os
+import time
+from unittest import skipUnless
+
+from django.test import TestCase
+
+from partaj.core import factories, models
+from partaj.core.api import ReferralViewSet
+from partaj.core.serializers import ReferralSerializer, ReferralSummarySerializer
+
+
+class ReferralPageMixin:
+    """
+    Build a typical page of 50 referrals from a unit inbox to serialize.
+    """
+
+    def setUp(self):
+        """
+        Create 50 referrals in a unit with a few members, each with an assignee, an
+        attachment and some activity.
+        """
+        unit = factories.UnitFactory()
+        members = [
+            membership.user
+            for membership in factories.UnitMembershipFactory.create_batch(5, unit=unit)
+        ]
+        requester = factories.UserFactory()
+        topic = factories.TopicFactory(unit=unit)
+        for _ in range(50):
+            referral = factories.ReferralFactory(
+                state=models.ReferralState.ASSIGNED, topic=topic, user=requester
+            )
+            factories.ReferralAttachmentFactory(referral=referral)
+            factories.ReferralAssignmentFactory(
+                assignee=members[1], created_by=members[0], referral=referral, unit=unit
+            )
+            factories.ReferralActivityFactory(actor=requester, referral=referral)
+            factories.ReferralActivityFactory(
+                actor=members[0],
+                item_content_object=members[1],
+                referral=referral,
+                verb=models.ReferralActivityVerb.ASSIGNED,
+            )
+
+    def get_referrals(self):
+        """
+        Load the page with everything the serializers render.
+        """
+        return ReferralViewSet.prefetch_for_serialization(
+            list(
+                models.Referral.objects.select_related(
+                    "topic__unit", "urgency_level", "user"
+                )
+            )
+        )
+
+
+class ReferralSerializersTestCase(ReferralPageMixin, TestCase):
+    """
+    Compare the full and summary referral serializers on a typical page of 50 referrals.
+    """
+
+    def serialize(self, serializer_class):
+        """
+        Serialize the page with a serializer class, checking that rendering does not query the
+        database, and return the serialized referrals with the size of the payload in bytes.
+        """
+        referrals = self.get_referrals()
+        with self.assertNumQueries(0):
+            data = serializer_class(referrals, many=True).data
+        return data, len(json.dumps(data, default=str).encode("utf-8"))
+
+    def test_serializers_referral_summary_page_cost(self):
+        """
+        The summary serializer renders a page of referrals in a fraction of the size of the
+        full serializer, with only the fields needed to display them as rows.
+        """
+        _, full_size = self.serialize(ReferralSerializer)
+        summary, summary_size = self.serialize(ReferralSummarySerializer)
+
+        self.assertLess(summary_size * 10, full_size)
+        self.assertEqual(len(summary), 50)
+        self.assertEqual(
+            set(summary[0]),
+            {
+                "assignees",
+                "created_at",
+                "due_date",
+                "id",
+                "requester",
+                "state",
+                "topic",
+                "urgency_level",
+            },
+        )
+
+
+@skipUnless(
+    os.environ.get("PARTAJ_BENCHMARKS"), "Set PARTAJ_BENCHMARKS to run benchmarks"
+)
+class ReferralSerializersBenchmarkTestCase(ReferralPageMixin, TestCase):
+    """
+    Report the size and rendering time of a typical page of 50 referrals with the full and
+    summary serializers. Timings depend on the machine so nothing is asserted about them, run
+    with `PARTAJ_BENCHMARKS=1 pytest -s` to read them.
+    """
+
+    repeat = 20
+
+    def measure(self, serializer_class):
+        """
+        Serialize the page with a serializer class a few times, returning the payload size in
+        bytes and the best time spent rendering it, in seconds.
+        """
+        referrals = self.get_referrals()
+        timings = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            payload = json.dumps(
+                serializer_class(referrals, many=True).data, default=str
+            ).encode("utf-8")
+            timings.append(time.perf_counter() - start)
+        return len(payload), min(timings)
+
+    def test_serializers_referral_page_benchmark(self):
+        """
+        Print the cost of the full and summary serializers.
+        """
+        for serializer_class in [ReferralSerializer, ReferralSummarySerializer]:
+            size, duration = self.measure(serializer_class)
+            print(
+                f"\n{serializer_class.__name__}, page of 50 referrals: "
+                f"{size} bytes in {duration * 1000:.1f}ms"
+            )
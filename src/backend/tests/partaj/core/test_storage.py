@@ -0,0 +1,155 @@
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+
+from botocore.exceptions import ClientError
+
+from partaj.core.storage import SecuredStorage
+
+
+class SecuredStorageTestCase(TestCase):
+    """
+    Test the storage that keeps attachment files behind our authorization checks.
+    """
+
+    def get_storage(self):
+        """
+        Get a storage for a fake bucket. Signing URLs does not require calls to the object
+        storage, so none is needed.
+        """
+        return SecuredStorage(
+            access_key="access-key",
+            bucket_name="bucket",
+            endpoint_url="https://s3.example.com",
+            region_name="fr-par",
+            secret_key="secret-key",
+            signature_version="s3v4",
+        )
+
+    def test_storage_url(self):
+        """
+        Public URLs to files point to the Django view that authorizes downloads.
+        """
+        self.assertEqual(
+            self.get_storage().url("8a0a5b1c-1d1f-4a4f-9a46-1f3e6b3d1a6e/notes.txt"),
+            "/attachment-file/8a0a5b1c-1d1f-4a4f-9a46-1f3e6b3d1a6e/",
+        )
+
+    def test_storage_get_download_url(self):
+        """
+        Download URLs are signed, short-lived, and force the headers of the response.
+        """
+        url = urlparse(
+            self.get_storage().get_download_url(
+                "8a0a5b1c-1d1f-4a4f-9a46-1f3e6b3d1a6e/notes.txt",
+                expire=30,
+                content_type="text/plain",
+                content_disposition='attachment; filename="notes.txt"',
+            )
+        )
+        query = parse_qs(url.query)
+
+        self.assertEqual(url.netloc, "s3.example.com")
+        self.assertEqual(
+            url.path, "/bucket/8a0a5b1c-1d1f-4a4f-9a46-1f3e6b3d1a6e/notes.txt"
+        )
+        self.assertEqual(query["X-Amz-Expires"], ["30"])
+        self.assertIn("X-Amz-Signature", query)
+        self.assertEqual(query["response-content-type"], ["text/plain"])
+        self.assertEqual(
+            query["response-content-disposition"], ['attachment; filename="notes.txt"']
+        )
+
+    def test_storage_open_range(self):
+        """
+        Only the requested range of the file is fetched from the object storage.
+        """
+        storage = self.get_storage()
+        with mock.patch.object(
+            SecuredStorage, "bucket", new_callable=mock.PropertyMock
+        ) as mock_bucket:
+            body = storage.open_range("some-id/notes.txt", 10, 99)
+
+        mock_bucket.return_value.Object.assert_called_once_with("some-id/notes.txt")
+        mock_object = mock_bucket.return_value.Object.return_value
+        mock_object.get.assert_called_once_with(Range="bytes=10-99")
+        self.assertEqual(body, mock_object.get.return_value["Body"])
+
+    def test_storage_open_stream(self):
+        """
+        Files are streamed from the object storage.
+        """
+        storage = self.get_storage()
+        with mock.patch.object(
+            SecuredStorage, "bucket", new_callable=mock.PropertyMock
+        ) as mock_bucket:
+            body = storage.open_stream("some-id/notes.txt")
+
+        mock_bucket.return_value.Object.assert_called_once_with("some-id/notes.txt")
+        mock_object = mock_bucket.return_value.Object.return_value
+        mock_object.get.assert_called_once_with()
+        self.assertEqual(body, mock_object.get.return_value["Body"])
+
+    @override_settings(
+        ATTACHMENT_UPLOAD_MULTIPART_CHUNKSIZE=5 * 1024 * 1024,
+        ATTACHMENT_UPLOAD_MULTIPART_THRESHOLD=6 * 1024 * 1024,
+    )
+    def test_storage_save_multipart(self):
+        """
+        Files are streamed to the object storage with our multipart upload settings, using
+        the connection of the current thread.
+        """
+        storage = self.get_storage()
+        with mock.patch.object(
+            SecuredStorage, "connection", new_callable=mock.PropertyMock
+        ) as mock_connection:
+            name = storage.save("some-id/notes.txt", ContentFile(b"content"))
+
+        self.assertEqual(name, "some-id/notes.txt")
+        mock_connection.return_value.Object.assert_called_once_with(
+            "bucket", "some-id/notes.txt"
+        )
+        upload_fileobj = mock_connection.return_value.Object.return_value.upload_fileobj
+        upload_fileobj.assert_called_once()
+        config = upload_fileobj.call_args[1]["Config"]
+        self.assertEqual(config.multipart_chunksize, 5 * 1024 * 1024)
+        self.assertEqual(config.multipart_threshold, 6 * 1024 * 1024)
+        self.assertEqual(
+            upload_fileobj.call_args[1]["ExtraArgs"]["ContentType"], "text/plain"
+        )
+
+    def test_storage_get_upload_target(self):
+        """
+        Upload targets are signed POST forms for one key, limited in size.
+        """
+        target = self.get_storage().get_upload_target(
+            "some-id/notes.txt", expire=60, max_size=1000
+        )
+
+        self.assertEqual(target["url"], "https://s3.example.com/bucket")
+        self.assertEqual(target["fields"]["key"], "some-id/notes.txt")
+        self.assertIn("policy", target["fields"])
+        self.assertIn("x-amz-signature", target["fields"])
+
+    def test_storage_get_uploaded_size(self):
+        """
+        The size of uploaded files is checked with a HEAD request, and is None for files
+        that were not uploaded.
+        """
+        storage = self.get_storage()
+        with mock.patch.object(
+            SecuredStorage, "connection", new_callable=mock.PropertyMock
+        ) as mock_connection:
+            head_object = mock_connection.return_value.meta.client.head_object
+            head_object.return_value = {"ContentLength": 42}
+            self.assertEqual(storage.get_uploaded_size("some-id/notes.txt"), 42)
+            head_object.assert_called_once_with(
+                Bucket="bucket", Key="some-id/notes.txt"
+            )
+
+            head_object.side_effect = ClientError(
+                {"Error": {"Code": "404"}}, "HeadObject"
+            )
+            self.assertIsNone(storage.get_uploaded_size("some-id/notes.txt"))
@@ -0,0 +1,307 @@
+from unittest import mock
+import uuid
+
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+
+from partaj.core import factories, models
+from partaj.core.storage import SecuredStorage
+
+
+class AuthenticatedFilesViewTestCase(TestCase):
+    """
+    Test the view that serves attachment files to authorized users.
+    """
+
+    def test_authenticated_files_anonymous_user(self):
+        """
+        Anonymous users are redirected to the login page.
+        """
+        attachment = factories.ReferralAttachmentFactory()
+        response = self.client.get(f"/attachment-file/{attachment.id}/")
+        self.assertEqual(response.status_code, 302)
+
+    def test_authenticated_files_unknown_attachment(self):
+        """
+        A 404 is returned when no attachment matches the id.
+        """
+        self.client.force_login(factories.UserFactory())
+        response = self.client.get(f"/attachment-file/{uuid.uuid4()}/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_authenticated_files_random_user(self):
+        """
+        Users who are not linked to the referral cannot get its attachments.
+        """
+        attachment = factories.ReferralAttachmentFactory()
+        answer_attachment = factories.ReferralAnswerAttachmentFactory(
+            referral_answer__referral=attachment.referral
+        )
+        self.client.force_login(factories.UserFactory())
+        for item in [attachment, answer_attachment]:
+            response = self.client.get(f"/attachment-file/{item.id}/")
+            self.assertEqual(response.status_code, 403)
+
+    def test_authenticated_files_referral_attachment(self):
+        """
+        The requester, unit members and staff can get referral attachments, in a single
+        query for the attachment and its referral.
+        """
+        attachment = factories.ReferralAttachmentFactory()
+        member = factories.UnitMembershipFactory(
+            unit=attachment.referral.topic.unit
+        ).user
+        staff = factories.UserFactory(is_staff=True)
+
+        for user in [attachment.referral.user, member, staff]:
+            self.client.force_login(user)
+            # Session, user, attachment, and the user's units for members
+            with self.assertNumQueries(4 if user == member else 3):
+                response = self.client.get(f"/attachment-file/{attachment.id}/")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                b"".join(response.streaming_content), b"attachment content"
+            )
+            self.assertEqual(
+                response["Content-Disposition"],
+                f'attachment; filename="{attachment.get_name_with_extension()}"',
+            )
+
+    def test_authenticated_files_referral_answer_attachment(self):
+        """
+        The requester, unit members and staff can get referral answer attachments, in a
+        single query for the attachment and its referral.
+        """
+        attachment = factories.ReferralAnswerAttachmentFactory()
+        referral = attachment.referral_answer.referral
+        member = factories.UnitMembershipFactory(unit=referral.topic.unit).user
+        staff = factories.UserFactory(is_staff=True)
+
+        for user in [referral.user, member, staff]:
+            self.client.force_login(user)
+            with self.assertNumQueries(4 if user == member else 3):
+                response = self.client.get(f"/attachment-file/{attachment.id}/")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                b"".join(response.streaming_content), b"attachment content"
+            )
+
+    def test_authenticated_files_validators(self):
+        """
+        Full downloads announce their length, validators and support for ranges.
+        """
+        attachment = factories.ReferralAttachmentFactory()
+        self.client.force_login(attachment.referral.user)
+
+        response = self.client.get(f"/attachment-file/{attachment.id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Length"], "18")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["ETag"], f'"{attachment.id}-18"')
+        self.assertEqual(
+            response["Last-Modified"],
+            attachment.created_at.strftime("%a, %d %b %Y %H:%M:%S GMT"),
+        )
+
+    def test_authenticated_files_if_none_match(self):
+        """
+        Clients that already have the file get a 304, but only once they are authorized.
+        """
+        attachment = factories.ReferralAttachmentFactory()
+        etag = f'"{attachment.id}-18"'
+
+        self.client.force_login(factories.UserFactory())
+        response = self.client.get(
+            f"/attachment-file/{attachment.id}/", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_login(attachment.referral.user)
+        response = self.client.get(
+            f"/attachment-file/{attachment.id}/", HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.content, b"")
+
+        response = self.client.get(
+            f"/attachment-file/{attachment.id}/", HTTP_IF_NONE_MATCH='"other"'
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_authenticated_files_range(self):
+        """
+        Byte ranges of the file are served with a 206 response.
+        """
+        attachment = factories.ReferralAttachmentFactory()
+        self.client.force_login(attachment.referral.user)
+
+        for header, content, content_range in [
+            ("bytes=0-9", b"attachment", "bytes 0-9/18"),
+            ("bytes=11-", b"content", "bytes 11-17/18"),
+            ("bytes=11-100", b"content", "bytes 11-17/18"),
+            ("bytes=-7", b"content", "bytes 11-17/18"),
+            ("bytes=-100", b"attachment content", "bytes 0-17/18"),
+        ]:
+            response = self.client.get(
+                f"/attachment-file/{attachment.id}/", HTTP_RANGE=header
+            )
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(b"".join(response.streaming_content), content)
+            self.assertEqual(response["Content-Range"], content_range)
+            self.assertEqual(response["Content-Length"], str(len(content)))
+            self.assertEqual(response["ETag"], f'"{attachment.id}-18"')
+
+    def test_authenticated_files_range_not_applicable(self):
+        """
+        Unsatisfiable ranges get a 416, while unsupported ones and ranges on an outdated copy
+        get the whole file.
+        """
+        attachment = factories.ReferralAttachmentFactory()
+        self.client.force_login(attachment.referral.user)
+
+        for header in ["bytes=18-", "bytes=-0"]:
+            response = self.client.get(
+                f"/attachment-file/{attachment.id}/", HTTP_RANGE=header
+            )
+            self.assertEqual(response.status_code, 416)
+            self.assertEqual(response["Content-Range"], "bytes */18")
+
+        for header in ["bytes=0-1,4-5", "bytes=5-2", "lines=0-1"]:
+            response = self.client.get(
+                f"/attachment-file/{attachment.id}/", HTTP_RANGE=header
+            )
+            self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(
+            f"/attachment-file/{attachment.id}/",
+            HTTP_IF_RANGE='"other"',
+            HTTP_RANGE="bytes=0-9",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"attachment content")
+
+    @override_settings(
+        ATTACHMENT_FILES_SENDFILE_HEADER="X-Accel-Redirect",
+        ATTACHMENT_FILES_SENDFILE_ROOT="/internal/",
+    )
+    def test_authenticated_files_x_accel_redirect(self):
+        """
+        The front proxy can be asked to stream the file, with a URI to an internal location.
+        """
+        attachment = factories.ReferralAttachmentFactory(
+            file=ContentFile(b"attachment content", name="Décision finale.pdf")
+        )
+        self.client.force_login(attachment.referral.user)
+
+        response = self.client.get(f"/attachment-file/{attachment.id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(
+            response["X-Accel-Redirect"],
+            f"/internal/{attachment.id}/D%C3%A9cision_finale.pdf",
+        )
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertEqual(
+            response["Content-Disposition"],
+            "attachment; filename*=utf-8''D%C3%A9cision%20finale.pdf",
+        )
+
+    @override_settings(
+        ATTACHMENT_FILES_SENDFILE_HEADER="X-Sendfile",
+        ATTACHMENT_FILES_SENDFILE_ROOT="/var/partaj/media/",
+    )
+    def test_authenticated_files_x_sendfile(self):
+        """
+        The front proxy can be asked to stream the file from a path on its filesystem, but
+        only for authorized users.
+        """
+        attachment = factories.ReferralAttachmentFactory(
+            file=ContentFile(b"attachment content", name="notes.txt")
+        )
+
+        self.client.force_login(factories.UserFactory())
+        response = self.client.get(f"/attachment-file/{attachment.id}/")
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn("X-Sendfile", response)
+
+        self.client.force_login(attachment.referral.user)
+        response = self.client.get(f"/attachment-file/{attachment.id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response["X-Sendfile"], f"/var/partaj/media/{attachment.id}/notes.txt"
+        )
+        self.assertEqual(response["Content-Type"], "text/plain")
+        self.assertEqual(
+            response["Content-Disposition"], 'attachment; filename="notes.txt"'
+        )
+
+    @override_settings(ATTACHMENT_FILES_SIGNED_URL_EXPIRE=30)
+    def test_authenticated_files_signed_url(self):
+        """
+        Authorized users can be redirected to download the file from the object storage.
+        """
+        attachment = factories.ReferralAttachmentFactory(
+            file=ContentFile(b"attachment content", name="notes.txt")
+        )
+        storage = SecuredStorage()
+        self.client.force_login(attachment.referral.user)
+
+        with mock.patch.object(
+            models.ReferralAttachment._meta.get_field("file"), "storage", storage
+        ), mock.patch.object(
+            storage, "get_download_url", return_value="https://s3.example.com/signed"
+        ) as mock_get_download_url:
+            response = self.client.get(f"/attachment-file/{attachment.id}/")
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response["Location"], "https://s3.example.com/signed")
+        mock_get_download_url.assert_called_once_with(
+            attachment.file.name,
+            expire=30,
+            content_type="text/plain",
+            content_disposition='attachment; filename="notes.txt"',
+        )
+
+    @override_settings(ATTACHMENT_FILES_SIGNED_URL_EXPIRE=30)
+    def test_authenticated_files_signed_url_unsupported_storage(self):
+        """
+        Files are served by Django when the storage cannot sign URLs.
+        """
+        attachment = factories.ReferralAttachmentFactory()
+        self.client.force_login(attachment.referral.user)
+
+        response = self.client.get(f"/attachment-file/{attachment.id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"attachment content")
+
+    def test_models_get_attachment(self):
+        """
+        Attachments of any kind are resolved to the right model, with their data and the
+        ids needed for authorization.
+        """
+        attachment = factories.ReferralAttachmentFactory()
+        answer_attachment = factories.ReferralAnswerAttachmentFactory()
+
+        with self.assertNumQueries(1):
+            found = models.get_attachment(attachment.id)
+            self.assertIsInstance(found, models.ReferralAttachment)
+            self.assertEqual(
+                [found.id, found.name, found.size, found.file.name],
+                [attachment.id, attachment.name, attachment.size, attachment.file.name],
+            )
+            self.assertEqual(found.referral_user_id, attachment.referral.user_id)
+            self.assertEqual(found.referral_unit_id, attachment.referral.topic.unit_id)
+        # The owner of the attachment is loaded on demand
+        self.assertEqual(found.referral_id, attachment.referral_id)
+
+        with self.assertNumQueries(1):
+            found = models.get_attachment(answer_attachment.id)
+        self.assertIsInstance(found, models.ReferralAnswerAttachment)
+        self.assertEqual(found.id, answer_attachment.id)
+        self.assertEqual(found.referral_answer_id, answer_attachment.referral_answer_id)
+        referral = answer_attachment.referral_answer.referral
+        self.assertEqual(found.referral_user_id, referral.user_id)
+        self.assertEqual(found.referral_unit_id, referral.topic.unit_id)
+
+        self.assertIsNone(models.get_attachment(uuid.uuid4()))
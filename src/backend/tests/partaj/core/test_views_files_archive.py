@@ -0,0 +1,135 @@
+import io
+import os
+from unittest import mock
+import zipfile
+
+from django.core.files.base import ContentFile
+from django.test import TestCase
+
+from partaj.core import factories, models
+from partaj.core.storage import SecuredStorage
+
+
+class ReferralAttachmentsArchiveViewTestCase(TestCase):
+    """
+    Test the view that serves all the attachments of a referral as a ZIP archive.
+    """
+
+    def create_attachments(self):
+        """
+        Create a referral with attachments of both kinds, two of them with the same name.
+        """
+        referral = factories.ReferralFactory()
+        factories.ReferralAttachmentFactory(
+            file=ContentFile(b"the question", name="Question.pdf"), referral=referral
+        )
+        factories.ReferralAttachmentFactory(
+            file=ContentFile(b"some notes", name="notes.txt"), referral=referral
+        )
+        factories.ReferralAnswerAttachmentFactory(
+            file=ContentFile(b"answer notes", name="notes.txt"),
+            referral_answer__referral=referral,
+        )
+        return referral
+
+    def get_archive(self, response):
+        """
+        Open the ZIP archive streamed in a response.
+        """
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/zip")
+        return zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+
+    def test_referral_attachments_archive_anonymous_user(self):
+        """
+        Anonymous users are redirected to the login page.
+        """
+        referral = self.create_attachments()
+        response = self.client.get(f"/attachment-file/referral/{referral.id}/")
+        self.assertEqual(response.status_code, 302)
+
+    def test_referral_attachments_archive_unknown_referral(self):
+        """
+        A 404 is returned when no referral matches the id, or it has no attachments.
+        """
+        self.client.force_login(factories.UserFactory(is_staff=True))
+        response = self.client.get("/attachment-file/referral/42/")
+        self.assertEqual(response.status_code, 404)
+
+        referral = factories.ReferralFactory()
+        response = self.client.get(f"/attachment-file/referral/{referral.id}/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_referral_attachments_archive_random_user(self):
+        """
+        Users who are not linked to the referral cannot get its attachments.
+        """
+        referral = self.create_attachments()
+        self.client.force_login(factories.UserFactory())
+        response = self.client.get(f"/attachment-file/referral/{referral.id}/")
+        self.assertEqual(response.status_code, 403)
+
+    def test_referral_attachments_archive(self):
+        """
+        The requester, members of the unit and staff get all the attachments of the referral
+        and its answers, with unique names.
+        """
+        referral = self.create_attachments()
+        member = factories.UnitMembershipFactory(unit=referral.topic.unit).user
+        for user in [referral.user, member, factories.UserFactory(is_staff=True)]:
+            self.client.force_login(user)
+            response = self.client.get(f"/attachment-file/referral/{referral.id}/")
+            self.assertEqual(
+                response["Content-Disposition"],
+                f'attachment; filename="referral_{referral.id}_attachments.zip"',
+            )
+
+            archive = self.get_archive(response)
+            self.assertEqual(
+                archive.namelist(), ["Question.pdf", "notes.txt", "notes (2).txt"]
+            )
+            self.assertEqual(archive.read("Question.pdf"), b"the question")
+            self.assertEqual(archive.read("notes.txt"), b"some notes")
+            self.assertEqual(archive.read("notes (2).txt"), b"answer notes")
+            self.assertIsNone(archive.testzip())
+
+    def test_referral_attachments_archive_streamed(self):
+        """
+        Files are read one block at a time and the archive is sent as it is built.
+        """
+        referral = factories.ReferralFactory()
+        # Random contents cannot be compressed much, so each block makes its way to the output
+        content = os.urandom(256 * 1024)
+        factories.ReferralAttachmentFactory(
+            file=ContentFile(content, name="large.bin"), referral=referral
+        )
+        self.client.force_login(referral.user)
+
+        response = self.client.get(f"/attachment-file/referral/{referral.id}/")
+        chunks = list(response.streaming_content)
+
+        self.assertGreater(len(chunks), 10)
+        self.assertLess(max(len(chunk) for chunk in chunks), 64 * 1024)
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+        self.assertEqual(archive.read("large.bin"), content)
+
+    def test_referral_attachments_archive_object_storage(self):
+        """
+        Files are streamed from object storages rather than downloaded first.
+        """
+        referral = factories.ReferralFactory()
+        attachment = factories.ReferralAttachmentFactory(referral=referral)
+        self.client.force_login(referral.user)
+
+        with mock.patch.object(
+            models.ReferralAttachment.file.field, "storage", SecuredStorage()
+        ), mock.patch.object(
+            SecuredStorage, "open_stream", return_value=io.BytesIO(b"streamed content"),
+        ) as mock_open_stream:
+            response = self.client.get(f"/attachment-file/referral/{referral.id}/")
+            archive = self.get_archive(response)
+
+        mock_open_stream.assert_called_once_with(attachment.file.name)
+        self.assertEqual(
+            archive.read(attachment.get_name_with_extension()), b"streamed content"
+        )
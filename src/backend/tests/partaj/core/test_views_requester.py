@@ -0,0 +1,73 @@
+from django.test import TestCase
+
+from rest_framework.authtoken.models import Token
+
+from partaj.core import factories, models
+
+
+class RequesterReferralListViewTestCase(TestCase):
+    """
+    Test the view that lists the referrals of a requester.
+    """
+
+    def create_referrals(self, user, count):
+        """
+        Create referrals for a requester, each with a few assignees.
+        """
+        for _ in range(count):
+            referral = factories.ReferralFactory(
+                state=models.ReferralState.ASSIGNED, user=user
+            )
+            for _ in range(2):
+                factories.ReferralAssignmentFactory(
+                    referral=referral, unit=referral.topic.unit
+                )
+
+    def test_requester_referral_list_constant_queries(self):
+        """
+        The number of queries does not depend on the number of referrals of the requester.
+        """
+        user = factories.UserFactory()
+        self.client.force_login(user)
+        self.create_referrals(user, 2)
+        # Referrals from other users are not listed
+        self.create_referrals(factories.UserFactory(), 1)
+
+        with self.assertNumQueries(6):
+            response = self.client.get("/requester/referral-list/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["referrals"]), 2)
+
+        self.create_referrals(user, 10)
+        with self.assertNumQueries(6):
+            response = self.client.get("/requester/referral-list/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["referrals"]), 12)
+
+        referral = response.context["referrals"][0]
+        self.assertEqual(referral.assignee_count, 2)
+        for assignee in referral.assignees.all():
+            self.assertContains(response, assignee.get_full_name())
+
+
+class RequesterFrontendContextTestCase(TestCase):
+    """
+    Test the context passed to the frontend app on requester pages.
+    """
+
+    def test_requester_frontend_context_only_on_frontend_pages(self):
+        """
+        Only pages that mount the frontend app build its context, with the API token of
+        the user.
+        """
+        user = factories.UserFactory()
+        self.client.force_login(user)
+
+        response = self.client.get("/requester/referral-list/")
+        self.assertNotContains(response, "__partaj_frontend_context__")
+        self.assertFalse(Token.objects.filter(user=user).exists())
+
+        response = self.client.get("/requester/referral-create/")
+        token = Token.objects.get(user=user)
+        self.assertContains(response, "__partaj_frontend_context__")
+        self.assertContains(response, f'"token": "{token.key}"')
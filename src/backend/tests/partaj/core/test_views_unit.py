@@ -0,0 +1,188 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from partaj.core import factories, models
+
+
+class UnitInboxViewTestCase(TestCase):
+    """
+    Test the view that lists the referrals received by a unit.
+    """
+
+    def create_referrals(self, unit, count):
+        """
+        Create referrals for a unit, each with a few assignees.
+        """
+        topic = factories.TopicFactory(unit=unit)
+        for _ in range(count):
+            referral = factories.ReferralFactory(
+                state=models.ReferralState.ASSIGNED, topic=topic
+            )
+            for _ in range(2):
+                factories.ReferralAssignmentFactory(
+                    assignee=factories.UnitMembershipFactory(unit=unit).user,
+                    referral=referral,
+                    unit=unit,
+                )
+
+    def test_unit_inbox_anonymous_or_random_user(self):
+        """
+        Only members of the unit can see its inbox.
+        """
+        unit = factories.UnitFactory()
+        response = self.client.get(f"/unit/{unit.id}/inbox/")
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(factories.UserFactory())
+        response = self.client.get(f"/unit/{unit.id}/inbox/")
+        self.assertEqual(response.status_code, 403)
+
+    def test_unit_inbox_constant_queries(self):
+        """
+        The number of queries does not depend on the number of referrals in the inbox.
+        """
+        unit = factories.UnitFactory()
+        user = factories.UnitMembershipFactory(unit=unit).user
+        self.client.force_login(user)
+        self.create_referrals(unit, 2)
+        # Referrals from other units are not listed
+        self.create_referrals(factories.UnitFactory(), 1)
+
+        # Including the topics, members and urgencies of the filters
+        with self.assertNumQueries(10):
+            response = self.client.get(f"/unit/{unit.id}/inbox/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["referrals"]), 2)
+
+        # The navigation of the user did not change and is read from the cache
+        self.create_referrals(unit, 10)
+        with self.assertNumQueries(9):
+            response = self.client.get(f"/unit/{unit.id}/inbox/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["referrals"]), 12)
+
+        referral = response.context["referrals"][0]
+        self.assertEqual(referral.assignee_count, 2)
+        for assignee in referral.assignees.all():
+            self.assertContains(response, assignee.get_full_name())
+
+    def test_unit_inbox_and_archives_states(self):
+        """
+        The inbox lists the referrals the unit still has to handle, the archives those it is
+        done with, and both can show a single state.
+        """
+        unit = factories.UnitFactory()
+        self.client.force_login(factories.UnitMembershipFactory(unit=unit).user)
+        topic = factories.TopicFactory(unit=unit)
+        referrals = {
+            state: factories.ReferralFactory(state=state, topic=topic)
+            for state in models.ReferralState.values
+        }
+
+        response = self.client.get(f"/unit/{unit.id}/inbox/")
+        self.assertEqual(
+            {referral.state for referral in response.context["referrals"]},
+            {"received", "assigned", "incomplete"},
+        )
+        self.assertContains(
+            response,
+            f'<a class="nav-pill mr-3 " href="/unit/{unit.id}/inbox/?state=assigned">',
+        )
+
+        response = self.client.get(f"/unit/{unit.id}/inbox/?state=assigned")
+        self.assertEqual(
+            list(response.context["referrals"]), [referrals["assigned"]],
+        )
+
+        response = self.client.get(f"/unit/{unit.id}/archives/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {referral.state for referral in response.context["referrals"]},
+            {"answered", "closed"},
+        )
+        self.assertContains(response, f'href="/unit/{unit.id}/archives/"')
+
+        # States from the other list are ignored
+        response = self.client.get(f"/unit/{unit.id}/archives/?state=received")
+        self.assertEqual(len(response.context["referrals"]), 2)
+
+    def test_unit_inbox_filters(self):
+        """
+        Referrals can be filtered by topic, assignee and urgency, invalid values are ignored.
+        """
+        unit = factories.UnitFactory()
+        user = factories.UnitMembershipFactory(unit=unit).user
+        self.client.force_login(user)
+        topics = factories.TopicFactory.create_batch(2, unit=unit)
+        urgencies = factories.ReferralUrgencyFactory.create_batch(2)
+        referrals = [
+            factories.ReferralFactory(topic=topics[i], urgency_level=urgencies[i])
+            for i in range(2)
+        ]
+        for assignee in [user, factories.UnitMembershipFactory(unit=unit).user]:
+            factories.ReferralAssignmentFactory(
+                assignee=assignee, referral=referrals[0], unit=unit
+            )
+
+        for query, expected in [
+            (f"topic={topics[1].id}", [referrals[1]]),
+            (f"assignee={user.id}", [referrals[0]]),
+            (f"urgency={urgencies[0].id}", [referrals[0]]),
+            (f"topic={topics[1].id}&urgency={urgencies[0].id}", []),
+            (f"topic={factories.TopicFactory().id}", [referrals[1], referrals[0]]),
+            ("assignee=not-a-user&urgency=", [referrals[1], referrals[0]]),
+        ]:
+            response = self.client.get(f"/unit/{unit.id}/inbox/?{query}")
+            self.assertEqual(list(response.context["referrals"]), expected, query)
+
+        # Assignee filters do not affect the count of assignees
+        response = self.client.get(f"/unit/{unit.id}/inbox/?assignee={user.id}")
+        self.assertEqual(response.context["referrals"][0].assignee_count, 2)
+
+    def test_unit_inbox_pagination(self):
+        """
+        Referrals are paginated from the most recent one, each page starting after the last
+        referral of the previous one, keeping the filters.
+        """
+        unit = factories.UnitFactory()
+        self.client.force_login(factories.UnitMembershipFactory(unit=unit).user)
+        topic = factories.TopicFactory(unit=unit)
+        referrals = factories.ReferralFactory.create_batch(5, topic=topic)
+        # Referrals created at the same time are ordered by id
+        models.Referral.objects.filter(id__in=[r.id for r in referrals[1:3]]).update(
+            created_at=referrals[1].created_at
+        )
+        expected = sorted(
+            models.Referral.objects.all(), key=lambda r: (r.created_at, r.id)
+        )[::-1]
+
+        pages = []
+        url = f"/unit/{unit.id}/inbox/?topic={topic.id}"
+        with mock.patch("partaj.core.views.unit.UnitInboxView.page_size", 2):
+            while url:
+                response = self.client.get(url)
+                pages.append(list(response.context["referrals"]))
+                # The template only builds the link if it renders the list
+                url = response.context["next_page_url"]()
+                if url:
+                    self.assertIn(f"topic={topic.id}", url)
+                    self.assertIn("cursor=", url)
+
+        self.assertEqual(pages, [expected[0:2], expected[2:4], expected[4:5]])
+        self.assertEqual(
+            response.context["first_page_url"],
+            f"/unit/{unit.id}/inbox/?topic={topic.id}",
+        )
+
+        # Invalid cursors lead to the first page
+        for cursor in [
+            "invalid",
+            "99999999999999999999999-1",
+            "1-99999999999999999999999",
+            "-1-1",
+        ]:
+            response = self.client.get(f"/unit/{unit.id}/inbox/?cursor={cursor}")
+            self.assertEqual(response.status_code, 200, cursor)
+            self.assertEqual(len(response.context["referrals"]), 5, cursor)
+            self.assertNotIn("first_page_url", response.context)
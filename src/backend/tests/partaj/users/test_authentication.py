@@ -0,0 +1,133 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from rest_framework.authtoken.models import Token
+
+from partaj.core import factories
+from partaj.users import authentication
+from partaj.users.authentication import TokenCache, token_cache
+
+
+class CachedTokenAuthenticationTestCase(TestCase):
+    """
+    Test the token authentication that keeps tokens and their users in memory.
+    """
+
+    def setUp(self):
+        token_cache.clear()
+
+    def whoami(self, token):
+        """
+        Call a cheap API endpoint with a token or its key.
+        """
+        return self.client.get(
+            "/api/users/whoami/", HTTP_AUTHORIZATION=f"Token {token}"
+        )
+
+    def test_authentication_cached(self):
+        """
+        Tokens are read from the database once, then from the cache with a fresh user
+        instance for each request.
+        """
+        user = factories.UserFactory(first_name="Jane")
+        token = Token.objects.create(user=user)
+
+        with self.assertNumQueries(1):
+            response = self.whoami(token)
+        self.assertEqual(response.json()["first_name"], "Jane")
+
+        with self.assertNumQueries(0):
+            response = self.whoami(token)
+        self.assertEqual(response.json()["id"], str(user.id))
+
+        cached_user, cached_token = token_cache.get(token.key)
+        self.assertEqual(cached_user, user)
+        self.assertEqual(cached_token.user_id, user.id)
+        self.assertIsNot(token_cache.get(token.key)[0], cached_user)
+
+    def test_authentication_invalidated(self):
+        """
+        Deleted tokens and deactivated users are rejected right away, and user changes are
+        visible.
+        """
+        user = factories.UserFactory(first_name="Jane")
+        token = Token.objects.create(user=user)
+        self.whoami(token)
+
+        user.first_name = "Joan"
+        user.save()
+        self.assertEqual(self.whoami(token).json()["first_name"], "Joan")
+
+        user.is_active = False
+        user.save()
+        self.assertEqual(self.whoami(token).status_code, 401)
+
+        user.is_active = True
+        user.save()
+        key = token.key
+        self.whoami(key)
+        token.delete()
+        self.assertEqual(self.whoami(key).status_code, 401)
+
+    def test_authentication_invalidated_in_other_processes(self):
+        """
+        Deactivated users and rotated tokens are rejected right away by other processes, which
+        check the version of their copy in the shared cache.
+        """
+        user = factories.UserFactory()
+        token = Token.objects.create(user=user)
+        # Another process has its own token cache in memory
+        other_process_cache = TokenCache()
+        with mock.patch.object(authentication, "token_cache", other_process_cache):
+            self.whoami(token)
+        self.assertIsNotNone(other_process_cache.get(token.key))
+
+        # Changes in this process only drop its own copies from memory
+        user.is_active = False
+        user.save()
+        with mock.patch.object(authentication, "token_cache", other_process_cache):
+            with self.assertNumQueries(1):
+                self.assertEqual(self.whoami(token).status_code, 401)
+
+        user.is_active = True
+        user.save()
+        with mock.patch.object(authentication, "token_cache", other_process_cache):
+            self.assertEqual(self.whoami(token).status_code, 200)
+        key = token.key
+        token.delete()
+        Token.objects.create(user=user)
+        with mock.patch.object(authentication, "token_cache", other_process_cache):
+            self.assertEqual(self.whoami(key).status_code, 401)
+        self.assertIsNone(other_process_cache.get(key))
+
+    @override_settings(API_TOKEN_CACHE_MAX_SIZE=2, API_TOKEN_CACHE_TIMEOUT=60)
+    def test_authentication_bounded_and_expiring(self):
+        """
+        The least recently used tokens are evicted beyond the maximum size, and tokens
+        expire after the timeout.
+        """
+        tokens = [Token.objects.create(user=factories.UserFactory()) for _ in range(3)]
+        for token in tokens[:2]:
+            self.whoami(token)
+        # Use the first token again so the second one is the least recently used
+        self.whoami(tokens[0])
+        self.whoami(tokens[2])
+
+        self.assertIsNotNone(token_cache.get(tokens[0].key))
+        self.assertIsNone(token_cache.get(tokens[1].key))
+        self.assertIsNotNone(token_cache.get(tokens[2].key))
+
+        with mock.patch("time.monotonic", return_value=10 ** 9):
+            with self.assertNumQueries(1):
+                self.whoami(tokens[0])
+
+    @override_settings(API_TOKEN_CACHE_TIMEOUT=0)
+    def test_authentication_cache_disabled(self):
+        """
+        Tokens are always read from the database when the cache is disabled.
+        """
+        token = Token.objects.create(user=factories.UserFactory())
+        self.whoami(token)
+        with self.assertNumQueries(1):
+            self.whoami(token)
@@ -0,0 +1,50 @@
+import { render, screen } from '@testing-library/react';
+import filesize from 'filesize';
+import React from 'react';
+import { IntlProvider } from 'react-intl';
+
+import { AttachmentPreviewState } from 'types';
+import { ReferralAttachmentFactory } from 'utils/test/factories';
+import { AttachmentsList } from './AttachmentsList';
+
+describe('<AttachmentsList />', () => {
+  const size = filesize.partial({ locale: 'en-US' });
+
+  it('shows the previews and page counts of attachments once they are ready', () => {
+    const [ready, pending] = ReferralAttachmentFactory.generate(2);
+    ready.excerpt = 'The first words of the document';
+    ready.page_count = 12;
+    ready.preview = 'https://example.com/attachment-file/42/preview/';
+    ready.preview_state = AttachmentPreviewState.READY;
+
+    const { container } = render(
+      <IntlProvider locale="en">
+        <div id="attachments-label">Attachments</div>
+        <AttachmentsList
+          attachments={[ready, pending]}
+          labelId="attachments-label"
+        />
+      </IntlProvider>,
+    );
+
+    screen.getByRole('group', { name: 'Attachments' });
+    const readyLink = screen.getByRole('link', {
+      name: `${ready.name_with_extension} — ${size(ready.size)} — 12 pages`,
+    });
+    expect(readyLink).toHaveAttribute('href', ready.file);
+    expect(readyLink).toHaveAttribute(
+      'title',
+      'The first words of the document',
+    );
+    screen.getByRole('link', {
+      name: `${pending.name_with_extension} — ${size(pending.size)}`,
+    });
+
+    const previews = container.querySelectorAll('img');
+    expect(previews.length).toEqual(1);
+    expect(previews[0]).toHaveAttribute(
+      'src',
+      'https://example.com/attachment-file/42/preview/',
+    );
+  });
+});
@@ -1,8 +1,17 @@
 import filesize from 'filesize';
 import React from 'react';
+import { defineMessages, FormattedMessage } from 'react-intl';
 
 import { Attachment } from 'types';
 
+const messages = defineMessages({
+  pageCount: {
+    defaultMessage: '{ pageCount, plural, one { # page } other { # pages } }',
+    description: 'Number of pages of an attachment in the attachments list.',
+    id: 'components.AttachmentsList.pageCount',
+  },
+});
+
 interface AttachmentsListProps {
   attachments: Attachment[];
   labelId: string;
@@ -22,9 +31,27 @@ export const AttachmentsList: React.FC<AttachmentsListProps> = ({
         className="file-list-item focus:bg-gray-200 hover:text-blue-600 focus:text-blue-600 hover:underline focus:underline"
         href={attachment.file}
         key={attachment.id}
+        title={attachment.excerpt || undefined}
       >
+        {attachment.preview ? (
+          <img
+            alt=""
+            className="inline-block w-12 mr-2 border border-gray-300"
+            loading="lazy"
+            src={attachment.preview}
+          />
+        ) : null}
         {attachment.name_with_extension}
         {attachment.size ? ` — ${size(attachment.size)}` : null}
+        {attachment.page_count ? (
+          <>
+            {' — '}
+            <FormattedMessage
+              {...messages.pageCount}
+              values={{ pageCount: attachment.page_count }}
+            />
+          </>
+        ) : null}
       </a>
     ))}
   </div>
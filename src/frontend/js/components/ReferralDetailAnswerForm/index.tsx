@@ -15,6 +15,7 @@ import { Referral } from 'types';
 import { ContextProps } from 'types/context';
 import { handle } from 'utils/errors';
 import { sendForm } from 'utils/sendForm';
+import { uploadFiles } from 'utils/uploadFiles';
 import { getUserFullname } from 'utils/user';
 
 const messages = defineMessages({
@@ -173,7 +174,10 @@ export const ReferralDetailAnswerForm = ({
             headers: { Authorization: `Token ${context.token}` },
             keyValuePairs: [
               ['content', JSON.stringify(answer.serializableState)],
-              ...files.map((file) => ['files', file] as [string, File]),
+              // Send files directly to the object storage when possible
+              ...(context.directUploads && files.length
+                ? await uploadFiles(context, files)
+                : files.map((file) => ['files', file] as [string, File])),
             ],
             setProgress: (progress) =>
               callback({ type: 'UPDATE_PROGRESS', progress }),
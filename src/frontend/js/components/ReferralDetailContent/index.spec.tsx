@@ -76,6 +76,9 @@ describe('<ReferralDetailContent />', () => {
         name: `${attachment.name_with_extension} — ${size(attachment.size)}`,
       });
     }
+    expect(
+      screen.getByRole('link', { name: 'Download all attachments' }),
+    ).toHaveAttribute('href', `/attachment-file/referral/${referral.id}/`);
 
     // Shows assignment information
     screen.getByText('No assignment yet');
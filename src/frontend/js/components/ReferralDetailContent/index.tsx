@@ -27,6 +27,12 @@ const messages = defineMessages({
     description: "Subtitle for the referral's context.",
     id: 'components.ReferralDetailContent.context',
   },
+  downloadAttachments: {
+    defaultMessage: 'Download all attachments',
+    description:
+      'Link to download the attachments of the referral and its answers as a ZIP archive.',
+    id: 'components.ReferralDetailContent.downloadAttachments',
+  },
   expectedResponseTime: {
     defaultMessage: 'Expected response time',
     description: "Subtitle for the referral's expected response time.",
@@ -156,6 +162,12 @@ export const ReferralDetailContent: React.FC<
             attachments={referral.attachments}
             labelId={seed('referral-attachments')}
           />
+          <a
+            className="inline-block mt-2 hover:text-blue-600 focus:text-blue-600 hover:underline focus:underline"
+            href={`/attachment-file/referral/${referral.id}/`}
+          >
+            <FormattedMessage {...messages.downloadAttachments} />
+          </a>
         </>
       ) : null}
 
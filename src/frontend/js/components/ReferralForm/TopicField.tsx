@@ -7,7 +7,7 @@ import { assign, Sender } from 'xstate';
 
 import { Spinner } from 'components/Spinner';
 import { fetchList } from 'data/fetchList';
-import { APIList, Topic } from 'types';
+import { APIList, TopicSummary } from 'types';
 import { ContextProps } from 'types/context';
 
 import { TextFieldMachine, UpdateEvent } from './machines';
@@ -66,7 +66,7 @@ export const TopicField: React.FC<TopicFieldProps & ContextProps> = ({
     });
   }, [state.value, state.context]);
 
-  const { status, data } = useQuery<APIList<Topic>, 'topics'>(
+  const { status, data } = useQuery<APIList<TopicSummary>, 'topics'>(
     'topics',
     fetchList(context),
   );
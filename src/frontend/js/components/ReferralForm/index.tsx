@@ -7,6 +7,7 @@ import { useCurrentUser } from 'data/useCurrentUser';
 import { Referral } from 'types';
 import { ContextProps } from 'types/context';
 import { sendForm } from 'utils/sendForm';
+import { uploadFiles } from 'utils/uploadFiles';
 import { getUserFullname } from 'utils/user';
 
 import { AttachmentsField } from './AttachmentsField';
@@ -90,10 +91,13 @@ export const ReferralForm: React.FC<ContextProps> = ({ context }) => {
                   ([key, content]) => [key, content.data] as [string, string],
                 ),
               ['urgency_level', String(fields.urgency_level.data.id)],
-              // Create a key-value pair with the same name each time for every file
-              ...fields.files.data.map(
-                (file) => ['files', file] as [string, File],
-              ),
+              // Create a key-value pair with the same name each time for every file, or
+              // send files directly to the object storage when possible
+              ...(context.directUploads && fields.files.data.length
+                ? await uploadFiles(context, fields.files.data)
+                : fields.files.data.map(
+                    (file) => ['files', file] as [string, File],
+                  )),
             ],
 
             setProgress: (progress) =>
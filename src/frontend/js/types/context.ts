@@ -4,6 +4,7 @@ export interface Context {
     icons: string;
   };
   csrftoken: string;
+  directUploads?: boolean;
   token: string;
 }
 
@@ -1,3 +1,5 @@
+import { Nullable } from 'types/utils';
+
 /**
  * MODEL TYPES
  */
@@ -28,11 +30,23 @@ export enum ReferralState {
   ANSWERED = 'answered',
 }
 
+export enum AttachmentPreviewState {
+  FAILED = 'failed',
+  PENDING = 'pending',
+  PROCESSING = 'processing',
+  READY = 'ready',
+  UNSUPPORTED = 'unsupported',
+}
+
 interface AttachmentBase {
   id: string;
   created_at: string;
+  excerpt: string;
   file: string;
   name: string;
+  page_count: Nullable<number>;
+  preview: Nullable<string>;
+  preview_state: AttachmentPreviewState;
   size: number;
 }
 
@@ -106,6 +120,12 @@ export interface Topic {
   unit: Unit;
 }
 
+export interface TopicSummary {
+  id: string;
+  name: string;
+  unit: Pick<Unit, 'id' | 'name'>;
+}
+
 export interface Unit {
   created_at: string;
   id: string;
@@ -1,6 +1,11 @@
 import { compose, createSpec, derived, faker } from '@helpscout/helix';
 
-import { ReferralState, UnitMembershipRole, ReferralActivityVerb } from 'types';
+import {
+  AttachmentPreviewState,
+  ReferralState,
+  UnitMembershipRole,
+  ReferralActivityVerb,
+} from 'types';
 
 export const UserFactory = createSpec({
   date_joined: derived(() => faker.date.past()().toISOString()),
@@ -67,9 +72,13 @@ export const ReferralActivityFactory = createSpec({
 export const ReferralAnswerAttachmentFactory = createSpec({
   id: faker.random.uuid(),
   created_at: derived(() => faker.date.past()().toISOString()),
+  excerpt: faker.lorem.sentence(),
   file: faker.internet.url(),
   name: faker.system.filePath(),
   name_with_extension: faker.system.fileName(),
+  page_count: null,
+  preview: null,
+  preview_state: derived(() => AttachmentPreviewState.PENDING),
   referral_answer: faker.random.uuid(),
   size: faker.random.number(),
 });
@@ -86,9 +95,13 @@ export const ReferralAnswerFactory = createSpec({
 export const ReferralAttachmentFactory = createSpec({
   id: faker.random.uuid(),
   created_at: derived(() => faker.date.past()().toISOString()),
+  excerpt: faker.lorem.sentence(),
   file: faker.internet.url(),
   name: faker.system.filePath(),
   name_with_extension: faker.system.fileName(),
+  page_count: null,
+  preview: null,
+  preview_state: derived(() => AttachmentPreviewState.PENDING),
   referral: faker.random.number(),
   size: faker.random.number(),
 });
@@ -0,0 +1,53 @@
+import { Context } from 'types/context';
+
+interface UploadTarget {
+  fields: { [key: string]: string };
+  upload: string;
+  url: string;
+}
+
+/*
+ * Upload files directly to the object storage, without going through our servers. Return the
+ * key-value pairs to send in place of the files in the referral or answer form.
+ */
+export const uploadFiles = async (
+  context: Context,
+  files: File[],
+): Promise<[string, string][]> => {
+  // Get a signed upload target for each file
+  const response = await fetch('/api/referrals/upload-targets/', {
+    body: JSON.stringify({ names: files.map((file) => file.name) }),
+    headers: {
+      Authorization: `Token ${context.token}`,
+      'Content-Type': 'application/json',
+    },
+    method: 'POST',
+  });
+  if (!response.ok) {
+    throw new Error(`Failed to get upload targets, ${response.status}.`);
+  }
+  const targets: UploadTarget[] = await response.json();
+
+  await Promise.all(
+    targets.map(async (target, index) => {
+      const formData = new FormData();
+      Object.entries(target.fields).forEach(([key, value]) =>
+        formData.append(key, value),
+      );
+      // The object storage expects the file to be the last field of the form
+      formData.append('file', files[index]);
+
+      const uploadResponse = await fetch(target.url, {
+        body: formData,
+        method: 'POST',
+      });
+      if (!uploadResponse.ok) {
+        throw new Error(
+          `Failed to upload ${files[index].name}, ${uploadResponse.status}.`,
+        );
+      }
+    }),
+  );
+
+  return targets.map((target) => ['uploads', target.upload]);
+};